@@ -1,9 +1,10 @@
 import os
 
-import redis
 import requests
 from django.conf import settings
 
+from config.metrics import InstrumentedRedis, count_sms
+
 from .sms_client_interface import SMSClientInterface
 
 
@@ -12,7 +13,7 @@ class EskizSmsClient(SMSClientInterface):
         self.base_url = "https://notify.eskiz.uz/api"
         self.email = os.getenv("ESKIZ_EMAIL")
         self.password = os.getenv("ESKIZ_PASSWORD")
-        self.redis_client = redis.StrictRedis(
+        self.redis_client = InstrumentedRedis(
             host=settings.REDIS_HOST,
             port=settings.REDIS_PORT,
             db=settings.REDIS_DB,
@@ -36,6 +37,7 @@ class EskizSmsClient(SMSClientInterface):
             )
             return None, error_message
 
+    @count_sms
     def send_sms(self, phone_number, message):
         token, error = self.authenticate()
         if error:
@@ -0,0 +1,56 @@
+from django.contrib.auth import get_user_model
+from rest_framework.views import APIView
+
+from config.benchmarks import benchmark, build_view
+
+from .authentication_backends import PhoneNumberBackend
+from .permissions import HasOwnerRole, IsAdmin, IsOwnerRoleOrReadOnly
+
+User = get_user_model()
+
+PASSWORD = "benchmark"
+
+
+@benchmark("accounts.PhoneNumberBackend.authenticate")
+def authenticate():
+    """
+    A successful login, dominated by the password hasher.
+    """
+    user = User.objects.order_by("id").first()
+    user.set_password(PASSWORD)
+    user.save(update_fields=["password"])
+    backend = PhoneNumberBackend()
+    return lambda: backend.authenticate(
+        None, phone_number=user.phone_number, password=PASSWORD
+    )
+
+
+@benchmark("accounts.PhoneNumberBackend.authenticate_unknown")
+def authenticate_unknown():
+    backend = PhoneNumberBackend()
+    return lambda: backend.authenticate(
+        None, phone_number="+998000000000", password=PASSWORD
+    )
+
+
+@benchmark("accounts.permissions")
+def permissions():
+    """
+    Every role checking every permission class, for a read and a write.
+    """
+    checks = []
+    for role in (User.ROLE_USER, User.ROLE_OWNER):
+        user = User.objects.filter(role=role).order_by("id").first()
+        for method in ("get", "post"):
+            request = build_view(APIView, "/", user=user, method=method).request
+            request.user  # Authenticate outside the timed part.
+            checks.extend(
+                (permission(), request)
+                for permission in (IsAdmin, HasOwnerRole, IsOwnerRoleOrReadOnly)
+            )
+
+    def run():
+        for permission, request in checks:
+            permission.has_permission(request, None)
+
+    return run
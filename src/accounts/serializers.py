@@ -1,6 +1,5 @@
 import json
 
-import redis
 from django.conf import settings
 from django.contrib.auth import authenticate, get_user_model
 from django.contrib.auth.hashers import make_password
@@ -8,13 +7,15 @@ from django.contrib.auth.password_validation import validate_password
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
+from config.metrics import InstrumentedRedis
+
 # from config.utils import get_sms_client
 
 # import random
 
 
 User = get_user_model()
-redis_instance = redis.StrictRedis(
+redis_instance = InstrumentedRedis(
     host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0
 )
 
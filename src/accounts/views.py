@@ -1,6 +1,5 @@
 import json
 
-import redis
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from drf_yasg import openapi
@@ -11,6 +10,8 @@ from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 
+from config.metrics import InstrumentedRedis
+
 from .serializers import (
     CustomTokenObtainPairSerializer,
     UserDetailSerializer,
@@ -18,7 +19,7 @@ from .serializers import (
 )
 
 User = get_user_model()
-redis_instance = redis.StrictRedis(
+redis_instance = InstrumentedRedis(
     host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0
 )
 
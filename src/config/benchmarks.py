@@ -0,0 +1,125 @@
+import json
+import platform
+import statistics
+import time
+from dataclasses import dataclass
+
+import django
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+registry = {}
+
+
+@dataclass
+class Benchmark:
+    name: str
+    setup: object
+    sized: bool
+
+
+def benchmark(name, sized=False):
+    """
+    Register a micro-benchmark. ``setup`` prepares everything that should
+    not be timed and returns the callable to time. Sized benchmarks take the
+    number of rows to work on and run once per size.
+
+    Benchmarks live in a ``benchmarks`` module of each app, collected by the
+    run_benchmarks command.
+    """
+
+    def decorator(setup):
+        registry[name] = Benchmark(name, setup, sized)
+        return setup
+
+    return decorator
+
+
+def build_view(view_class, path, params=None, user=None, method="get", **kwargs):
+    """
+    A DRF view instance set up for a request, as ``as_view()`` would, so
+    its queryset and permission code can be timed without the dispatch.
+    """
+    request = getattr(APIRequestFactory(), method)(path, params or {})
+    if user is not None:
+        force_authenticate(request, user=user)
+    view = view_class()
+    view.setup(request, **kwargs)
+    view.format_kwarg = None
+    view.request = view.initialize_request(request, **kwargs)
+    return view
+
+
+def measure(func, rounds=7, min_time=0.05):
+    """
+    Per-call times of ``func`` in milliseconds, one per round. Each round
+    calls it often enough to last ``min_time`` seconds.
+    """
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or number >= 1000000:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    timings = [elapsed / number * 1000]
+    for _ in range(rounds - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - started) / number * 1000)
+    return timings
+
+
+def summarize(timings):
+    return {
+        "median_ms": statistics.median(timings),
+        "min_ms": min(timings),
+        "rounds": len(timings),
+    }
+
+
+def save_baseline(path, results):
+    with open(path, "w") as file:
+        json.dump(
+            {
+                "created": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "results": results,
+            },
+            file,
+            indent=2,
+            sort_keys=True,
+        )
+
+
+def load_baseline(path):
+    with open(path) as file:
+        return json.load(file)["results"]
+
+
+def compare(results, baseline, threshold):
+    """
+    ``[(name, median, baseline median, change in percent, status)]``, where
+    status is "regression" or "improvement" when the median moved by more
+    than ``threshold`` percent, "ok" otherwise and "new" without a baseline.
+    """
+    rows = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            rows.append((name, result["median_ms"], None, None, "new"))
+            continue
+        change = (result["median_ms"] / before["median_ms"] - 1) * 100
+        if change > threshold:
+            status = "regression"
+        elif change < -threshold:
+            status = "improvement"
+        else:
+            status = "ok"
+        rows.append((name, result["median_ms"], before["median_ms"], change, status))
+    return rows
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+
+class HTTPClient:
+    """
+    A minimal HTTP/1.1 client over one keep-alive connection, enough to drive
+    the API from many coroutines without third-party dependencies.
+    """
+
+    def __init__(self, base_url):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None, headers=None):
+        """
+        Send a request and return ``(status, parsed JSON or None)``. A
+        connection the server closed in between is reopened once.
+        """
+        for attempt in range(2):
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection(
+                    self.host, self.port
+                )
+            try:
+                return await self.send(method, path, body, headers or {})
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self.close()
+                if attempt:
+                    raise
+
+    async def send(self, method, path, body, headers):
+        payload = b"" if body is None else json.dumps(body).encode()
+        lines = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: {self.host}:{self.port}",
+            f"Content-Length: {len(payload)}",
+            "Accept: application/json",
+        ]
+        if body is not None:
+            lines.append("Content-Type: application/json")
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        self.writer.write("\r\n".join(lines).encode() + b"\r\n\r\n" + payload)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by the server")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get("transfer-encoding") == "chunked":
+            content = await self.read_chunked()
+        elif "content-length" in response_headers:
+            length = int(response_headers["content-length"])
+            content = await self.reader.readexactly(length)
+        else:
+            content = await self.reader.read()
+            response_headers["connection"] = "close"
+        if response_headers.get("connection", "").lower() == "close":
+            await self.close()
+
+        try:
+            return status, json.loads(content) if content else None
+        except ValueError:
+            return status, None
+
+    async def read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b";")[0], 16)
+            if not size:
+                await self.reader.readline()
+                return b"".join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readline()
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of sorted ``values``.
+    """
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, round(fraction * len(values)) - 1))
+    return values[index]
+
+
+class LoadStats:
+    """
+    Latencies and failures per endpoint name.
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.failures = Counter()
+
+    def record(self, name, seconds, ok):
+        self.latencies[name].append(seconds * 1000)
+        if not ok:
+            self.failures[name] += 1
+
+    def summary(self, elapsed):
+        rows = []
+        for name in sorted(self.latencies):
+            timings = sorted(self.latencies[name])
+            rows.append(
+                {
+                    "name": name,
+                    "requests": len(timings),
+                    "failures": self.failures[name],
+                    "throughput": len(timings) / elapsed,
+                    "p50": percentile(timings, 0.5),
+                    "p95": percentile(timings, 0.95),
+                    "p99": percentile(timings, 0.99),
+                }
+            )
+        return rows
+
+
+class VirtualUser:
+    """
+    One simulated client with its own connection. Subclasses implement
+    ``on_start`` and ``tasks``, a list of ``(weight, coroutine function)``.
+    """
+
+    tasks = []
+
+    def __init__(self, base_url, stats, rng):
+        self.client = HTTPClient(base_url)
+        self.stats = stats
+        self.rng = rng
+        self.headers = {}
+
+    async def call(self, name, method, path, body=None, expect=(200,)):
+        started = time.perf_counter()
+        try:
+            status, data = await self.client.request(method, path, body, self.headers)
+        except (OSError, asyncio.IncompleteReadError):
+            status, data = None, None
+        self.stats.record(name, time.perf_counter() - started, status in expect)
+        return status, data
+
+    async def on_start(self):
+        pass
+
+    async def run(self, deadline):
+        loop = asyncio.get_running_loop()
+        weights = [weight for weight, _ in self.tasks]
+        try:
+            await self.on_start()
+            while loop.time() < deadline:
+                _, task = self.rng.choices(self.tasks, weights=weights)[0]
+                await task(self)
+        finally:
+            await self.client.close()
+
+
+async def run_load_test(user_factory, users, duration):
+    """
+    Run ``users`` virtual users for ``duration`` seconds, and return the
+    elapsed time.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + duration
+    await asyncio.gather(*(user_factory(index).run(deadline) for index in range(users)))
+    return loop.time() - started
@@ -0,0 +1,211 @@
+"""
+Prometheus metrics of the API processes.
+
+Under gunicorn every worker is a separate process, so the metrics are
+written to files in ``PROMETHEUS_MULTIPROC_DIR`` (see gunicorn.conf.py) and
+merged by the ``/metrics`` view. Without that variable, as under runserver,
+the process' own registry is served.
+"""
+
+import functools
+import ipaddress
+import os
+import secrets
+import time
+from contextlib import ExitStack, contextmanager
+
+import redis
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling a request, by URL name.",
+    ["view", "method", "status"],
+)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Database queries run while handling a request.",
+    ["view"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+REQUEST_DB_DURATION = Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent in database queries while handling a request.",
+    ["view"],
+)
+REDIS_COMMAND_LATENCY = Histogram(
+    "redis_command_duration_seconds",
+    "Round trip of a Redis command, or of a whole pipeline.",
+    ["command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+REDIS_COMMAND_ERRORS = Counter(
+    "redis_command_errors_total", "Redis commands that raised an error.", ["command"]
+)
+SMS_SENT = Counter("sms_sent_total", "SMS send attempts by outcome.", ["outcome"])
+
+
+@contextmanager
+def wrap_queries(wrapper):
+    """
+    ``execute_wrapper`` on every database, replicas included.
+    """
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(wrapper))
+        yield
+
+
+class QueryTimer:
+    """
+    ``connection.execute_wrapper`` counting queries and their total time.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """
+    Record latency, query count and query time of every request, labelled
+    with the name of the URL pattern that handled it, e.g. ``product-list``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with wrap_queries(timer):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        view = self.get_view_name(request)
+        REQUEST_LATENCY.labels(view, request.method, response.status_code).observe(
+            duration
+        )
+        REQUEST_DB_QUERIES.labels(view).observe(timer.count)
+        REQUEST_DB_DURATION.labels(view).observe(timer.duration)
+        return response
+
+    def get_view_name(self, request):
+        match = getattr(request, "resolver_match", None)
+        if match is None:
+            # Keeps scanners hitting random paths from adding label values.
+            return "unmatched"
+        return match.view_name
+
+
+@contextmanager
+def observe_redis(command):
+    started = time.perf_counter()
+    try:
+        yield
+    except redis.RedisError:
+        REDIS_COMMAND_ERRORS.labels(command).inc()
+        raise
+    finally:
+        REDIS_COMMAND_LATENCY.labels(command).observe(time.perf_counter() - started)
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        with observe_redis("PIPELINE"):
+            return super().execute(raise_on_error)
+
+
+class InstrumentedRedis(redis.StrictRedis):
+    """
+    Redis client recording the latency of every command it sends.
+    """
+
+    def execute_command(self, *args, **options):
+        with observe_redis(str(args[0]).upper()):
+            return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+def count_sms(send_sms):
+    """
+    Count the outcomes of an SMS client's ``send_sms``, which returns
+    ``(success, message)``.
+    """
+
+    @functools.wraps(send_sms)
+    def wrapper(*args, **kwargs):
+        try:
+            success, message = send_sms(*args, **kwargs)
+        except Exception:
+            SMS_SENT.labels("error").inc()
+            raise
+        SMS_SENT.labels("sent" if success else "failed").inc()
+        return success, message
+
+    return wrapper
+
+
+def get_registry():
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def may_read_metrics(request):
+    """
+    Whether the request carries the metrics token, or comes straight from
+    an allowed network rather than through the proxy.
+    """
+    token = settings.METRICS_TOKEN
+    header = request.META.get("HTTP_AUTHORIZATION", "")
+    if token and secrets.compare_digest(header, f"Bearer {token}"):
+        return True
+    if "HTTP_X_FORWARDED_FOR" in request.META:
+        return False
+    try:
+        address = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network)
+        for network in settings.METRICS_ALLOWED_NETWORKS
+    )
+
+
+def metrics_view(request):
+    """
+    Metrics in the Prometheus text format. Meant to be scraped from inside
+    the network: nginx does not proxy this path, and the view only answers
+    ``may_read_metrics()`` requests in case it is reached some other way.
+    """
+    if not may_read_metrics(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST
+    )
@@ -0,0 +1,341 @@
+"""
+On-demand profiling of live requests.
+
+``ProfilingMiddleware`` profiles requests that carry a valid
+``X-Profile-Token`` header, and a random ``PROFILING_SAMPLE_RATE`` share of
+all others. Each profile is written to ``PROFILING_DIR`` with the SQL the
+request ran, and listed and downloaded through the staff-only ``/profiles/``
+endpoints. Query parameters hold customers' data, so they are only kept for
+requests profiled on purpose with a token.
+"""
+
+import cProfile
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.http import FileResponse, Http404
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.views import APIView
+
+from config.metrics import wrap_queries
+
+TOKEN_HEADER = "HTTP_X_PROFILE_TOKEN"
+TOKEN_SALT = "config.profiling"
+TOKEN_MAX_AGE = 60 * 60
+PROFILE_ID = re.compile(r"\d{8}T\d{6}-[0-9a-f]{8}")
+PROFILE_SUFFIXES = {"sampling": ".speedscope.json", "cprofile": ".pstats"}
+
+
+def make_token():
+    return signing.dumps("profile", salt=TOKEN_SALT)
+
+
+def has_valid_token(request):
+    token = request.META.get(TOKEN_HEADER)
+    if not token:
+        return False
+    try:
+        signing.loads(token, salt=TOKEN_SALT, max_age=TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread from a background thread every
+    ``interval`` seconds, and exports the samples in the speedscope format.
+    The profiled thread pays nothing but the GIL hand-offs.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.frames = []
+        self.frame_ids = {}
+        self.samples = []
+        self.weights = []
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.sampler.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.sampler.join()
+        self.duration = time.perf_counter() - self.started
+
+    def frame_id(self, frame):
+        code = frame.f_code
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        if key not in self.frame_ids:
+            self.frame_ids[key] = len(self.frames)
+            self.frames.append({"name": key[0], "file": key[1], "line": key[2]})
+        return self.frame_ids[key]
+
+    def sample(self):
+        last = self.started
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            stack = []
+            while frame is not None:
+                stack.append(self.frame_id(frame))
+                frame = frame.f_back
+            # speedscope wants the root first.
+            self.samples.append(stack[::-1])
+            self.weights.append(now - last)
+            last = now
+
+    def save(self, path, name):
+        with open(path, "w") as file:
+            json.dump(
+                {
+                    "$schema": "https://www.speedscope.app/file-format-schema.json",
+                    "name": name,
+                    "exporter": "espresso",
+                    "shared": {"frames": self.frames},
+                    "profiles": [
+                        {
+                            "type": "sampled",
+                            "name": name,
+                            "unit": "seconds",
+                            "startValue": 0,
+                            "endValue": self.duration,
+                            "samples": self.samples,
+                            "weights": self.weights,
+                        }
+                    ],
+                },
+                file,
+            )
+
+
+class CProfileProfiler:
+    """
+    Deterministic profile of every call, saved for ``pstats``. More detail
+    than sampling at a much higher overhead.
+    """
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def save(self, path, name):
+        self.profile.dump_stats(path)
+
+
+class QueryRecorder:
+    """
+    ``execute_wrapper`` keeping the SQL, database and time of every query,
+    and their parameters with ``with_params``.
+    """
+
+    def __init__(self, with_params=False):
+        self.with_params = with_params
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(
+                {
+                    "database": context["connection"].alias,
+                    "sql": sql,
+                    "params": (repr(params) if self.with_params and not many else None),
+                    "duration": time.perf_counter() - started,
+                }
+            )
+
+
+def get_profile_dir():
+    return Path(settings.PROFILING_DIR)
+
+
+def list_metas(directory):
+    """
+    Metadata files of the stored profiles, newest first.
+    """
+    return sorted(
+        directory.glob("*.meta.json"),
+        key=lambda path: path.stat().st_mtime_ns,
+        reverse=True,
+    )
+
+
+def prune_profiles(directory, keep):
+    """
+    Delete all but the ``keep`` newest profiles.
+    """
+    for meta in list_metas(directory)[keep:]:
+        profile_id = meta.name.removesuffix(".meta.json")
+        for path in directory.glob(f"{profile_id}.*"):
+            path.unlink(missing_ok=True)
+
+
+class ProfilingMiddleware:
+    """
+    Profile the view and the middleware below this one. Keep it last in
+    ``MIDDLEWARE`` so the profile is about the view.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def should_sample(self):
+        rate = settings.PROFILING_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
+
+    def __call__(self, request):
+        requested = has_valid_token(request)
+        if not requested and not self.should_sample():
+            return self.get_response(request)
+
+        mode = settings.PROFILING_MODE
+        if mode == "cprofile":
+            profiler = CProfileProfiler()
+        else:
+            mode = "sampling"
+            profiler = SamplingProfiler(settings.PROFILING_INTERVAL)
+        recorder = QueryRecorder(with_params=requested)
+        started = time.perf_counter()
+        with wrap_queries(recorder):
+            profiler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.stop()
+        duration = time.perf_counter() - started
+
+        self.save(request, response, mode, profiler, recorder.queries, duration)
+        return response
+
+    def save(self, request, response, mode, profiler, queries, duration):
+        now = datetime.now(timezone.utc)
+        profile_id = f"{now:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match is not None else None
+        directory = get_profile_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+
+        profiler.save(
+            directory / f"{profile_id}{PROFILE_SUFFIXES[mode]}",
+            f"{request.method} {request.path}",
+        )
+        meta = {
+            "id": profile_id,
+            "created": now.isoformat(),
+            "method": request.method,
+            "path": request.get_full_path(),
+            "view": view,
+            "status": response.status_code,
+            "duration": duration,
+            "mode": mode,
+            "query_count": len(queries),
+            "query_duration": sum(query["duration"] for query in queries),
+            "queries": queries,
+        }
+        # Written last: listing only picks up complete profiles.
+        with open(directory / f"{profile_id}.meta.json", "w") as file:
+            json.dump(meta, file)
+        prune_profiles(directory, settings.PROFILING_MAX_FILES)
+
+
+def read_meta(profile_id):
+    if not PROFILE_ID.fullmatch(profile_id):
+        raise Http404
+    try:
+        with open(get_profile_dir() / f"{profile_id}.meta.json") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        raise Http404
+
+
+class ProfileListView(APIView):
+    """
+    get:
+    List the stored request profiles, newest first, without their SQL.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        profiles = []
+        for path in list_metas(get_profile_dir()):
+            try:
+                meta = read_meta(path.name.removesuffix(".meta.json"))
+            except Http404:
+                # Pruned since it was listed.
+                continue
+            del meta["queries"]
+            meta["profile_url"] = reverse(
+                "profile-download", args=[meta["id"]], request=request
+            )
+            meta["queries_url"] = reverse(
+                "profile-queries", args=[meta["id"]], request=request
+            )
+            profiles.append(meta)
+        return Response(profiles)
+
+
+class ProfileTokenView(APIView):
+    """
+    get:
+    A token to send as the ``X-Profile-Token`` header to have requests
+    profiled. Valid for an hour.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({"token": make_token(), "expires_in": TOKEN_MAX_AGE})
+
+
+class ProfileDownloadView(APIView):
+    """
+    get:
+    Download a profile: a speedscope JSON file, or a pstats file.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, profile_id):
+        meta = read_meta(profile_id)
+        filename = f"{profile_id}{PROFILE_SUFFIXES[meta['mode']]}"
+        path = get_profile_dir() / filename
+        if not os.path.exists(path):
+            raise Http404
+        return FileResponse(open(path, "rb"), as_attachment=True, filename=filename)
+
+
+class ProfileQueriesView(APIView):
+    """
+    get:
+    The request details and every SQL query it ran, with timings.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, profile_id):
+        return Response(read_meta(profile_id))
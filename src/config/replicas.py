@@ -0,0 +1,186 @@
+"""
+Read replicas.
+
+``ReplicaMiddleware`` sends the queries of safe (GET, HEAD, OPTIONS)
+requests to one of the hot standbys in ``DATABASE_REPLICAS``, through
+``ReplicaRouter``. Everything else, including reads inside a transaction and
+outside requests, uses the primary.
+
+A client that wrote something stays pinned to the primary for
+``REPLICA_PIN_SECONDS``, so it reads its own writes: by a cookie, and for
+JWT clients, which often drop cookies, by a Redis key of the user. Replicas
+more than ``REPLICA_MAX_LAG`` seconds behind are skipped; keep that below
+the pin time.
+
+Pinning only protects the client that wrote. Loads that fill caches shared
+by every client run inside ``read_from_primary()``: rebuilt from a lagging
+replica right after a write invalidated them, they would keep serving the
+old rows until they expire.
+"""
+
+import logging
+import math
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from config.metrics import InstrumentedRedis
+
+logger = logging.getLogger(__name__)
+redis_instance = InstrumentedRedis(
+    host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0
+)
+
+PIN_COOKIE = "primary_pin"
+# The lag of a replica with nothing left to replay is 0, however long ago
+# its last transaction was.
+LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+# Database the current request reads from, None for the primary.
+read_alias = ContextVar("read_alias", default=None)
+# {alias: (checked at, lag in seconds)}
+lags = {}
+
+
+@contextmanager
+def read_from_primary():
+    token = read_alias.set(None)
+    try:
+        yield
+    finally:
+        read_alias.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = read_alias.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # Explicit, or Django would save objects read from a replica there.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+def replica_lag(alias):
+    """
+    Replication lag of a replica in seconds, checked at most every
+    ``REPLICA_LAG_CHECK_INTERVAL`` seconds. Infinite when it cannot be
+    reached.
+    """
+    now = time.monotonic()
+    checked = lags.get(alias)
+    if checked is None or now - checked[0] > settings.REPLICA_LAG_CHECK_INTERVAL:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(LAG_QUERY)
+                lag = float(cursor.fetchone()[0] or 0)
+        except DatabaseError:
+            logger.warning("Replica %s is unavailable.", alias, exc_info=True)
+            lag = math.inf
+        checked = lags[alias] = (now, lag)
+    return checked[1]
+
+
+def choose_replica():
+    replicas = [
+        alias
+        for alias in replica_aliases()
+        if replica_lag(alias) <= settings.REPLICA_MAX_LAG
+    ]
+    return random.choice(replicas) if replicas else None
+
+
+def get_pin_key(user_id):
+    return f"primary_pin:{user_id}"
+
+
+def get_token_user_id(request):
+    """
+    The user id in the request's access token, checked without a query.
+    """
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = header and authentication.get_raw_token(header)
+    if not raw_token:
+        return None
+    try:
+        token = authentication.get_validated_token(raw_token)
+    except InvalidToken:
+        # DRF answers with a 401 later on.
+        return None
+    return token.get(api_settings.USER_ID_CLAIM)
+
+
+def is_pinned(request):
+    if PIN_COOKIE in request.COOKIES:
+        return True
+    user_id = get_token_user_id(request)
+    return user_id is not None and bool(redis_instance.exists(get_pin_key(user_id)))
+
+
+def pin(request, response):
+    seconds = settings.REPLICA_PIN_SECONDS
+    response.set_cookie(PIN_COOKIE, "1", max_age=seconds, httponly=True)
+    # Set by DRF once it authenticated the request.
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        redis_instance.set(get_pin_key(user.pk), 1, ex=seconds)
+
+
+def get_read_alias(request):
+    if request.method not in SAFE_METHODS or not replica_aliases():
+        return None
+    if is_pinned(request):
+        return None
+    return choose_replica()
+
+
+class ReplicaMiddleware:
+    """
+    Route the reads of safe requests to a replica, and pin clients that
+    wrote something to the primary.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = read_alias.set(get_read_alias(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            read_alias.reset(token)
+
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and replica_aliases()
+        ):
+            pin(request, response)
+        return response
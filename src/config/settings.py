@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     # installed apps
     "rest_framework",
     "rest_framework_simplejwt",
@@ -51,9 +52,11 @@ INSTALLED_APPS = [
     "vehicles",
     "shops",
     "products",
+    "sync",
 ]
 
 MIDDLEWARE = [
+    "config.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -61,6 +64,8 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "config.replicas.ReplicaMiddleware",
+    "config.profiling.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -68,7 +73,7 @@ ROOT_URLCONF = "config.urls"
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
-        "DIRS": [],
+        "DIRS": [BASE_DIR / "config" / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
             "context_processors": [
@@ -87,6 +92,38 @@ WSGI_APPLICATION = "config.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Each process keeps a psycopg pool of connections instead of opening one
+# per request. Keep workers * max size below the server's max_connections.
+DATABASE_POOL = int(os.environ.get("DATABASE_POOL", 1))
+DATABASE_POOL_MIN_SIZE = int(os.environ.get("DATABASE_POOL_MIN_SIZE", 2))
+DATABASE_POOL_MAX_SIZE = int(os.environ.get("DATABASE_POOL_MAX_SIZE", 10))
+# Seconds a request waits for a free connection before failing
+DATABASE_POOL_TIMEOUT = float(os.environ.get("DATABASE_POOL_TIMEOUT", 10))
+# Seconds after which connections above the min size are closed when idle
+DATABASE_POOL_MAX_IDLE = float(os.environ.get("DATABASE_POOL_MAX_IDLE", 600))
+# Seconds after which any connection is replaced
+DATABASE_POOL_MAX_LIFETIME = float(os.environ.get("DATABASE_POOL_MAX_LIFETIME", 3600))
+# Check a pooled connection is alive before handing it out
+DATABASE_HEALTH_CHECKS = int(os.environ.get("DATABASE_HEALTH_CHECKS", 1))
+# Bind parameters on the server, which lets psycopg prepare the statements a
+# connection ran DATABASE_PREPARE_THRESHOLD times. Leave off behind PgBouncer
+# in transaction mode.
+DATABASE_SERVER_SIDE_BINDING = int(os.environ.get("DATABASE_SERVER_SIDE_BINDING", 0))
+DATABASE_PREPARE_THRESHOLD = int(os.environ.get("DATABASE_PREPARE_THRESHOLD", 5))
+
+DATABASE_OPTIONS = {}
+if DATABASE_POOL:
+    DATABASE_OPTIONS["pool"] = {
+        "min_size": DATABASE_POOL_MIN_SIZE,
+        "max_size": DATABASE_POOL_MAX_SIZE,
+        "timeout": DATABASE_POOL_TIMEOUT,
+        "max_idle": DATABASE_POOL_MAX_IDLE,
+        "max_lifetime": DATABASE_POOL_MAX_LIFETIME,
+    }
+if DATABASE_SERVER_SIDE_BINDING:
+    DATABASE_OPTIONS["server_side_binding"] = True
+    DATABASE_OPTIONS["prepare_threshold"] = DATABASE_PREPARE_THRESHOLD
+
 DATABASES = {
     "default": {
         "ENGINE": os.environ.get("SQL_ENGINE"),
@@ -95,9 +132,29 @@ DATABASES = {
         "PASSWORD": os.environ.get("POSTGRES_PASSWORD"),
         "HOST": os.environ.get("SQL_HOST"),
         "PORT": os.environ.get("SQL_PORT"),
+        "CONN_HEALTH_CHECKS": bool(DATABASE_HEALTH_CHECKS),
+        "OPTIONS": DATABASE_OPTIONS,
     }
 }
 
+# Hot standbys of the default database as "host:port", separated by spaces.
+# Safe requests read from them, see config.replicas.
+for index, replica in enumerate(os.environ.get("DATABASE_REPLICAS", "").split(), 1):
+    host, _, port = replica.partition(":")
+    DATABASES[f"replica{index}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["config.replicas.ReplicaRouter"]
+# Seconds a client that wrote reads from the primary
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", 10))
+# Replicas further behind in seconds are not read from
+REPLICA_MAX_LAG = float(os.environ.get("REPLICA_MAX_LAG", 2))
+REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get("REPLICA_LAG_CHECK_INTERVAL", 1))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -175,6 +232,57 @@ SIMPLE_JWT = {
 REDIS_HOST = os.environ.get("REDIS_HOST")
 REDIS_PORT = os.environ.get("REDIS_PORT")
 
+# In-process NumPy index of branch positions, see shops.locator
+BRANCH_LOCATOR_ENABLED = int(os.environ.get("BRANCH_LOCATOR_ENABLED", 0))
+BRANCH_LOCATOR_MAX_AGE = int(os.environ.get("BRANCH_LOCATOR_MAX_AGE", 300))
+# Redis cache of the branches near each map tile, see shops.tile_cache
+GEO_TILE_CACHE_ENABLED = int(os.environ.get("GEO_TILE_CACHE_ENABLED", 0))
+# Tile edge in degrees, about 550 m of latitude
+GEO_TILE_SIZE = float(os.environ.get("GEO_TILE_SIZE", 0.005))
+GEO_TILE_CACHE_TIMEOUT = int(os.environ.get("GEO_TILE_CACHE_TIMEOUT", 600))
+# Farthest a tile entry may reach, in kilometers
+GEO_TILE_CACHE_MAX_RADIUS = float(os.environ.get("GEO_TILE_CACHE_MAX_RADIUS", 50))
+# Publish shop, branch and menu changes to the /events/ streams served by
+# config.asgi, see shops.events
+LIVE_EVENTS_ENABLED = int(os.environ.get("LIVE_EVENTS_ENABLED", 0))
+# Edge in degrees of the grid cells area streams watch, about 5.5 km
+LIVE_EVENTS_CELL_SIZE = float(os.environ.get("LIVE_EVENTS_CELL_SIZE", 0.05))
+# Widest area one stream can watch, in kilometers
+LIVE_EVENTS_MAX_RADIUS = float(os.environ.get("LIVE_EVENTS_MAX_RADIUS", 20))
+# Most shops one stream can watch
+LIVE_EVENTS_MAX_SHOPS = int(os.environ.get("LIVE_EVENTS_MAX_SHOPS", 100))
+# Seconds between keep-alive comments on idle streams
+LIVE_EVENTS_HEARTBEAT = float(os.environ.get("LIVE_EVENTS_HEARTBEAT", 20))
+# Events a slow stream may fall behind by before it is closed
+LIVE_EVENTS_QUEUE_SIZE = int(os.environ.get("LIVE_EVENTS_QUEUE_SIZE", 100))
+# Longest the branches open now stay cached, in seconds; entries otherwise
+# expire when the next branch opens or closes, see shops.opening_hours
+OPEN_NOW_CACHE_TIMEOUT = int(os.environ.get("OPEN_NOW_CACHE_TIMEOUT", 3600))
+# Serve the product list from the products.ProductListing read model, kept up
+# to date on writes while enabled. Backfill with check_product_listings --fix.
+PRODUCT_LISTING_READ_MODEL = int(os.environ.get("PRODUCT_LISTING_READ_MODEL", 0))
+# Edge in degrees of the grid cells listings index branch positions by
+PRODUCT_LISTING_CELL_SIZE = float(os.environ.get("PRODUCT_LISTING_CELL_SIZE", 0.05))
+# Who may read /metrics: requests with an "Authorization: Bearer
+# METRICS_TOKEN" header, when set, and direct requests from these networks
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+METRICS_ALLOWED_NETWORKS = os.environ.get(
+    "METRICS_ALLOWED_NETWORKS", "127.0.0.0/8 ::1/128"
+).split()
+# Share of requests profiled at random, see config.profiling. Requests with
+# an X-Profile-Token header are always profiled.
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 0))
+# "sampling" for speedscope stack samples, "cprofile" for pstats files
+PROFILING_MODE = os.environ.get("PROFILING_MODE", "sampling")
+# Seconds between two stack samples
+PROFILING_INTERVAL = float(os.environ.get("PROFILING_INTERVAL", 0.001))
+PROFILING_DIR = os.environ.get("PROFILING_DIR", "/tmp/espresso-profiles")
+# Older profiles are deleted
+PROFILING_MAX_FILES = int(os.environ.get("PROFILING_MAX_FILES", 100))
+# compact_changes deletes older sync log entries; clients that have not
+# synced for longer start over
+SYNC_RETENTION_DAYS = int(os.environ.get("SYNC_RETENTION_DAYS", 30))
+
 ACTIVATION_CODE_EXPIRY = os.environ.get("ACTIVATION_CODE_EXPIRY")
 SMS_CLIENT_CLASS = "users.api_clients.eskiz_sms_client.EskizSmsClient"
 
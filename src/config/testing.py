@@ -0,0 +1,52 @@
+from contextlib import contextmanager
+from unittest.mock import patch
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+from config.replicas import read_alias
+
+LAGGING_REPLICA = "lagging_replica"
+
+
+def explain_without_seqscan(queryset):
+    """
+    Return the PostgreSQL plan for ``queryset`` with sequential scans disabled.
+
+    Test tables hold a handful of rows, so the planner would always pick a
+    sequential scan; disabling it shows whether an index fits the query shape.
+    The setting is transaction-local and rolls back with the test.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+    return queryset.explain()
+
+
+@contextmanager
+def lagging_replica():
+    """
+    Route reads to a replica that has replayed none of the test's writes,
+    as ``ReplicaMiddleware`` would for a safe request.
+
+    The replica is a second connection to the test database, which cannot
+    see the rows of the test's open transaction. The router normally keeps
+    reads inside a transaction, as every test runs in, on the primary.
+    """
+    settings_dict = connections[DEFAULT_DB_ALIAS].settings_dict
+    options = dict(settings_dict["OPTIONS"])
+    options.pop("pool", None)
+    connections.settings[LAGGING_REPLICA] = {**settings_dict, "OPTIONS": options}
+    # Connected up front, as test cases only allow connecting to the
+    # databases they declare.
+    connections[LAGGING_REPLICA].connect()
+    token = read_alias.set(LAGGING_REPLICA)
+    try:
+        with patch(
+            "config.replicas.ReplicaRouter.db_for_read",
+            lambda router, model, **hints: read_alias.get() or DEFAULT_DB_ALIAS,
+        ):
+            yield
+    finally:
+        read_alias.reset(token)
+        connections[LAGGING_REPLICA].close()
+        del connections[LAGGING_REPLICA]
+        del connections.settings[LAGGING_REPLICA]
@@ -0,0 +1,302 @@
+import json
+import pstats
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from prometheus_client import REGISTRY
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.serializers import redis_instance as accounts_redis
+from config.metrics import count_sms
+from config.profiling import make_token
+from products.models import OptionGroup
+from products.tests import SMALL_DATASET
+from vehicles.models import Brand, Color, Model, Vehicle
+
+User = get_user_model()
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class MetricsTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            phone_number="+1234567890", password="password"
+        )
+
+    def test_request_metrics_labelled_by_url_name(self):
+        labels = {"view": "user_detail", "method": "GET", "status": "200"}
+        requests = sample("http_request_duration_seconds_count", **labels)
+        observed = sample("http_request_db_queries_count", view="user_detail")
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse("user_detail"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(
+            sample("http_request_duration_seconds_count", **labels), requests + 1
+        )
+        self.assertEqual(
+            sample("http_request_db_queries_count", view="user_detail"), observed + 1
+        )
+
+    def test_unknown_paths_share_one_label(self):
+        labels = {"view": "unmatched", "method": "GET", "status": "404"}
+        requests = sample("http_request_duration_seconds_count", **labels)
+        self.client.get("/no-such-page/")
+        self.client.get("/another-missing-page/")
+        self.assertEqual(
+            sample("http_request_duration_seconds_count", **labels), requests + 2
+        )
+
+    def test_redis_commands_timed(self):
+        commands = sample("redis_command_duration_seconds_count", command="GET")
+        accounts_redis.get("metrics:test")
+        self.assertEqual(
+            sample("redis_command_duration_seconds_count", command="GET"),
+            commands + 1,
+        )
+
+    def test_sms_outcomes_counted(self):
+        sent = sample("sms_sent_total", outcome="sent")
+        failed = sample("sms_sent_total", outcome="failed")
+        count_sms(lambda: (True, "ok"))()
+        count_sms(lambda: (False, "rejected"))()
+        self.assertEqual(sample("sms_sent_total", outcome="sent"), sent + 1)
+        self.assertEqual(sample("sms_sent_total", outcome="failed"), failed + 1)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse("user_detail"))
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b"http_request_duration_seconds_bucket", response.content)
+
+    @override_settings(METRICS_TOKEN="scrape-token")
+    def test_metrics_endpoint_guarded(self):
+        url = reverse("metrics")
+        outside = {"REMOTE_ADDR": "203.0.113.7"}
+        response = self.client.get(url, **outside)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(url, HTTP_X_FORWARDED_FOR="203.0.113.7")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(
+            url, HTTP_AUTHORIZATION="Bearer scrape-token", **outside
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(url, HTTP_AUTHORIZATION="Bearer wrong", **outside)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ProfilingTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            phone_number="+1234567890", password="password"
+        )
+        self.staff = User.objects.create_user(
+            phone_number="+1234567891", password="password", is_staff=True
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.enterContext(override_settings(PROFILING_DIR=self.directory))
+
+    def profiles(self):
+        self.client.force_authenticate(user=self.staff)
+        response = self.client.get(reverse("profile-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_unprofiled_by_default(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.get(reverse("user_detail"))
+        self.assertEqual(self.profiles(), [])
+
+    def test_signed_header_profiles_request(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.get(reverse("user_detail"), HTTP_X_PROFILE_TOKEN=make_token())
+
+        (profile,) = self.profiles()
+        self.assertEqual(profile["view"], "user_detail")
+        self.assertEqual(profile["status"], 200)
+        self.assertEqual(profile["mode"], "sampling")
+        self.assertNotIn("queries", profile)
+
+        response = self.client.get(profile["profile_url"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        speedscope = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(speedscope["profiles"][0]["type"], "sampled")
+
+        response = self.client.get(profile["queries_url"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["queries"]), response.data["query_count"])
+
+    def query_params(self, **headers):
+        # Loading the user from the token runs a query with parameters.
+        token = AccessToken.for_user(self.user)
+        self.client.get(
+            reverse("user_detail"), HTTP_AUTHORIZATION=f"Bearer {token}", **headers
+        )
+        with override_settings(PROFILING_SAMPLE_RATE=0):
+            (profile,) = self.profiles()
+            response = self.client.get(profile["queries_url"])
+        return [query["params"] for query in response.data["queries"]]
+
+    def test_token_profiles_keep_query_params(self):
+        params = self.query_params(HTTP_X_PROFILE_TOKEN=make_token())
+        self.assertIn(repr((self.user.pk,)), params)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_sampled_profiles_leave_out_query_params(self):
+        params = self.query_params()
+        self.assertTrue(params)
+        self.assertEqual(params, [None] * len(params))
+
+    def test_profile_pruned_while_listing_skipped(self):
+        pruned = Path(self.directory) / "20260101T000000-0123abcd.meta.json"
+        with patch("config.profiling.list_metas", return_value=[pruned]):
+            self.assertEqual(self.profiles(), [])
+
+    def test_forged_header_ignored(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.get(reverse("user_detail"), HTTP_X_PROFILE_TOKEN="profile:forged")
+        self.assertEqual(self.profiles(), [])
+
+    @override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_MODE="cprofile")
+    def test_sampled_requests_saved_as_pstats(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.get(reverse("user_detail"))
+
+        # Listing is profiled too, so look for the user_detail one.
+        with override_settings(PROFILING_SAMPLE_RATE=0):
+            profiles = self.profiles()
+        (profile,) = [p for p in profiles if p["view"] == "user_detail"]
+        response = self.client.get(profile["profile_url"])
+        with tempfile.NamedTemporaryFile() as file:
+            file.write(b"".join(response.streaming_content))
+            file.flush()
+            self.assertTrue(pstats.Stats(file.name).total_calls)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_MAX_FILES=2)
+    def test_oldest_profiles_pruned(self):
+        self.client.force_authenticate(user=self.user)
+        for _ in range(4):
+            self.client.get(reverse("user_detail"))
+        with override_settings(PROFILING_SAMPLE_RATE=0):
+            self.assertEqual(len(self.profiles()), 2)
+
+    def test_staff_only(self):
+        self.client.force_authenticate(user=self.user)
+        for url in [
+            reverse("profile-list"),
+            reverse("profile-token"),
+            reverse("profile-queries", args=["20260101T000000-0123abcd"]),
+        ]:
+            self.assertEqual(
+                self.client.get(url).status_code, status.HTTP_403_FORBIDDEN
+            )
+
+    def test_invalid_profile_id(self):
+        self.client.force_authenticate(user=self.staff)
+        response = self.client.get(reverse("profile-download", args=["..%2Fsecret"]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class DatabasePoolTests(SimpleTestCase):
+    databases = {"default"}
+
+    def test_requests_reuse_pooled_connections(self):
+        backend_pids = []
+        for _ in range(10):
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_backend_pid()")
+                backend_pids.append(cursor.fetchone()[0])
+            # What request_finished does.
+            connection.close()
+        # A new connection per request would have a new backend each time.
+        self.assertLess(len(set(backend_pids)), len(backend_pids))
+
+
+class AdminChangelistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command("generate_dataset", **SMALL_DATASET)
+        # The generated references are public; the user column is nullable.
+        for user in User.objects.all()[:2]:
+            brand = Brand.objects.create(name=f"Private {user.pk}", user=user)
+            Model.objects.create(name=f"Private {user.pk}", brand=brand, user=user)
+            Color.objects.create(
+                name=f"Private {user.pk}", rgb_code="#111111", user=user
+            )
+        cls.admin = User.objects.create_superuser(
+            phone_number="+998000000001", password="password"
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def get_changelist(self, model, params=None):
+        url = reverse(
+            f"admin:{model._meta.app_label}_{model._meta.model_name}_changelist"
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(queries)
+
+    def test_queries_do_not_grow_with_rows(self):
+        apps = {"accounts", "products", "shops", "vehicles"}
+        for model, model_admin in admin.site._registry.items():
+            if model._meta.app_label not in apps:
+                continue
+            with self.subTest(model=model._meta.label):
+                self.assertGreater(model.objects.count(), 1)
+                with patch.object(model_admin, "list_per_page", 1):
+                    _, one_row = self.get_changelist(model)
+                response, full_page = self.get_changelist(model)
+                self.assertGreater(len(response.context["cl"].result_list), 1)
+                self.assertEqual(full_page, one_row)
+
+    def test_autocomplete_filter(self):
+        vehicle = Vehicle.objects.select_related("user").first()
+        response, _ = self.get_changelist(
+            Vehicle, {"user__id__exact": vehicle.user_id, "q": vehicle.plate_number}
+        )
+        self.assertEqual(list(response.context["cl"].result_list), [vehicle])
+        content = response.content.decode()
+        self.assertIn('name="user__id__exact"', content)
+        self.assertIn("admin/js/autocomplete.js", content)
+        self.assertIn(f'<option value="{vehicle.user_id}" selected>', content)
+        self.assertIn(f'name="q" value="{vehicle.plate_number}"', content)
+
+        # Cleared select.
+        response, _ = self.get_changelist(Vehicle, {"user__id__exact": ""})
+        self.assertEqual(response.context["cl"].result_count, Vehicle.objects.count())
+
+    def test_large_tables_not_counted(self):
+        OptionGroup.objects.bulk_create(
+            OptionGroup(name=f"Group {index}") for index in range(100000)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE products_optiongroup")
+
+        response, _ = self.get_changelist(OptionGroup)
+        self.assertAlmostEqual(response.context["cl"].result_count, 100004, delta=5000)
+        with CaptureQueriesContext(connection) as queries:
+            self.get_changelist(OptionGroup)
+        self.assertFalse(any("COUNT(" in query["sql"] for query in queries))
+
+        # Filtered changelists are counted exactly.
+        response, _ = self.get_changelist(OptionGroup, {"q": "Group 99999"})
+        self.assertEqual(response.context["cl"].result_count, 1)
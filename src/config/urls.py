@@ -6,6 +6,14 @@ from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 
+from config.metrics import metrics_view
+from config.profiling import (
+    ProfileDownloadView,
+    ProfileListView,
+    ProfileQueriesView,
+    ProfileTokenView,
+)
+
 schema_view = get_schema_view(
     openapi.Info(
         title="Espresso API",
@@ -31,6 +39,20 @@ urlpatterns = [
     path("vehicles/", include("vehicles.urls")),
     path("shops/", include("shops.urls")),
     path("products/", include("products.urls")),
+    path("sync/", include("sync.urls")),
+    path("metrics", metrics_view, name="metrics"),
+    path("profiles/", ProfileListView.as_view(), name="profile-list"),
+    path("profiles/token/", ProfileTokenView.as_view(), name="profile-token"),
+    path(
+        "profiles/<str:profile_id>/",
+        ProfileDownloadView.as_view(),
+        name="profile-download",
+    ),
+    path(
+        "profiles/<str:profile_id>/queries/",
+        ProfileQueriesView.as_view(),
+        name="profile-queries",
+    ),
 ]
 
 if settings.DEBUG:
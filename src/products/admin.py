@@ -1,12 +1,16 @@
 from django.contrib import admin
 
+from config.admin import AutocompleteFilter, ScalableAdminMixin
+
 from .models import Category, Option, OptionGroup, Product, ProductOption
 
 
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
+class CategoryAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ("name", "parent", "is_active")
-    list_filter = ("is_active", "parent")
+    list_select_related = ("parent",)
+    list_filter = ("is_active", ("parent", AutocompleteFilter))
+    autocomplete_fields = ("parent",)
     search_fields = ("name",)
     ordering = ("name",)
 
@@ -14,12 +18,15 @@ class CategoryAdmin(admin.ModelAdmin):
 class ProductOptionInline(admin.TabularInline):
     model = ProductOption
     extra = 1
+    autocomplete_fields = ("option_group",)
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ("title", "shop", "category", "price")
-    list_filter = ("shop", "category")
+    list_select_related = ("shop", "category")
+    list_filter = (("shop", AutocompleteFilter), ("category", AutocompleteFilter))
+    autocomplete_fields = ("shop", "category")
     search_fields = ("title", "description")
     inlines = [ProductOptionInline]
     ordering = ("title",)
@@ -31,7 +38,7 @@ class OptionInline(admin.TabularInline):
 
 
 @admin.register(OptionGroup)
-class OptionGroupAdmin(admin.ModelAdmin):
+class OptionGroupAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ("name", "is_required")
     search_fields = ("name",)
     inlines = [OptionInline]
@@ -39,16 +46,23 @@ class OptionGroupAdmin(admin.ModelAdmin):
 
 
 @admin.register(Option)
-class OptionAdmin(admin.ModelAdmin):
+class OptionAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ("name", "group", "price_adjustment")
-    list_filter = ("group",)
+    list_select_related = ("group",)
+    list_filter = (("group", AutocompleteFilter),)
+    autocomplete_fields = ("group",)
     search_fields = ("name",)
     ordering = ("name",)
 
 
 @admin.register(ProductOption)
-class ProductOptionAdmin(admin.ModelAdmin):
+class ProductOptionAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ("product", "option_group")
-    list_filter = ("product__shop", "option_group")
+    list_select_related = ("product", "option_group")
+    list_filter = (
+        ("product__shop", AutocompleteFilter),
+        ("option_group", AutocompleteFilter),
+    )
+    autocomplete_fields = ("product", "option_group")
     search_fields = ("product__title", "option_group__name")
     ordering = ("product",)
@@ -0,0 +1,36 @@
+from config.benchmarks import benchmark, build_view
+
+from .models import Product
+from .serializers import ProductDetailSerializer, ProductSerializer
+from .views import ProductListView
+
+# Center of the densest city of the generated dataset.
+LATITUDE, LONGITUDE = 41.311, 69.279
+
+
+@benchmark("products.ProductSerializer", sized=True)
+def product_serializer(size):
+    products = list(
+        Product.objects.select_related("shop", "category").order_by("id")[:size]
+    )
+    return lambda: ProductSerializer(products, many=True).data
+
+
+@benchmark("products.ProductDetailSerializer", sized=True)
+def product_detail_serializer(size):
+    products = list(
+        Product.objects.select_related("shop", "category")
+        .prefetch_related("product_options__option_group__options")
+        .order_by("id")[:size]
+    )
+    return lambda: ProductDetailSerializer(products, many=True).data
+
+
+@benchmark("products.ProductListView.radius_queryset")
+def product_radius_queryset():
+    view = build_view(
+        ProductListView,
+        "/products/products/",
+        {"latitude": LATITUDE, "longitude": LONGITUDE, "radius": 2},
+    )
+    return lambda: list(view.get_queryset())
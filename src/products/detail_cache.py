@@ -0,0 +1,156 @@
+import json
+import logging
+
+import redis
+from django.conf import settings
+from django.utils.translation import get_language, get_supported_language_variant
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from config.metrics import InstrumentedRedis
+from config.replicas import read_from_primary
+
+from .serializers import absolute_image_url
+
+logger = logging.getLogger(__name__)
+
+redis_instance = InstrumentedRedis(
+    host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0
+)
+
+DETAIL_CACHE_TIMEOUT = 60 * 60
+STATS_KEY = "products:detail:stats"
+# Incremented by every invalidation, see cache_detail().
+GENERATION_KEY = "products:detail:generation"
+
+
+def entry_key(product_id, language):
+    return f"products:detail:{product_id}:{language}"
+
+
+def dependency_key(name, pk):
+    """
+    Redis set of the cached entries built from the given row.
+    """
+    return f"products:detail:deps:{name}:{pk}"
+
+
+def get_dependencies(product):
+    """
+    The rows a product's detail payload is built from, as ``(name, pk)``.
+    """
+    dependencies = {("product", product.pk), ("shop", product.shop_id)}
+    if product.category_id is not None:
+        dependencies.add(("category", product.category_id))
+    for product_option in product.product_options.all():
+        # Options added to a group later are covered by the group itself.
+        dependencies.add(("optiongroup", product_option.option_group_id))
+        for option in product_option.option_group.options.all():
+            dependencies.add(("option", option.pk))
+    return dependencies
+
+
+def get_cached_detail(product_id, language):
+    """
+    The cached payload or None, and the generation of the cache to pass on
+    to ``cache_detail()``.
+    """
+    try:
+        cached, generation = redis_instance.mget(
+            entry_key(product_id, language), GENERATION_KEY
+        )
+        redis_instance.hincrby(STATS_KEY, "misses" if cached is None else "hits")
+    except redis.RedisError:
+        logger.exception("Could not read cached product detail")
+        return None, None
+    return (None if cached is None else json.loads(cached)), generation or b"0"
+
+
+def cache_detail(product, language, data, generation):
+    """
+    Cache a payload loaded after reading ``generation``. An invalidation
+    since then may have missed the entry while it was being built from the
+    old rows, so the payload is only cached if the generation is unchanged.
+    """
+    if generation is None:
+        return
+    key = entry_key(product.pk, language)
+    try:
+        with redis_instance.pipeline() as pipeline:
+            pipeline.watch(GENERATION_KEY)
+            if (pipeline.get(GENERATION_KEY) or b"0") != generation:
+                return
+            pipeline.multi()
+            pipeline.set(
+                key, json.dumps(data, cls=JSONEncoder), ex=DETAIL_CACHE_TIMEOUT
+            )
+            for name, pk in get_dependencies(product):
+                pipeline.sadd(dependency_key(name, pk), key)
+                pipeline.expire(dependency_key(name, pk), DETAIL_CACHE_TIMEOUT)
+            pipeline.execute()
+    except redis.WatchError:
+        # Invalidated while caching.
+        pass
+    except redis.RedisError:
+        logger.exception("Could not cache product detail")
+
+
+def invalidate_details(name, pks):
+    """
+    Drop every cached product detail built from one of the given rows.
+    """
+    dependency_keys = [dependency_key(name, pk) for pk in pks]
+    if not dependency_keys:
+        return
+    try:
+        # Before looking up the entries, so that none can be added unseen.
+        redis_instance.incr(GENERATION_KEY)
+        keys = redis_instance.sunion(dependency_keys)
+        redis_instance.delete(*keys, *dependency_keys)
+    except redis.RedisError:
+        logger.exception("Could not invalidate cached product details")
+
+
+def get_stats():
+    stats = {
+        field.decode(): int(value)
+        for field, value in redis_instance.hgetall(STATS_KEY).items()
+    }
+    hits, misses = stats.get("hits", 0), stats.get("misses", 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else None,
+    }
+
+
+def reset_stats():
+    redis_instance.delete(STATS_KEY)
+
+
+class CachedProductDetailMixin:
+    """
+    Serves product detail payloads from a per-product, per-language Redis
+    cache. Each entry is registered with the rows it was built from, so a
+    change to one option only drops the products that show it.
+
+    Entries are shared by every host the API is served on, so they hold
+    image paths, made absolute for each request.
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        language = get_supported_language_variant(get_language())
+        product_id = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        if getattr(self, "object_missing", False):
+            # The product may be gone with its entry not invalidated yet.
+            data, generation = None, None
+        else:
+            data, generation = get_cached_detail(product_id, language)
+        if data is None:
+            with read_from_primary():
+                instance = self.get_object()
+                context = {**self.get_serializer_context(), "request": None}
+                data = self.get_serializer(instance, context=context).data
+            cache_detail(instance, language, data, generation)
+        data["image"] = absolute_image_url(request, data["image"])
+        return Response(data)
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import logging
+from decimal import Decimal
+
+import redis
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Floor
+
+from config.metrics import InstrumentedRedis
+from config.replicas import read_from_primary
+from shops.models import Shop
+
+from .models import Category
+
+logger = logging.getLogger(__name__)
+
+redis_instance = InstrumentedRedis(
+    host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0
+)
+
+FACETS_CACHE_TIMEOUT = 60
+PRICE_BUCKET_SIZE = Decimal(5)
+
+# GROUPING(category, shop, bucket) bit masks of each grouping set.
+CATEGORY_SET, SHOP_SET, PRICE_SET = 0b011, 0b101, 0b110
+
+
+def facets_cache_key(params):
+    digest = hashlib.md5(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    return f"products:facets:{digest}"
+
+
+def count_facets(queryset, price_field):
+    """
+    Product counts per category, shop and price bucket of a filtered
+    queryset, from one GROUPING SETS aggregate over it.
+    """
+    filtered = (
+        queryset.order_by()
+        .annotate(
+            facet_category=F("category_id"),
+            facet_shop=F("shop_id"),
+            facet_bucket=Floor(F(price_field) / PRICE_BUCKET_SIZE),
+        )
+        .values("facet_category", "facet_shop", "facet_bucket")
+    )
+    sql, params = filtered.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT GROUPING(facet_category, facet_shop, facet_bucket), "
+            "facet_category, facet_shop, facet_bucket, COUNT(*) "
+            f"FROM ({sql}) AS filtered "
+            "GROUP BY GROUPING SETS ((facet_category), (facet_shop), (facet_bucket))",
+            params,
+        )
+        rows = cursor.fetchall()
+
+    counts = {CATEGORY_SET: {}, SHOP_SET: {}, PRICE_SET: {}}
+    for grouping, category_id, shop_id, bucket, count in rows:
+        key = {CATEGORY_SET: category_id, SHOP_SET: shop_id, PRICE_SET: bucket}
+        if key[grouping] is not None:
+            counts[grouping][key[grouping]] = count
+    return counts
+
+
+def build_facets(queryset, price_field):
+    counts = count_facets(queryset, price_field)
+
+    # Every product also counts towards the ancestors of its category.
+    categories = {
+        pk: (name, parent_id)
+        for pk, name, parent_id in Category.objects.values_list(
+            "id", "name", "parent_id"
+        )
+    }
+    category_counts = {}
+    for category_id, count in counts[CATEGORY_SET].items():
+        seen = set()
+        while category_id in categories and category_id not in seen:
+            seen.add(category_id)
+            category_counts[category_id] = category_counts.get(category_id, 0) + count
+            category_id = categories[category_id][1]
+
+    shop_names = dict(
+        Shop.objects.filter(id__in=counts[SHOP_SET]).values_list("id", "name")
+    )
+    return {
+        "categories": [
+            {
+                "id": category_id,
+                "name": categories[category_id][0],
+                "parent": categories[category_id][1],
+                "count": count,
+            }
+            for category_id, count in sorted(category_counts.items())
+        ],
+        "shops": [
+            {"id": shop_id, "name": shop_names.get(shop_id), "count": count}
+            for shop_id, count in sorted(counts[SHOP_SET].items())
+        ],
+        "prices": [
+            {
+                "from": f"{bucket * PRICE_BUCKET_SIZE:.2f}",
+                "to": f"{(bucket + 1) * PRICE_BUCKET_SIZE:.2f}",
+                "count": count,
+            }
+            for bucket, count in sorted(counts[PRICE_SET].items())
+        ],
+    }
+
+
+def get_facets(queryset, price_field, params):
+    """
+    Facets of a filtered product list, cached briefly per combination of
+    filter ``params``.
+    """
+    key = facets_cache_key(params)
+    try:
+        cached = redis_instance.get(key)
+    except redis.RedisError:
+        logger.exception("Could not read cached facets")
+        return build_facets(queryset, price_field)
+    if cached is not None:
+        return json.loads(cached)
+
+    with read_from_primary():
+        facets = build_facets(queryset, price_field)
+    try:
+        redis_instance.set(key, json.dumps(facets), ex=FACETS_CACHE_TIMEOUT)
+    except redis.RedisError:
+        logger.exception("Could not cache facets")
+    return facets
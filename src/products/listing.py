@@ -0,0 +1,182 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Max
+
+from shops.geo import grid_cell
+from shops.models import Branch
+
+from .models import Category, Option, Product, ProductListing, ProductOption
+
+BATCH_SIZE = 1000
+LISTING_FIELDS = [
+    "shop",
+    "category",
+    "title",
+    "description",
+    "image",
+    "price",
+    "shop_name",
+    "shop_is_active",
+    "category_name",
+    "category_path",
+    "min_price",
+    "max_price",
+    "geo_cells",
+    "branch_vectors",
+]
+
+
+def get_category_paths(category_ids):
+    """
+    ``{category_id: "Root / ... / Category"}``, one query per tree level.
+    """
+    categories = {}
+    missing = set(category_ids)
+    while missing:
+        rows = Category.objects.filter(id__in=missing).values_list(
+            "id", "name", "parent_id"
+        )
+        categories.update({pk: (name, parent_id) for pk, name, parent_id in rows})
+        missing = {
+            parent_id
+            for _, parent_id in categories.values()
+            if parent_id is not None and parent_id not in categories
+        }
+
+    paths = {}
+    for category_id in category_ids:
+        names, seen = [], set()
+        pk = category_id
+        while pk is not None and pk in categories and pk not in seen:
+            seen.add(pk)
+            name, pk = categories[pk]
+            names.append(name)
+        paths[category_id] = " / ".join(reversed(names))
+    return paths
+
+
+def get_max_surcharges(product_ids):
+    """
+    ``{product_id: surcharge}`` of the dearest option of every linked group.
+    Optional groups with only discounts can be skipped.
+    """
+    links = set(
+        ProductOption.objects.filter(product_id__in=product_ids).values_list(
+            "product_id", "option_group_id", "option_group__is_required"
+        )
+    )
+    highest = dict(
+        Option.objects.filter(group_id__in={link[1] for link in links})
+        .values("group_id")
+        .annotate(high=Max("price_adjustment"))
+        .values_list("group_id", "high")
+    )
+
+    surcharges = defaultdict(Decimal)
+    for product_id, group_id, is_required in links:
+        if group_id in highest:
+            high = highest[group_id]
+            surcharges[product_id] += high if is_required else max(high, Decimal(0))
+    return surcharges
+
+
+def get_branch_positions(shop_ids):
+    """
+    ``{shop_id: [(latitude, longitude, unit_vector), ...]}`` of active branches.
+    """
+    positions = defaultdict(list)
+    rows = (
+        Branch.objects.filter(
+            shop_id__in=shop_ids, is_active=True, unit_x__isnull=False
+        )
+        .order_by("id")
+        .values_list("shop_id", "latitude", "longitude", "unit_x", "unit_y", "unit_z")
+    )
+    for shop_id, latitude, longitude, *vector in rows:
+        positions[shop_id].append((latitude, longitude, vector))
+    return positions
+
+
+def build_listings(product_ids):
+    """
+    Unsaved listing rows for the given products, computed from the source
+    tables in a fixed number of queries.
+    """
+    products = list(
+        Product.objects.filter(id__in=product_ids).select_related("shop", "category")
+    )
+    category_paths = get_category_paths(
+        {product.category_id for product in products if product.category_id}
+    )
+    surcharges = get_max_surcharges([product.id for product in products])
+    branch_positions = get_branch_positions({product.shop_id for product in products})
+    cell_size = settings.PRODUCT_LISTING_CELL_SIZE
+
+    listings = []
+    for product in products:
+        positions = branch_positions[product.shop_id]
+        listings.append(
+            ProductListing(
+                product=product,
+                shop_id=product.shop_id,
+                category_id=product.category_id,
+                title=product.title,
+                description=product.description,
+                image=product.image.name or None,
+                price=product.price,
+                shop_name=product.shop.name,
+                shop_is_active=product.shop.is_active,
+                category_name=product.category.name if product.category else None,
+                category_path=category_paths.get(product.category_id),
+                min_price=product.from_price,
+                max_price=product.price + surcharges[product.id],
+                geo_cells=sorted(
+                    {
+                        grid_cell(latitude, longitude, cell_size)
+                        for latitude, longitude, _ in positions
+                    }
+                ),
+                branch_vectors=[vector for _, _, vector in positions],
+            )
+        )
+    return listings
+
+
+def refresh_listings(product_ids):
+    """
+    Rebuild the listing rows of the given products. Called inside the
+    transaction that changed them, so the read model commits with the source.
+    """
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        listings = build_listings(product_ids[slice(start, start + BATCH_SIZE)])
+        ProductListing.objects.bulk_create(
+            listings,
+            update_conflicts=True,
+            unique_fields=["product"],
+            update_fields=LISTING_FIELDS,
+        )
+
+
+def refresh_shop_listings(shop_ids):
+    refresh_listings(
+        Product.objects.filter(shop_id__in=shop_ids).values_list("id", flat=True)
+    )
+
+
+def get_category_subtree(category_id):
+    """
+    Ids of a category and all of its descendants.
+    """
+    subtree = {category_id}
+    level = {category_id}
+    while level:
+        level = set(
+            Category.objects.filter(parent_id__in=level)
+            .exclude(id__in=subtree)
+            .values_list("id", flat=True)
+        )
+        subtree |= level
+    return subtree
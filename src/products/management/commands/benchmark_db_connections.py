@@ -0,0 +1,89 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from vehicles.models import Vehicle
+
+MODES = [
+    ("connect per request", {}),
+    ("pooled", {"pool": {"min_size": 1, "max_size": 1}}),
+    (
+        "pooled, prepared",
+        {
+            "pool": {"min_size": 1, "max_size": 1},
+            "server_side_binding": True,
+            "prepare_threshold": 1,
+        },
+    ),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the database side of a request: get a connection, run the "
+        "vehicle list query a few times and release the connection, as the "
+        "request_finished signal does. Compares a new connection per request, "
+        "the connection pool, and the pool with prepared statements."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--queries", type=int, default=3)
+        parser.add_argument("--warmup", type=int, default=20)
+
+    def handle(self, *args, **options):
+        user_ids = list(
+            Vehicle.objects.values_list("user_id", flat=True).distinct()[:100]
+        ) or [0]
+        statements = [
+            Vehicle.objects.select_related("brand", "model", "color")
+            .filter(user_id=user_id)
+            .order_by("-id")
+            .query.sql_with_params()
+            for user_id in user_ids
+        ]
+
+        for name, database_options in MODES:
+            alias = f"benchmark {name}"
+            connection = self.create_connection(alias, database_options)
+            try:
+                for index in range(options["warmup"]):
+                    self.request(connection, statements, index, options["queries"])
+                timings = [
+                    self.request(connection, statements, index, options["queries"])
+                    for index in range(options["requests"])
+                ]
+            finally:
+                connection.close()
+                connection.close_pool()
+                del connections[alias]
+                del connections.settings[alias]
+            self.report(name, timings)
+
+    def create_connection(self, alias, database_options):
+        # Registered, as connection_created receivers look the alias up.
+        connections.settings[alias] = {
+            **connections.settings[DEFAULT_DB_ALIAS],
+            "OPTIONS": database_options,
+        }
+        return connections[alias]
+
+    def request(self, connection, statements, index, queries):
+        started = time.perf_counter()
+        for query in range(queries):
+            sql, params = statements[(index + query) % len(statements)]
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                cursor.fetchall()
+        connection.close()
+        return (time.perf_counter() - started) * 1000
+
+    def report(self, name, timings):
+        timings = sorted(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f"{name:>20}: median {statistics.median(timings):.3f} ms, "
+            f"p95 {p95:.3f} ms per request over {len(timings)} requests"
+        )
@@ -0,0 +1,121 @@
+import random
+import statistics
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from products.facets import PRICE_BUCKET_SIZE, count_facets, get_facets
+from products.models import Category, Product
+from shops.models import Shop
+
+User = get_user_model()
+
+BATCH_SIZE = 10000
+
+
+class Command(BaseCommand):
+    help = (
+        "Time product facet counts at growing catalogue sizes: counting the "
+        "filtered list client side, the single GROUPING SETS aggregate, and "
+        "the cached facets. The dataset is rolled back afterwards unless --keep "
+        "is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", type=int, nargs="+", default=[10000, 100000, 300000]
+        )
+        parser.add_argument("--shops", type=int, default=200)
+        parser.add_argument("--categories", type=int, default=50)
+        parser.add_argument("--samples", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--keep", action="store_true")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+
+        with transaction.atomic():
+            owner = User.objects.create(phone_number="+998900000000", password="!")
+            shops = Shop.objects.bulk_create(
+                Shop(name=f"Shop {index}", owner=owner)
+                for index in range(options["shops"])
+            )
+            roots = Category.objects.bulk_create(
+                Category(name=f"Category {index}")
+                for index in range(options["categories"] // 5 or 1)
+            )
+            categories = roots + Category.objects.bulk_create(
+                Category(name=f"Subcategory {index}", parent=rng.choice(roots))
+                for index in range(options["categories"] - len(roots))
+            )
+
+            created = 0
+            for size in sorted(options["sizes"]):
+                self.create_products(size - created, shops, categories, rng)
+                created = size
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE products_product")
+                self.benchmark(size, options["samples"])
+
+            if not options["keep"]:
+                transaction.set_rollback(True)
+
+    def create_products(self, count, shops, categories, rng):
+        self.stdout.write(f"Creating {count} products...")
+        for start in range(0, count, BATCH_SIZE):
+            products = []
+            for _ in range(min(BATCH_SIZE, count - start)):
+                price = Decimal(rng.randint(100, 3000)) / 100
+                products.append(
+                    Product(
+                        title="Benchmark",
+                        price=price,
+                        from_price=price,
+                        shop=rng.choice(shops),
+                        category=rng.choice(categories),
+                    )
+                )
+            Product.objects.bulk_create(products)
+
+    def benchmark(self, size, samples):
+        queryset = Product.objects.filter(shop__is_active=True)
+        filtered = queryset.filter(from_price__lte=15)
+
+        def client_side():
+            counts = Counter()
+            for category_id, shop_id, price in filtered.values_list(
+                "category_id", "shop_id", "from_price"
+            ):
+                counts["category", category_id] += 1
+                counts["shop", shop_id] += 1
+                counts["price", price // PRICE_BUCKET_SIZE] += 1
+
+        params = {"benchmark": size, "max_price": 15}
+        get_facets(filtered, "from_price", params)
+        self.stdout.write(f"{size} products:")
+        for name, run in [
+            ("client", client_side),
+            ("aggregate", lambda: count_facets(filtered, "from_price")),
+            ("cached", lambda: get_facets(filtered, "from_price", params)),
+        ]:
+            self.report(name, self.measure(run, samples))
+
+    def measure(self, run, samples):
+        timings = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def report(self, name, timings):
+        timings = sorted(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f"{name:>10}: median {statistics.median(timings):.2f} ms, "
+            f"p95 {p95:.2f} ms over {len(timings)} runs"
+        )
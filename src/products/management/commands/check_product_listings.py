@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.listing import (
+    BATCH_SIZE,
+    LISTING_FIELDS,
+    build_listings,
+    refresh_listings,
+)
+from products.models import Product, ProductListing
+
+
+def listing_values(listing):
+    values = [
+        getattr(listing, listing._meta.get_field(name).attname)
+        for name in LISTING_FIELDS
+    ]
+    # Compare stored files by name.
+    values[LISTING_FIELDS.index("image")] = listing.image.name or None
+    return values
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the product listing read model with the product, shop, "
+        "category, option and branch tables, and report missing or stale rows. "
+        "With --fix the affected rows are rebuilt, which also backfills the "
+        "read model before it is enabled."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true")
+        parser.add_argument(
+            "--show", type=int, default=20, help="How many out of sync ids to list."
+        )
+
+    def handle(self, *args, **options):
+        missing, stale = [], []
+        product_ids = list(Product.objects.order_by("id").values_list("id", flat=True))
+        for start in range(0, len(product_ids), BATCH_SIZE):
+            batch = product_ids[slice(start, start + BATCH_SIZE)]
+            stored = ProductListing.objects.in_bulk(batch)
+            for expected in build_listings(batch):
+                listing = stored.get(expected.product_id)
+                if listing is None:
+                    missing.append(expected.product_id)
+                elif listing_values(listing) != listing_values(expected):
+                    stale.append(expected.product_id)
+
+        self.stdout.write(
+            f"{len(product_ids)} products, {len(missing)} missing listings, "
+            f"{len(stale)} stale listings"
+        )
+        out_of_sync = sorted(missing + stale)
+        if out_of_sync:
+            self.stdout.write(
+                "Out of sync: " + ", ".join(map(str, out_of_sync[: options["show"]]))
+            )
+
+        if options["fix"]:
+            refresh_listings(out_of_sync)
+            self.stdout.write(f"Rebuilt {len(out_of_sync)} listings")
+        elif out_of_sync:
+            raise CommandError("Product listings are out of sync, rerun with --fix")
@@ -0,0 +1,381 @@
+import datetime
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from products.listing import refresh_listings
+from products.models import Category, Option, OptionGroup, Product, ProductOption
+from products.pricing import update_from_prices
+from shops.geo import unit_vector
+from shops.models import Branch, OpeningHours, Shop
+from shops.opening_hours import rebuild_opening_periods
+from sync.log import record_changes
+from vehicles.models import Brand, Color, Model, Vehicle
+from vehicles.utils import normalize_plate_number
+
+User = get_user_model()
+
+BATCH_SIZE = 5000
+
+# City centers branches are spread around, with their relative weight.
+CITIES = [
+    ("Tashkent", 41.311, 69.279, 8),
+    ("Samarkand", 39.654, 66.975, 3),
+    ("Bukhara", 39.767, 64.423, 2),
+    ("Namangan", 40.998, 71.672, 2),
+    ("Andijan", 40.783, 72.344, 2),
+    ("Fergana", 40.386, 71.786, 2),
+    ("Nukus", 42.460, 59.603, 1),
+]
+
+# (en, ru, uz) names of the public vehicle reference data.
+BRANDS = [
+    ("Chevrolet", "Шевроле", "Chevrolet"),
+    ("Lada", "Лада", "Lada"),
+    ("Toyota", "Тойота", "Toyota"),
+    ("Hyundai", "Хендай", "Hyundai"),
+    ("Kia", "Киа", "Kia"),
+    ("BYD", "БИД", "BYD"),
+    ("Mercedes-Benz", "Мерседес-Бенц", "Mercedes-Benz"),
+    ("Volkswagen", "Фольксваген", "Volkswagen"),
+]
+COLORS = [
+    ("White", "Белый", "Oq", "#FFFFFF"),
+    ("Black", "Чёрный", "Qora", "#000000"),
+    ("Silver", "Серебристый", "Kumush", "#C0C0C0"),
+    ("Grey", "Серый", "Kulrang", "#808080"),
+    ("Red", "Красный", "Qizil", "#FF0000"),
+    ("Blue", "Синий", "Ko'k", "#0000FF"),
+    ("Green", "Зелёный", "Yashil", "#008000"),
+    ("Beige", "Бежевый", "Bej", "#F5F5DC"),
+]
+PLATE_LETTERS = "ABCDEHKMOPTXYZ"
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a reproducible synthetic dataset with bulk inserts: users, "
+        "shop owners, shops with branches spread around cities and their "
+        "opening hours, a category tree, products sharing option groups, and "
+        "vehicles with translated brands, models and colors. Every user gets the same --password, so "
+        "the load_test command can log in as any of them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--owners", type=int, default=50)
+        parser.add_argument("--shops", type=int, default=200)
+        parser.add_argument("--branches-per-shop", type=int, default=5)
+        parser.add_argument("--root-categories", type=int, default=10)
+        parser.add_argument("--categories", type=int, default=60)
+        parser.add_argument("--category-depth", type=int, default=3)
+        parser.add_argument("--products", type=int, default=20000)
+        parser.add_argument("--option-groups", type=int, default=40)
+        parser.add_argument("--models-per-brand", type=int, default=10)
+        parser.add_argument("--vehicles-per-user", type=int, default=2)
+        parser.add_argument("--spread-km", type=float, default=15.0)
+        parser.add_argument("--password", default="loadtest")
+        parser.add_argument(
+            "--phone-prefix",
+            default="77",
+            help="Operator code of the generated phone numbers, +998<prefix>...",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.options = options
+        prefix = f"+998{options['phone_prefix']}"
+        if User.objects.filter(phone_number__startswith=prefix).exists():
+            raise CommandError(
+                f"Users with {prefix} numbers already exist, pick another "
+                "--phone-prefix."
+            )
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            users, owners = self.create_users(prefix)
+            shops = self.create_shops(owners)
+            self.create_branches(shops)
+            categories = self.create_categories()
+            groups = self.create_option_groups()
+            self.create_products(shops, categories, groups)
+            self.create_vehicles(users)
+        self.stdout.write(
+            f"Done in {time.perf_counter() - started:.1f} s. Log in with any "
+            f"{prefix} number and password {options['password']!r}."
+        )
+
+    def log(self, message):
+        self.stdout.write(f"  {message}")
+
+    def create_users(self, prefix):
+        # Hashing is deliberately slow, so every user shares one hash.
+        password = make_password(self.options["password"])
+        count, owner_count = self.options["users"], self.options["owners"]
+        users = User.objects.bulk_create(
+            (
+                User(
+                    phone_number=f"{prefix}{index:07d}",
+                    first_name=f"User{index}",
+                    last_name="Loadtest",
+                    password=password,
+                    role=User.ROLE_OWNER if index < owner_count else User.ROLE_USER,
+                )
+                for index in range(count + owner_count)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        self.log(f"{count} users and {owner_count} owners")
+        return users[owner_count:], users[:owner_count]
+
+    def create_shops(self, owners):
+        shops = Shop.objects.bulk_create(
+            Shop(
+                name=f"Shop {index}",
+                description=f"Synthetic shop {index}",
+                owner=self.rng.choice(owners),
+                is_active=self.rng.random() > 0.05,
+            )
+            for index in range(self.options["shops"])
+        )
+        # Like the rest of the catalogue, for the sync change log the signals
+        # would write.
+        record_changes(shops)
+        self.log(f"{len(shops)} shops")
+        return shops
+
+    def random_position(self):
+        """
+        A point normally distributed around a city picked by weight.
+        """
+        _, latitude, longitude, _ = self.rng.choices(
+            CITIES, weights=[city[3] for city in CITIES]
+        )[0]
+        spread = self.options["spread_km"] / 111.0
+        return (
+            round(Decimal(self.rng.gauss(latitude, spread)), 6),
+            round(Decimal(self.rng.gauss(longitude, spread)), 6),
+        )
+
+    def create_branches(self, shops):
+        branches = []
+        for shop in shops:
+            for index in range(self.rng.randint(1, self.options["branches_per_shop"])):
+                latitude, longitude = self.random_position()
+                # bulk_create skips Branch.save(), which keeps these in sync.
+                unit_x, unit_y, unit_z = unit_vector(latitude, longitude)
+                branches.append(
+                    Branch(
+                        shop=shop,
+                        address=f"{shop.name}, branch {index}",
+                        latitude=latitude,
+                        longitude=longitude,
+                        unit_x=unit_x,
+                        unit_y=unit_y,
+                        unit_z=unit_z,
+                        is_active=self.rng.random() > 0.1,
+                    )
+                )
+        Branch.objects.bulk_create(branches, batch_size=BATCH_SIZE)
+        record_changes(branches)
+        self.log(f"{len(branches)} branches")
+        self.create_opening_hours(branches)
+
+    def create_opening_hours(self, branches):
+        """
+        Daily hours for most branches, some of them open overnight, and none
+        for the rest.
+        """
+        opening_hours = []
+        for branch in branches:
+            if self.rng.random() < 0.1:
+                continue
+            opens = datetime.time(self.rng.randint(6, 10))
+            if self.rng.random() < 0.2:
+                closes = datetime.time(self.rng.randint(0, 3))
+            else:
+                closes = datetime.time(self.rng.randint(18, 23))
+            opening_hours.extend(
+                OpeningHours(branch=branch, weekday=weekday, opens=opens, closes=closes)
+                for weekday in range(7)
+            )
+        OpeningHours.objects.bulk_create(opening_hours, batch_size=BATCH_SIZE)
+        for start in range(0, len(branches), BATCH_SIZE):
+            end = start + BATCH_SIZE
+            rebuild_opening_periods([branch.pk for branch in branches[start:end]])
+        self.log(f"{len(opening_hours)} opening hours")
+
+    def create_categories(self):
+        """
+        ``--categories`` categories, the first ``--root-categories`` of them
+        roots, the rest attached to a random category of the previous level.
+        """
+        roots = self.options["root_categories"]
+        depth = self.options["category_depth"]
+        levels = [
+            Category.objects.bulk_create(
+                Category(name=f"Category {index}") for index in range(roots)
+            )
+        ]
+        remaining = self.options["categories"] - roots
+        for level in range(1, depth):
+            count = remaining // (depth - level)
+            levels.append(
+                Category.objects.bulk_create(
+                    Category(
+                        name=f"Category {level}.{index}",
+                        parent=self.rng.choice(levels[-1]),
+                    )
+                    for index in range(count)
+                )
+            )
+            remaining -= count
+        categories = [category for level in levels for category in level]
+        record_changes(categories)
+        self.log(f"{len(categories)} categories in {len(levels)} levels")
+        return categories
+
+    def create_option_groups(self):
+        groups = OptionGroup.objects.bulk_create(
+            OptionGroup(name=f"Options {index}", is_required=index % 3 == 0)
+            for index in range(self.options["option_groups"])
+        )
+        options = Option.objects.bulk_create(
+            Option(
+                group=group,
+                name=f"Option {group.pk}.{index}",
+                price_adjustment=Decimal(self.rng.randint(-50, 300)) / 100,
+            )
+            for group in groups
+            for index in range(self.rng.randint(2, 5))
+        )
+        record_changes(groups)
+        record_changes(options)
+        self.log(f"{len(groups)} option groups with {len(options)} options")
+        return groups
+
+    def create_products(self, shops, categories, groups):
+        count = self.options["products"]
+        product_ids = []
+        for start in range(0, count, BATCH_SIZE):
+            products = []
+            for index in range(start, min(start + BATCH_SIZE, count)):
+                price = Decimal(self.rng.randint(100, 5000)) / 100
+                products.append(
+                    Product(
+                        title=f"Product {index}",
+                        description=f"Synthetic product {index}",
+                        price=price,
+                        from_price=price,
+                        shop=self.rng.choice(shops),
+                        category=self.rng.choice(categories),
+                    )
+                )
+            products = Product.objects.bulk_create(products)
+            # Option groups are shared by many products.
+            ProductOption.objects.bulk_create(
+                ProductOption(product=product, option_group=group)
+                for product in products
+                for group in self.rng.sample(groups, self.rng.randint(0, 3))
+            )
+            product_ids.extend(product.pk for product in products)
+            record_changes(products)
+
+        # Both are maintained by signals, which bulk inserts do not send.
+        update_from_prices(Product.objects.filter(id__in=product_ids))
+        refresh_listings(product_ids)
+        self.log(f"{count} products")
+
+    def public_rows(self, model, rows, key):
+        """
+        Save the public reference ``rows`` that an earlier run has not, and
+        return them all with the earlier ones in their place, matched on
+        ``key(row)``, along with the new ones.
+        """
+        existing = {
+            key(row): row
+            for row in model.objects.filter(
+                user=None, name_en__in={row.name_en for row in rows}
+            )
+        }
+        created = model.objects.bulk_create(
+            row for row in rows if key(row) not in existing
+        )
+        existing.update((key(row), row) for row in created)
+        return [existing[key(row)] for row in rows], created
+
+    def create_vehicles(self, users):
+        # Public reference data is shared by every run.
+        brands, new_brands = self.public_rows(
+            Brand,
+            [
+                Brand(name=en, name_en=en, name_ru=ru, name_uz=uz)
+                for en, ru, uz in BRANDS
+            ],
+            lambda brand: brand.name_en,
+        )
+        models, new_models = self.public_rows(
+            Model,
+            [
+                Model(
+                    name=f"{brand.name_en} {index}",
+                    name_en=f"{brand.name_en} {index}",
+                    name_ru=f"{brand.name_ru} {index}",
+                    name_uz=f"{brand.name_uz} {index}",
+                    brand=brand,
+                )
+                for brand in brands
+                for index in range(1, self.options["models_per_brand"] + 1)
+            ],
+            lambda model: (model.brand_id, model.name_en),
+        )
+        colors, new_colors = self.public_rows(
+            Color,
+            [
+                Color(name=en, name_en=en, name_ru=ru, name_uz=uz, rgb_code=rgb)
+                for en, ru, uz, rgb in COLORS
+            ],
+            lambda color: color.name_en,
+        )
+
+        record_changes([*new_brands, *new_models, *new_colors])
+
+        vehicles = []
+        for user in users:
+            for _ in range(self.rng.randint(0, self.options["vehicles_per_user"])):
+                model = self.rng.choice(models)
+                plate = self.plate_number(len(vehicles))
+                vehicles.append(
+                    Vehicle(
+                        plate_number=plate,
+                        normalized_plate_number=normalize_plate_number(plate),
+                        brand=model.brand,
+                        model=model,
+                        color=self.rng.choice(colors),
+                        user=user,
+                    )
+                )
+        Vehicle.objects.bulk_create(vehicles, batch_size=BATCH_SIZE)
+        self.log(
+            f"{len(brands)} brands, {len(models)} models, {len(colors)} colors "
+            f"and {len(vehicles)} vehicles"
+        )
+
+    def plate_number(self, index):
+        """
+        An Uzbek style plate, e.g. "01 A 123 BC", unique for every ``index``.
+        """
+        number, rest = index % 1000, index // 1000
+        letters = PLATE_LETTERS[rest % len(PLATE_LETTERS)]
+        rest //= len(PLATE_LETTERS)
+        suffix = PLATE_LETTERS[rest % len(PLATE_LETTERS)]
+        rest //= len(PLATE_LETTERS)
+        suffix += PLATE_LETTERS[rest % len(PLATE_LETTERS)]
+        region = rest // len(PLATE_LETTERS) + 1
+        return f"{region:02d} {letters} {number:03d} {suffix}"
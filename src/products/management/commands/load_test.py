@@ -0,0 +1,217 @@
+import asyncio
+import random
+from urllib.parse import urlencode
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from config.loadtest import LoadStats, VirtualUser, run_load_test
+from products.models import Category, Product
+from shops.models import Branch
+from vehicles.models import Color, Model
+
+User = get_user_model()
+
+SAMPLE_SIZE = 1000
+
+
+class APIUser(VirtualUser):
+    """
+    A customer who logs in, browses products and menus near a branch
+    location and manages their vehicles.
+    """
+
+    def __init__(self, base_url, stats, rng, index, data, phone_number, password):
+        super().__init__(base_url, stats, rng)
+        self.index = index
+        self.data = data
+        self.phone_number = phone_number
+        self.password = password
+        self.plates = 0
+
+    async def on_start(self):
+        _, tokens = await self.call(
+            "login",
+            "POST",
+            "/accounts/login/",
+            {"phone_number": self.phone_number, "password": self.password},
+        )
+        if tokens and "access" in tokens:
+            self.headers["Authorization"] = f"Bearer {tokens['access']}"
+
+    def position(self):
+        latitude, longitude = self.rng.choice(self.data["positions"])
+        return (
+            round(latitude + self.rng.uniform(-0.02, 0.02), 6),
+            round(longitude + self.rng.uniform(-0.02, 0.02), 6),
+        )
+
+    async def products_nearby(self):
+        latitude, longitude = self.position()
+        query = {
+            "latitude": latitude,
+            "longitude": longitude,
+            "radius": self.rng.choice([1, 2, 5]),
+            "category": self.rng.choice(self.data["categories"]),
+        }
+        await self.call(
+            "products nearby", "GET", f"/products/products/?{urlencode(query)}"
+        )
+
+    async def products_by_price(self):
+        query = {
+            "category": self.rng.choice(self.data["categories"]),
+            "max_price": self.rng.randint(5, 50),
+            "ordering": "price",
+        }
+        await self.call(
+            "products by price", "GET", f"/products/products/?{urlencode(query)}"
+        )
+
+    async def nearest_branches(self):
+        latitude, longitude = self.position()
+        query = urlencode({"latitude": latitude, "longitude": longitude})
+        await self.call("nearest branches", "GET", f"/shops/branches/?{query}")
+
+    async def menu(self):
+        shop_id = self.rng.choice(self.data["shops"])
+        await self.call("shop menu", "GET", f"/products/shops/{shop_id}/menu/")
+
+    async def product_detail(self):
+        product_id = self.rng.choice(self.data["products"])
+        await self.call("product detail", "GET", f"/products/products/{product_id}/")
+
+    async def vehicle_list(self):
+        await self.call("vehicle list", "GET", "/vehicles/vehicles/")
+
+    async def vehicle_crud(self):
+        """
+        Create, rename and delete a vehicle, so the dataset stays the same.
+        """
+        model_id, brand_id = self.rng.choice(self.data["models"])
+        self.plates += 1
+        vehicle = {
+            "plate_number": f"LT {self.index} {self.plates}",
+            "brand": brand_id,
+            "model": model_id,
+            "color": self.rng.choice(self.data["colors"]),
+        }
+        status, created = await self.call(
+            "vehicle create", "POST", "/vehicles/vehicles/", vehicle, expect=(201,)
+        )
+        if status != 201:
+            return
+        path = f"/vehicles/vehicles/{created['id']}/"
+        await self.call(
+            "vehicle update",
+            "PATCH",
+            path,
+            {"plate_number": f"{vehicle['plate_number']}X"},
+        )
+        await self.call("vehicle delete", "DELETE", path, expect=(204,))
+
+    tasks = [
+        (3, products_nearby),
+        (1, products_by_price),
+        (2, nearest_branches),
+        (2, menu),
+        (3, product_detail),
+        (1, vehicle_list),
+        (1, vehicle_crud),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive a running server with concurrent virtual users logging in, "
+        "browsing products near branches, reading menus and product details "
+        "and managing vehicles, then report throughput and latency percentiles "
+        "per endpoint. Expects a dataset from generate_dataset."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--duration", type=float, default=30.0)
+        parser.add_argument("--password", default="loadtest")
+        parser.add_argument("--phone-prefix", default="77")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        data = self.load_data(options)
+        stats = LoadStats()
+
+        def make_user(index):
+            return APIUser(
+                options["base_url"],
+                stats,
+                random.Random(rng.random()),
+                index,
+                data,
+                data["phone_numbers"][index % len(data["phone_numbers"])],
+                options["password"],
+            )
+
+        self.stdout.write(
+            f"Running {options['users']} users against {options['base_url']} "
+            f"for {options['duration']:.0f} s..."
+        )
+        elapsed = asyncio.run(
+            run_load_test(make_user, options["users"], options["duration"])
+        )
+        self.report(stats.summary(elapsed))
+
+    def load_data(self, options):
+        """
+        Ids and positions the scenarios pick from, sampled from the database
+        the server uses.
+        """
+        phone_numbers = [
+            str(phone_number)
+            for phone_number in User.objects.filter(
+                phone_number__startswith=f"+998{options['phone_prefix']}",
+                role=User.ROLE_USER,
+            ).values_list("phone_number", flat=True)[:SAMPLE_SIZE]
+        ]
+        if not phone_numbers:
+            raise CommandError(
+                "No generated users found, run generate_dataset with the same "
+                "--phone-prefix first."
+            )
+        models = Model.objects.filter(user__isnull=True).values_list("id", "brand_id")
+        branches = Branch.objects.filter(
+            is_active=True, shop__is_active=True, latitude__isnull=False
+        ).values_list("shop_id", "latitude", "longitude")[:SAMPLE_SIZE]
+        return {
+            "phone_numbers": phone_numbers,
+            "positions": [
+                (float(latitude), float(longitude))
+                for _, latitude, longitude in branches
+            ],
+            "shops": sorted({shop_id for shop_id, _, _ in branches}),
+            "products": list(
+                Product.objects.filter(shop__is_active=True)
+                .order_by("?")
+                .values_list("id", flat=True)[:SAMPLE_SIZE]
+            ),
+            "categories": list(
+                Category.objects.filter(is_active=True).values_list("id", flat=True)
+            ),
+            "models": list(models[:SAMPLE_SIZE]),
+            "colors": list(
+                Color.objects.filter(user__isnull=True).values_list("id", flat=True)
+            ),
+        }
+
+    def report(self, rows):
+        self.stdout.write(
+            f"{'endpoint':<20}{'requests':>10}{'failures':>10}{'req/s':>9}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        )
+        for row in rows:
+            self.stdout.write(
+                f"{row['name']:<20}{row['requests']:>10}{row['failures']:>10}"
+                f"{row['throughput']:>9.1f}{row['p50']:>9.1f}{row['p95']:>9.1f}"
+                f"{row['p99']:>9.1f}"
+            )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from products.detail_cache import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = "Show the hit rate of the product detail cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Reset the counters afterwards."
+        )
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        hit_rate = stats["hit_rate"]
+        self.stdout.write(
+            f"hits={stats['hits']} misses={stats['misses']} "
+            f"hit_rate={'n/a' if hit_rate is None else f'{hit_rate:.1%}'}"
+        )
+        if options["reset"]:
+            reset_stats()
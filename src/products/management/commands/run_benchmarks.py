@@ -0,0 +1,124 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.module_loading import autodiscover_modules
+
+from config.benchmarks import (
+    compare,
+    load_baseline,
+    measure,
+    registry,
+    save_baseline,
+    summarize,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the micro-benchmarks of every app's benchmarks module on a "
+        "generated dataset, rolled back afterwards. Save the results as a "
+        "baseline with --save, and compare a later run with --compare to flag "
+        "medians that got slower by more than --threshold percent."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 10000])
+        parser.add_argument(
+            "--dataset-size",
+            type=int,
+            default=10000,
+            help="Rows per table of the generated dataset. Keep it the same "
+            "between a baseline and the runs compared with it.",
+        )
+        parser.add_argument(
+            "--filter", default="", help="Only run benchmarks with this in the name"
+        )
+        parser.add_argument("--rounds", type=int, default=7)
+        parser.add_argument(
+            "--min-time",
+            type=float,
+            default=0.05,
+            help="Minimum duration of one round in seconds",
+        )
+        parser.add_argument("--save", metavar="PATH")
+        parser.add_argument("--compare", metavar="PATH")
+        parser.add_argument("--threshold", type=float, default=10.0)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        autodiscover_modules("benchmarks")
+        benchmarks = [
+            benchmark
+            for name, benchmark in sorted(registry.items())
+            if options["filter"] in name
+        ]
+        if not benchmarks:
+            raise CommandError("No benchmarks match the filter.")
+        if max(options["sizes"]) > options["dataset_size"]:
+            raise CommandError("--dataset-size must be at least the largest size.")
+        baseline = load_baseline(options["compare"]) if options["compare"] else None
+
+        with transaction.atomic():
+            self.create_dataset(options["dataset_size"], options["seed"])
+            results = {}
+            for benchmark in benchmarks:
+                sizes = options["sizes"] if benchmark.sized else [None]
+                for size in sizes:
+                    name = benchmark.name
+                    if size is None:
+                        run = benchmark.setup()
+                    else:
+                        name = f"{name}[{size}]"
+                        run = benchmark.setup(size)
+                    results[name] = summarize(
+                        measure(run, options["rounds"], options["min_time"])
+                    )
+                    self.stdout.write(
+                        f"{name:<50} median {results[name]['median_ms']:>10.3f} ms"
+                        f"  min {results[name]['min_ms']:>10.3f} ms"
+                    )
+            transaction.set_rollback(True)
+
+        if options["save"]:
+            save_baseline(options["save"], results)
+            self.stdout.write(f"Baseline saved to {options['save']}.")
+        if baseline is not None:
+            self.report(compare(results, baseline, options["threshold"]), options)
+
+    def create_dataset(self, size, seed):
+        self.stdout.write(f"Generating a dataset of about {size} rows per table...")
+        call_command(
+            "generate_dataset",
+            users=size,
+            owners=max(size // 200, 1),
+            shops=max(size // 5, 1),
+            branches_per_shop=9,
+            products=size,
+            vehicles_per_user=2,
+            phone_prefix="79",
+            seed=seed,
+            stdout=StringIO(),
+        )
+
+    def report(self, rows, options):
+        self.stdout.write(
+            f"\n{'benchmark':<50}{'median ms':>12}{'baseline ms':>13}{'change':>9}"
+        )
+        for name, median, before, change, status in rows:
+            before = "-" if before is None else f"{before:.3f}"
+            change = "-" if change is None else f"{change:+.1f}%"
+            line = f"{name:<50}{median:>12.3f}{before:>13}{change:>9}  {status}"
+            if status == "regression":
+                line = self.style.ERROR(line)
+            elif status == "improvement":
+                line = self.style.SUCCESS(line)
+            self.stdout.write(line)
+
+        regressions = sum(row[4] == "regression" for row in rows)
+        if regressions:
+            raise CommandError(
+                f"{regressions} benchmarks are more than {options['threshold']:g}% "
+                "slower than the baseline."
+            )
@@ -0,0 +1,134 @@
+import json
+import logging
+
+import redis
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from config.metrics import InstrumentedRedis
+from config.replicas import read_from_primary
+
+from .models import Category, OptionGroup, Product, ProductOption
+from .serializers import MenuOptionGroupSerializer, MenuProductSerializer
+
+logger = logging.getLogger(__name__)
+
+redis_instance = InstrumentedRedis(
+    host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0
+)
+
+MENU_CACHE_TIMEOUT = 60 * 60
+# Incremented by every invalidation, see cache_menu().
+GENERATION_KEY = "products:menu:generation"
+
+
+def menu_cache_key(shop_id, language):
+    return f"products:menu:{shop_id}:{language}"
+
+
+def build_menu(shop):
+    """
+    Categories with their products, and a lookup table of the option groups
+    the products refer to by id. Shared option groups are listed once.
+    Product images are paths, as the menu is cached for every host.
+
+    Runs the same four queries whatever the size of the menu: the products
+    with their categories, their option group ids, the option groups and
+    their options.
+    """
+    products = list(
+        Product.objects.filter(shop=shop)
+        .select_related("category")
+        .order_by("category_id", "id")
+    )
+    option_group_ids = {product.id: [] for product in products}
+    for product_id, option_group_id in ProductOption.objects.filter(
+        product__shop=shop
+    ).values_list("product_id", "option_group_id"):
+        option_group_ids[product_id].append(option_group_id)
+    option_groups = OptionGroup.objects.filter(
+        id__in={group_id for ids in option_group_ids.values() for group_id in ids}
+    ).prefetch_related("options")
+
+    categories = {}
+    for product in products:
+        if product.category is not None and not product.category.is_active:
+            continue
+        product.option_group_ids = option_group_ids[product.id]
+        category = product.category or Category(name=None)
+        categories.setdefault(category.id, (category, []))[1].append(product)
+
+    return {
+        "shop": {"id": shop.id, "name": shop.name},
+        "categories": [
+            {
+                "id": category.id,
+                "name": category.name,
+                "parent": category.parent_id,
+                "products": MenuProductSerializer(category_products, many=True).data,
+            }
+            for category, category_products in categories.values()
+        ],
+        "option_groups": {
+            str(group["id"]): group
+            for group in MenuOptionGroupSerializer(option_groups, many=True).data
+        },
+    }
+
+
+def get_menu(shop, language):
+    """
+    The shop's menu, rendered once per language and kept in Redis until a
+    product, option or category of the shop changes.
+    """
+    key = menu_cache_key(shop.id, language)
+    try:
+        cached, generation = redis_instance.mget(key, GENERATION_KEY)
+    except redis.RedisError:
+        logger.exception("Could not read cached menu")
+        return build_menu(shop)
+    if cached is not None:
+        return json.loads(cached)
+
+    with read_from_primary():
+        # The shop may have been read from a replica.
+        shop.refresh_from_db(fields=["name"])
+        menu = build_menu(shop)
+    cache_menu(key, menu, generation or b"0")
+    return menu
+
+
+def cache_menu(key, menu, generation):
+    """
+    Cache a menu built after reading ``generation``, unless menus were
+    invalidated since, as in ``products.detail_cache.cache_detail()``.
+    """
+    try:
+        with redis_instance.pipeline() as pipeline:
+            pipeline.watch(GENERATION_KEY)
+            if (pipeline.get(GENERATION_KEY) or b"0") != generation:
+                return
+            pipeline.multi()
+            pipeline.set(key, json.dumps(menu, cls=JSONEncoder), ex=MENU_CACHE_TIMEOUT)
+            pipeline.execute()
+    except redis.WatchError:
+        # Invalidated while caching.
+        pass
+    except redis.RedisError:
+        logger.exception("Could not cache menu")
+
+
+def invalidate_menus(shop_ids):
+    keys = [
+        menu_cache_key(shop_id, language)
+        for shop_id in set(shop_ids)
+        for language, _ in settings.LANGUAGES
+    ]
+    if not keys:
+        return
+    try:
+        # Before deleting, so that no menu built from the old rows is cached.
+        redis_instance.incr(GENERATION_KEY)
+        redis_instance.delete(*keys)
+    except redis.RedisError:
+        logger.exception("Could not invalidate cached menus")
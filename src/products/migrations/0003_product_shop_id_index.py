@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-19 10:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("products", "0002_product_updated_at"),
+        ("shops", "0002_active_indexes"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="product",
+            index=models.Index(
+                fields=["shop", "id"], name="products_product_shop_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.1.2 on 2026-10-19 10:40
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0003_product_shop_id_index"),
+        ("shops", "0004_branch_location_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductListing",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="listing",
+                        serialize=False,
+                        to="products.product",
+                    ),
+                ),
+                ("title", models.CharField(max_length=255)),
+                ("description", models.TextField(blank=True, null=True)),
+                (
+                    "image",
+                    models.ImageField(
+                        blank=True, null=True, upload_to="products/images/"
+                    ),
+                ),
+                ("price", models.DecimalField(decimal_places=2, max_digits=10)),
+                ("shop_name", models.CharField(max_length=255)),
+                ("shop_is_active", models.BooleanField()),
+                (
+                    "category_name",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                ("category_path", models.TextField(blank=True, null=True)),
+                ("min_price", models.DecimalField(decimal_places=2, max_digits=10)),
+                ("max_price", models.DecimalField(decimal_places=2, max_digits=10)),
+                (
+                    "geo_cells",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.BigIntegerField(), default=list, size=None
+                    ),
+                ),
+                (
+                    "branch_vectors",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=django.contrib.postgres.fields.ArrayField(
+                            base_field=models.FloatField(), size=3
+                        ),
+                        default=list,
+                        size=None,
+                    ),
+                ),
+                (
+                    "category",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="products.category",
+                    ),
+                ),
+                (
+                    "shop",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="shops.shop",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("shop_is_active", True)),
+                        fields=["shop", "product"],
+                        name="products_listing_shop_idx",
+                    ),
+                    models.Index(
+                        condition=models.Q(("shop_is_active", True)),
+                        fields=["category", "product"],
+                        name="products_listing_category_idx",
+                    ),
+                    django.contrib.postgres.indexes.GinIndex(
+                        fields=["geo_cells"], name="products_listing_cells_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
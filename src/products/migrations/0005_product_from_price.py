@@ -0,0 +1,58 @@
+# Generated by Django 5.1.2 on 2026-10-19 14:10
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_from_prices(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    Option = apps.get_model("products", "Option")
+    ProductOption = apps.get_model("products", "ProductOption")
+    cheapest = (
+        Option.objects.filter(group=OuterRef("option_group"))
+        .values("group")
+        .annotate(low=Min("price_adjustment"))
+        .values("low")
+    )
+    total = (
+        ProductOption.objects.filter(
+            product=OuterRef("pk"), option_group__is_required=True
+        )
+        .annotate(low=Subquery(cheapest))
+        .values("product")
+        .annotate(total=Sum("low"))
+        .values("total")
+    )
+    Product.objects.update(
+        from_price=F("price")
+        + Coalesce(
+            Subquery(total),
+            Value(Decimal(0)),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0004_product_listing"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="from_price",
+            field=models.DecimalField(
+                decimal_places=2, editable=False, max_digits=10, null=True
+            ),
+        ),
+        migrations.RunPython(populate_from_prices, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="product",
+            name="from_price",
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=10),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.2 on 2026-10-19 14:15
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("products", "0005_product_from_price"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="product",
+            index=models.Index(
+                fields=["from_price", "id"], name="products_product_price_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="productlisting",
+            index=models.Index(
+                condition=models.Q(("shop_is_active", True)),
+                fields=["min_price", "product"],
+                name="products_listing_price_idx",
+            ),
+        ),
+    ]
@@ -1,7 +1,11 @@
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 
 from shops.models import Shop
 
+from .querysets import ProductListingQuerySet
+
 
 class Category(models.Model):
     """
@@ -32,10 +36,29 @@ class Product(models.Model):
     category = models.ForeignKey(
         Category, on_delete=models.SET_NULL, null=True, blank=True
     )
+    # Base price plus the cheapest option of each required group, kept up to
+    # date by products.signals.
+    from_price = models.DecimalField(max_digits=10, decimal_places=2, editable=False)
+    # Also bumped by products.signals when the product's options change.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["shop", "id"], name="products_product_shop_id_idx"),
+            models.Index(
+                fields=["from_price", "id"], name="products_product_price_idx"
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            # No options are linked yet.
+            self.from_price = self.price
+        super().save(*args, **kwargs)
+
 
 class OptionGroup(models.Model):
     """
@@ -81,3 +104,61 @@ class ProductOption(models.Model):
 
     def __str__(self):
         return f"{self.product.title} - {self.option_group.name}"
+
+
+class ProductListing(models.Model):
+    """
+    Read model of the product list: one row per product with everything the
+    listing shows or filters on, so it is served without joins.
+
+    Kept in sync by products.signals inside the writing transaction, see
+    products.listing.
+    """
+
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name="listing"
+    )
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="+")
+    category = models.ForeignKey(
+        Category, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    title = models.CharField(max_length=255)
+    description = models.TextField(blank=True, null=True)
+    image = models.ImageField(upload_to="products/images/", blank=True, null=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    shop_name = models.CharField(max_length=255)
+    shop_is_active = models.BooleanField()
+    category_name = models.CharField(max_length=255, blank=True, null=True)
+    # Names from the root category down, e.g. "Coffee / Cappuccino".
+    category_path = models.TextField(blank=True, null=True)
+    # Product.from_price, and the base price with the dearest option choices.
+    min_price = models.DecimalField(max_digits=10, decimal_places=2)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Grid cells and unit vectors of the shop's active branches.
+    geo_cells = ArrayField(models.BigIntegerField(), default=list)
+    branch_vectors = ArrayField(ArrayField(models.FloatField(), size=3), default=list)
+
+    objects = ProductListingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["shop", "product"],
+                name="products_listing_shop_idx",
+                condition=models.Q(shop_is_active=True),
+            ),
+            models.Index(
+                fields=["category", "product"],
+                name="products_listing_category_idx",
+                condition=models.Q(shop_is_active=True),
+            ),
+            models.Index(
+                fields=["min_price", "product"],
+                name="products_listing_price_idx",
+                condition=models.Q(shop_is_active=True),
+            ),
+            GinIndex(fields=["geo_cells"], name="products_listing_cells_idx"),
+        ]
+
+    def __str__(self):
+        return self.title
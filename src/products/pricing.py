@@ -0,0 +1,40 @@
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Option, ProductOption
+
+
+def required_options_price():
+    """
+    Cost of the cheapest option of every required group of the outer
+    product. Groups without options add nothing.
+    """
+    cheapest = (
+        Option.objects.filter(group=OuterRef("option_group"))
+        .values("group")
+        .annotate(low=Min("price_adjustment"))
+        .values("low")
+    )
+    total = (
+        ProductOption.objects.filter(
+            product=OuterRef("pk"), option_group__is_required=True
+        )
+        .annotate(low=Subquery(cheapest))
+        .values("product")
+        .annotate(total=Sum("low"))
+        .values("total")
+    )
+    return Coalesce(
+        Subquery(total),
+        Value(Decimal(0)),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def update_from_prices(queryset):
+    """
+    Recompute ``from_price`` of the given products in one UPDATE.
+    """
+    queryset.update(from_price=F("price") + required_options_price())
@@ -0,0 +1,40 @@
+import math
+
+from django.conf import settings
+from django.db import models
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+
+from shops.geo import EARTH_RADIUS_KM, grid_cells_within_radius, unit_vector
+
+
+class ProductListingQuerySet(models.QuerySet):
+    def within_radius(self, latitude, longitude, radius_km):
+        """
+        Listings whose shop has an active branch within the radius.
+
+        The GIN index on ``geo_cells`` narrows the rows to the cells around
+        the circle; the stored branch unit vectors then give the exact
+        answer without touching ``shops_branch``.
+        """
+        queryset = self
+        cells = grid_cells_within_radius(
+            latitude, longitude, radius_km, settings.PRODUCT_LISTING_CELL_SIZE
+        )
+        if cells is not None:
+            queryset = queryset.filter(geo_cells__overlap=cells)
+
+        x, y, z = unit_vector(latitude, longitude)
+        min_cosine = math.cos(min(math.pi, radius_km / EARTH_RADIUS_KM))
+        table = self.model._meta.db_table
+        return queryset.filter(
+            RawSQL(
+                "EXISTS (SELECT 1 FROM generate_subscripts("
+                f'"{table}"."branch_vectors", 1) AS i WHERE '
+                f'"{table}"."branch_vectors"[i][1] * %s '
+                f'+ "{table}"."branch_vectors"[i][2] * %s '
+                f'+ "{table}"."branch_vectors"[i][3] * %s >= %s)',
+                (x, y, z, min_cosine),
+                output_field=BooleanField(),
+            )
+        )
@@ -1,6 +1,21 @@
 from rest_framework import serializers
 
-from .models import Category, Option, OptionGroup, Product, ProductOption
+from .models import (
+    Category,
+    Option,
+    OptionGroup,
+    Product,
+    ProductListing,
+    ProductOption,
+)
+
+
+def absolute_image_url(request, url):
+    """
+    The absolute form of an image URL serialized without a request, as for
+    payloads cached for every host.
+    """
+    return url and request.build_absolute_uri(url)
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -20,6 +35,7 @@ class ProductSerializer(serializers.ModelSerializer):
             "title",
             "description",
             "price",
+            "from_price",
             "image",
             "shop_name",
             "category_name",
@@ -60,8 +76,51 @@ class ProductDetailSerializer(serializers.ModelSerializer):
             "title",
             "description",
             "price",
+            "from_price",
             "image",
             "shop_name",
             "category_name",
             "product_options",
         ]
+
+
+class MenuOptionGroupSerializer(OptionGroupSerializer):
+    class Meta(OptionGroupSerializer.Meta):
+        fields = ["id", "name", "is_required", "options"]
+
+
+class MenuProductSerializer(serializers.ModelSerializer):
+    option_groups = serializers.ListField(
+        child=serializers.IntegerField(), source="option_group_ids", read_only=True
+    )
+
+    class Meta:
+        model = Product
+        fields = ["id", "title", "description", "price", "image", "option_groups"]
+
+
+class ProductListingSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source="product_id", read_only=True)
+    from_price = serializers.DecimalField(
+        source="min_price", max_digits=10, decimal_places=2, read_only=True
+    )
+
+    class Meta:
+        model = ProductListing
+        fields = [
+            "id",
+            "title",
+            "description",
+            "price",
+            "from_price",
+            "image",
+            "shop_name",
+            "category_name",
+        ]
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # ProductSerializer leaves the field out for uncategorized products.
+        if instance.category_id is None:
+            data.pop("category_name")
+        return data
@@ -0,0 +1,180 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from shops.events import publish_shop_events
+from shops.models import Branch, Shop
+
+from .detail_cache import invalidate_details
+from .listing import get_category_subtree, refresh_listings, refresh_shop_listings
+from .menu import invalidate_menus
+from .models import (
+    Category,
+    Option,
+    OptionGroup,
+    Product,
+    ProductListing,
+    ProductOption,
+)
+from .pricing import update_from_prices
+
+# Listings carry the positions of the active branches of their shop.
+LISTED_BRANCH_FIELDS = ["shop_id", "latitude", "longitude", "is_active"]
+
+
+def listings_changed(product_ids):
+    """
+    Rebuild the listing rows of the products while the read model is in use.
+    Enabling it later starts with a ``check_product_listings --fix`` backfill.
+    """
+    if settings.PRODUCT_LISTING_READ_MODEL:
+        refresh_listings(product_ids)
+
+
+def shop_listings_changed(shop_ids):
+    if settings.PRODUCT_LISTING_READ_MODEL:
+        refresh_shop_listings(shop_ids)
+
+
+def invalidate_details_on_commit(name, pks):
+    transaction.on_commit(lambda: invalidate_details(name, pks))
+
+
+def menus_changed(shop_ids):
+    """
+    Drop the cached menus of the shops and notify their live event streams,
+    on commit.
+    """
+    transaction.on_commit(lambda: invalidate_menus(shop_ids))
+    if settings.LIVE_EVENTS_ENABLED:
+        transaction.on_commit(lambda: publish_shop_events("menu", shop_ids))
+
+
+def touch_products(queryset):
+    """
+    Bump ``updated_at`` on the given products so conditional GETs revalidate,
+    recompute their ``from_price``, rebuild their listing rows and drop the
+    cached menus of their shops.
+    """
+    queryset.update(updated_at=timezone.now())
+    update_from_prices(queryset)
+    listings_changed(queryset.values_list("id", flat=True))
+    menus_changed(list(queryset.values_list("shop_id", flat=True).distinct()))
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, **kwargs):
+    if not created:
+        # The base price may have changed.
+        update_from_prices(Product.objects.filter(pk=instance.pk))
+    listings_changed([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    # Drop the listing row that option signals may have rebuilt during the
+    # cascade, before the deferred foreign key check at commit.
+    ProductListing.objects.filter(product_id=instance.pk).delete()
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed(sender, instance, **kwargs):
+    invalidate_details_on_commit("product", [instance.pk])
+    menus_changed([instance.shop_id])
+
+
+@receiver([post_save, post_delete], sender=ProductOption)
+def product_option_changed(sender, instance, **kwargs):
+    invalidate_details_on_commit("product", [instance.product_id])
+    touch_products(Product.objects.filter(pk=instance.product_id))
+
+
+@receiver(post_save, sender=OptionGroup)
+def option_group_changed(sender, instance, **kwargs):
+    invalidate_details_on_commit("optiongroup", [instance.pk])
+    touch_products(Product.objects.filter(product_options__option_group=instance))
+
+
+@receiver([post_save, post_delete], sender=Option)
+def option_changed(sender, instance, created=False, **kwargs):
+    if created:
+        invalidate_details_on_commit("optiongroup", [instance.group_id])
+    else:
+        invalidate_details_on_commit("option", [instance.pk])
+    touch_products(
+        Product.objects.filter(product_options__option_group_id=instance.group_id)
+    )
+
+
+@receiver(post_save, sender=Category)
+def category_changed(sender, instance, created, **kwargs):
+    invalidate_details_on_commit("category", [instance.pk])
+    if not created:
+        # Prices are unaffected, so only revalidate the category's own
+        # products; listings show the path from the root, descendants included.
+        products = Product.objects.filter(category=instance)
+        products.update(updated_at=timezone.now())
+        menus_changed(list(products.values_list("shop_id", flat=True).distinct()))
+        listings_changed(
+            Product.objects.filter(
+                category__in=get_category_subtree(instance.pk)
+            ).values_list("id", flat=True)
+        )
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_products(sender, instance, **kwargs):
+    instance._product_ids = list(
+        Product.objects.filter(category=instance).values_list("id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    # Products lose the category through SET_NULL, which sends no signals.
+    invalidate_details_on_commit("category", [instance.pk])
+    listings_changed(getattr(instance, "_product_ids", []))
+
+
+@receiver(post_save, sender=Shop)
+def shop_changed(sender, instance, **kwargs):
+    # Menus and product details embed the shop name.
+    invalidate_details_on_commit("shop", [instance.pk])
+    shop_ids = [instance.pk]
+    transaction.on_commit(lambda: invalidate_menus(shop_ids))
+    shop_listings_changed(shop_ids)
+
+
+@receiver(pre_save, sender=Branch)
+def remember_listed_branch_fields(sender, instance, **kwargs):
+    if settings.PRODUCT_LISTING_READ_MODEL and instance.pk:
+        instance._listed_fields = (
+            Branch.objects.filter(pk=instance.pk)
+            .values_list(*LISTED_BRANCH_FIELDS)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Branch)
+def branch_saved(sender, instance, **kwargs):
+    previous = getattr(instance, "_listed_fields", None)
+    # Coordinates may have been assigned as floats.
+    current = tuple(
+        Branch._meta.get_field(name).to_python(getattr(instance, name))
+        for name in LISTED_BRANCH_FIELDS
+    )
+    # Most saves, such as of the address or time zone, leave listings as they are.
+    if previous == current:
+        return
+    shop_ids = {instance.shop_id}
+    if previous:
+        # A branch moved to another shop leaves the old shop's listings.
+        shop_ids.add(previous[0])
+    shop_listings_changed(sorted(shop_ids))
+
+
+@receiver(post_delete, sender=Branch)
+def branch_deleted(sender, instance, **kwargs):
+    shop_listings_changed([instance.shop_id])
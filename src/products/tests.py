@@ -1,14 +1,43 @@
+import json
+import os
+import tempfile
+from datetime import date, time
+from io import StringIO
+from unittest.mock import patch
+
 from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import LiveServerTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 
-from products.models import Category, Option, OptionGroup, Product, ProductOption
-from shops.models import Branch, Shop
+from config.benchmarks import compare
+from config.testing import LAGGING_REPLICA, explain_without_seqscan, lagging_replica
+from products import detail_cache, facets, menu
+from products.menu import build_menu, get_menu, invalidate_menus
+from products.models import (
+    Category,
+    Option,
+    OptionGroup,
+    Product,
+    ProductListing,
+    ProductOption,
+)
+from shops.models import Branch, OpeningException, OpeningHours, OpeningPeriod, Shop
+from vehicles.models import Brand, Color, Model, Vehicle
 
 User = get_user_model()
 
 
+def clear_detail_cache():
+    keys = detail_cache.redis_instance.keys("products:detail:*")
+    if keys:
+        detail_cache.redis_instance.delete(*keys)
+
+
 class CategoryTests(APITestCase):
     def setUp(self):
         # Create a test user
@@ -36,6 +65,7 @@ class CategoryTests(APITestCase):
 
 class ProductTests(APITestCase):
     def setUp(self):
+        clear_detail_cache()
         # Create a test user
         self.user = User.objects.create_user(
             phone_number="+1234567890", password="password"
@@ -124,6 +154,27 @@ class ProductTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 2)  # Both products are within 10 km radius
 
+    def test_filter_by_radius_excludes_distant_shops(self):
+        """Test that shops without a branch in the radius are left out"""
+        far_shop = Shop.objects.create(name="Far Away", owner=self.user)
+        Branch.objects.create(
+            shop=far_shop, address="Far St", latitude=41.311081, longitude=69.240562
+        )
+        Product.objects.create(title="Far Latte", price=3.00, shop=far_shop)
+        # A second nearby branch must not duplicate the shop's products
+        Branch.objects.create(
+            shop=self.shop, address="125 Test St", latitude=40.7130, longitude=-74.0062
+        )
+        self.client.force_authenticate(user=self.user)
+        url = reverse("product-list")
+        response = self.client.get(
+            url, {"latitude": 40.7128, "longitude": -74.0060, "radius": 10}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        titles = [product["title"] for product in response.data]
+        self.assertEqual(titles, ["Cappuccino", "Americano"])
+
     def test_product_detail(self):
         """Test to retrieve detailed product information with options"""
         self.client.force_authenticate(user=self.user)
@@ -144,6 +195,7 @@ class ProductTests(APITestCase):
 
 class ProductOptionTests(APITestCase):
     def setUp(self):
+        clear_detail_cache()
         # Create a test user
         self.user = User.objects.create_user(
             phone_number="+1234567890", password="password"
@@ -192,3 +244,748 @@ class ProductOptionTests(APITestCase):
         self.assertEqual(
             response.data["product_options"][0]["option_group"]["name"], "Milk Options"
         )
+
+
+class ProductConditionalGetTests(APITestCase):
+    def setUp(self):
+        clear_detail_cache()
+        self.user = User.objects.create_user(
+            phone_number="+1234567890", password="password"
+        )
+        self.shop = Shop.objects.create(
+            name="Test Coffee Shop", is_active=True, owner=self.user
+        )
+        self.product = Product.objects.create(title="Latte", price=4.50, shop=self.shop)
+        self.option_group = OptionGroup.objects.create(name="Milk Options")
+        self.option = Option.objects.create(
+            name="Oat Milk", price_adjustment=0.60, group=self.option_group
+        )
+        ProductOption.objects.create(
+            product=self.product, option_group=self.option_group
+        )
+        self.url = reverse("product-detail", args=[self.product.id])
+        self.client.force_authenticate(user=self.user)
+
+    def test_not_modified_skips_fetch_and_serialization(self):
+        """Test that a 304 costs a single query and no serialization"""
+        with CaptureQueriesContext(connection) as full:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+
+        with patch(
+            "products.views.ProductDetailSerializer.to_representation"
+        ) as to_representation, CaptureQueriesContext(connection) as conditional:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+        to_representation.assert_not_called()
+        # One validator lookup replaces the product fetch and its prefetches.
+        self.assertEqual(len(conditional), 1)
+        self.assertGreater(len(full), len(conditional))
+
+    def test_if_modified_since(self):
+        response = self.client.get(self.url)
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_option_change_invalidates_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.option.price_adjustment = 0.70
+        self.option.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class ProductDetailCacheTests(APITestCase):
+    def setUp(self):
+        clear_detail_cache()
+        self.user = User.objects.create_user(
+            phone_number="+1234567890", password="password"
+        )
+        self.shop = Shop.objects.create(name="Test Coffee Shop", owner=self.user)
+        self.milk = OptionGroup.objects.create(name="Milk")
+        self.oat = Option.objects.create(group=self.milk, name="Oat")
+        self.syrup = OptionGroup.objects.create(name="Syrup")
+        self.latte = Product.objects.create(title="Latte", price=4.50, shop=self.shop)
+        self.mocha = Product.objects.create(title="Mocha", price=5.00, shop=self.shop)
+        ProductOption.objects.create(product=self.latte, option_group=self.milk)
+        ProductOption.objects.create(product=self.mocha, option_group=self.syrup)
+        self.client.force_authenticate(user=self.user)
+
+    def get(self, product):
+        return self.client.get(reverse("product-detail", args=[product.id]))
+
+    def test_detail_served_from_cache(self):
+        first = self.get(self.latte)
+        with CaptureQueriesContext(connection) as cached:
+            second = self.get(self.latte)
+        self.assertEqual(second.data, first.data)
+        # Only the conditional GET validator lookup is left.
+        self.assertEqual(len(cached), 1)
+
+        stats = detail_cache.get_stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_option_change_invalidates_only_dependent_products(self):
+        self.get(self.latte)
+        self.get(self.mocha)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.oat.name = "Oat Milk"
+            self.oat.save()
+
+        language = "en"
+        self.assertIsNone(
+            detail_cache.redis_instance.get(
+                detail_cache.entry_key(self.latte.id, language)
+            )
+        )
+        self.assertIsNotNone(
+            detail_cache.redis_instance.get(
+                detail_cache.entry_key(self.mocha.id, language)
+            )
+        )
+        options = self.get(self.latte).data["product_options"][0]["option_group"]
+        self.assertEqual(options["options"][0]["name"], "Oat Milk")
+
+    def test_new_option_and_shop_rename_invalidate(self):
+        self.get(self.mocha)
+        with self.captureOnCommitCallbacks(execute=True):
+            Option.objects.create(group=self.syrup, name="Vanilla")
+        options = self.get(self.mocha).data["product_options"][0]["option_group"]
+        self.assertEqual(len(options["options"]), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shop.name = "Renamed"
+            self.shop.save()
+        self.assertEqual(self.get(self.mocha).data["shop_name"], "Renamed")
+
+    def test_hidden_product_not_served_from_cache(self):
+        self.get(self.latte)
+        # Bulk updates skip the signals that would invalidate the entry.
+        Shop.objects.filter(pk=self.shop.pk).update(is_active=False)
+        self.assertEqual(self.get(self.latte).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalidation_while_building_wins(self):
+        data, generation = detail_cache.get_cached_detail(self.latte.id, "en")
+        self.assertIsNone(data)
+        # The option changes after the request has read the old rows.
+        detail_cache.invalidate_details("option", [self.oat.id])
+        detail_cache.cache_detail(self.latte, "en", {"title": "Latte"}, generation)
+        self.assertIsNone(detail_cache.get_cached_detail(self.latte.id, "en")[0])
+
+        _, generation = detail_cache.get_cached_detail(self.latte.id, "en")
+        detail_cache.cache_detail(self.latte, "en", {"title": "Latte"}, generation)
+        self.assertEqual(
+            detail_cache.get_cached_detail(self.latte.id, "en")[0], {"title": "Latte"}
+        )
+
+    @override_settings(ALLOWED_HOSTS=["cafe.example", "api.example"])
+    def test_image_url_follows_request_host(self):
+        Product.objects.filter(pk=self.latte.pk).update(image="products/latte.jpg")
+        url = reverse("product-detail", args=[self.latte.id])
+        for host in ("cafe.example", "api.example", "cafe.example"):
+            response = self.client.get(url, HTTP_HOST=host)
+            self.assertEqual(
+                response.data["image"], f"http://{host}/media/products/latte.jpg"
+            )
+
+
+@override_settings(PRODUCT_LISTING_READ_MODEL=True)
+class ProductListingTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            phone_number="+1234567890", password="password"
+        )
+        self.shop = Shop.objects.create(name="Test Coffee Shop", owner=self.user)
+        self.branch = Branch.objects.create(
+            shop=self.shop, address="123 Test St", latitude=40.7128, longitude=-74.0060
+        )
+        self.far_shop = Shop.objects.create(name="Far Away", owner=self.user)
+        Branch.objects.create(
+            shop=self.far_shop,
+            address="Far St",
+            latitude=41.311081,
+            longitude=69.240562,
+        )
+        self.coffee = Category.objects.create(name="Coffee")
+        self.espresso = Category.objects.create(name="Espresso", parent=self.coffee)
+        self.product = Product.objects.create(
+            title="Doppio", price=3.00, shop=self.shop, category=self.espresso
+        )
+        Product.objects.create(title="Far Latte", price=4.00, shop=self.far_shop)
+        self.size = OptionGroup.objects.create(name="Size", is_required=True)
+        self.large = Option.objects.create(
+            group=self.size, name="Large", price_adjustment=1.00
+        )
+        Option.objects.create(group=self.size, name="Huge", price_adjustment=1.50)
+        syrup = OptionGroup.objects.create(name="Syrup")
+        Option.objects.create(group=syrup, name="Vanilla", price_adjustment=0.40)
+        ProductOption.objects.create(product=self.product, option_group=self.size)
+        ProductOption.objects.create(product=self.product, option_group=syrup)
+        self.client.force_authenticate(user=self.user)
+
+    def test_listing_built_from_source_tables(self):
+        listing = ProductListing.objects.get(product=self.product)
+        self.assertEqual(listing.shop_name, "Test Coffee Shop")
+        self.assertEqual(listing.category_path, "Coffee / Espresso")
+        # A size is required, the syrup is not.
+        self.assertEqual(str(listing.min_price), "4.00")
+        self.assertEqual(str(listing.max_price), "4.90")
+        self.assertEqual(len(listing.geo_cells), 1)
+        self.assertEqual(len(listing.branch_vectors), 1)
+
+    def test_listing_follows_changes(self):
+        self.large.price_adjustment = 0.50
+        self.large.save()
+        self.shop.name = "Renamed"
+        self.shop.save()
+        self.coffee.name = "Hot Coffee"
+        self.coffee.save()
+        self.branch.is_active = False
+        self.branch.save()
+
+        listing = ProductListing.objects.get(product=self.product)
+        self.assertEqual(str(listing.min_price), "3.50")
+        self.assertEqual(listing.shop_name, "Renamed")
+        self.assertEqual(listing.category_path, "Hot Coffee / Espresso")
+        self.assertEqual(listing.branch_vectors, [])
+
+        product_id = self.product.pk
+        self.product.delete()
+        self.assertFalse(ProductListing.objects.filter(product_id=product_id).exists())
+
+    def test_branch_saves_outside_listings_skip_rebuild(self):
+        with patch("products.signals.refresh_shop_listings") as refresh:
+            self.branch.address = "125 Test St"
+            self.branch.save()
+            refresh.assert_not_called()
+            self.branch.latitude = 40.72
+            self.branch.save()
+            refresh.assert_called_once_with([self.shop.id])
+
+    def test_category_rename_rebuilds_subtree_once(self):
+        with (
+            patch("products.signals.refresh_listings") as refresh,
+            patch("products.signals.update_from_prices") as update_prices,
+        ):
+            self.coffee.name = "Hot Coffee"
+            self.coffee.save()
+        refresh.assert_called_once()
+        self.assertEqual(list(refresh.call_args.args[0]), [self.product.id])
+        update_prices.assert_not_called()
+
+    @override_settings(PRODUCT_LISTING_READ_MODEL=False)
+    def test_listings_not_maintained_while_disabled(self):
+        product = Product.objects.create(title="Lungo", price=3.00, shop=self.shop)
+        self.assertFalse(ProductListing.objects.filter(product=product).exists())
+
+    def test_read_model_matches_product_list(self):
+        url = reverse("product-list")
+        for params in [{}, {"latitude": 40.7128, "longitude": -74.0060, "radius": 10}]:
+            with override_settings(PRODUCT_LISTING_READ_MODEL=False):
+                expected = self.client.get(url, params).data
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params)
+            self.assertEqual(response.data, expected)
+            self.assertNotIn("JOIN", queries[-1]["sql"])
+        self.assertEqual([product["title"] for product in expected], ["Doppio"])
+
+    def test_radius_uses_cell_index(self):
+        queryset = ProductListing.objects.within_radius(40.7128, -74.0060, 10)
+        self.assertIn("products_listing_cells_idx", explain_without_seqscan(queryset))
+
+    def test_consistency_check(self):
+        call_command("check_product_listings", stdout=StringIO())
+
+        # Bulk updates bypass the signals.
+        Product.objects.filter(pk=self.product.pk).update(title="Ristretto")
+        with self.assertRaises(CommandError):
+            call_command("check_product_listings", stdout=StringIO())
+
+        out = StringIO()
+        call_command("check_product_listings", "--fix", stdout=out)
+        self.assertIn("1 stale listings", out.getvalue())
+        self.assertEqual(
+            ProductListing.objects.get(product=self.product).title, "Ristretto"
+        )
+        call_command("check_product_listings", stdout=StringIO())
+
+
+@override_settings(PRODUCT_LISTING_READ_MODEL=True)
+class PriceFilterTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            phone_number="+1234567890", password="password"
+        )
+        self.shop = Shop.objects.create(name="Test Coffee Shop", owner=self.user)
+        self.espresso = Product.objects.create(
+            title="Espresso", price=2.00, shop=self.shop
+        )
+        self.latte = Product.objects.create(title="Latte", price=3.00, shop=self.shop)
+        self.mocha = Product.objects.create(title="Mocha", price=3.20, shop=self.shop)
+        self.milk = OptionGroup.objects.create(name="Milk", is_required=True)
+        self.oat = Option.objects.create(
+            group=self.milk, name="Oat", price_adjustment=0.80
+        )
+        Option.objects.create(group=self.milk, name="Soy", price_adjustment=0.60)
+        syrup = OptionGroup.objects.create(name="Syrup")
+        Option.objects.create(group=syrup, name="Vanilla", price_adjustment=0.40)
+        self.latte_milk = ProductOption.objects.create(
+            product=self.latte, option_group=self.milk
+        )
+        ProductOption.objects.create(product=self.latte, option_group=syrup)
+        self.client.force_authenticate(user=self.user)
+
+    def from_price(self, product):
+        product.refresh_from_db()
+        return str(product.from_price)
+
+    def test_from_price_includes_required_options(self):
+        self.assertEqual(self.from_price(self.espresso), "2.00")
+        self.assertEqual(self.from_price(self.latte), "3.60")
+
+    def test_from_price_follows_changes(self):
+        Option.objects.filter(name="Soy").delete()
+        self.assertEqual(self.from_price(self.latte), "3.80")
+
+        self.oat.price_adjustment = 0.70
+        self.oat.save()
+        self.assertEqual(self.from_price(self.latte), "3.70")
+
+        self.latte.price = 3.10
+        self.latte.save()
+        self.assertEqual(self.from_price(self.latte), "3.80")
+
+        self.milk.is_required = False
+        self.milk.save()
+        self.assertEqual(self.from_price(self.latte), "3.10")
+
+        self.milk.is_required = True
+        self.milk.save()
+        self.latte_milk.delete()
+        self.assertEqual(self.from_price(self.latte), "3.10")
+
+    def test_filter_and_sort_by_price(self):
+        url = reverse("product-list")
+        params = {"min_price": "3.10", "max_price": "4", "ordering": "-price"}
+        for read_model in (False, True):
+            with override_settings(PRODUCT_LISTING_READ_MODEL=read_model):
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(
+                [
+                    (product["title"], product["from_price"])
+                    for product in response.data
+                ],
+                [("Latte", "3.60"), ("Mocha", "3.20")],
+            )
+
+        response = self.client.get(url, {"ordering": "price", "min_price": "x"})
+        self.assertEqual(
+            [product["title"] for product in response.data],
+            ["Espresso", "Mocha", "Latte"],
+        )
+
+    def test_price_filter_uses_index(self):
+        plan = explain_without_seqscan(
+            Product.objects.filter(from_price__gte=3).order_by("from_price", "id")
+        )
+        self.assertIn("products_product_price_idx", plan)
+
+
+@override_settings(PRODUCT_LISTING_READ_MODEL=True)
+class OpenBranchFilterTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            phone_number="+1234567890", password="password"
+        )
+        # The near branch of this shop is closed, its far one open.
+        self.shop = Shop.objects.create(name="Test Coffee Shop", owner=self.user)
+        near = Branch.objects.create(
+            shop=self.shop, address="Near", latitude=41.311, longitude=69.24
+        )
+        far = Branch.objects.create(
+            shop=self.shop, address="Far", latitude=39.65, longitude=66.96
+        )
+        self.other_shop = Shop.objects.create(name="Tea House", owner=self.user)
+        other = Branch.objects.create(
+            shop=self.other_shop, address="Other", latitude=41.32, longitude=69.25
+        )
+        OpeningHours.objects.create(
+            branch=near, weekday=0, opens=time(20), closes=time(22)
+        )
+        for branch in (far, other):
+            OpeningHours.objects.create(
+                branch=branch, weekday=0, opens=time(9), closes=time(18)
+            )
+        OpeningException.objects.create(branch=other, date=date(2026, 10, 19))
+        Product.objects.create(title="Latte", price=4.00, shop=self.shop)
+        Product.objects.create(title="Green Tea", price=2.00, shop=self.other_shop)
+        self.client.force_authenticate(user=self.user)
+
+    def titles(self, params):
+        response = self.client.get(reverse("product-list"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [product["title"] for product in response.data]
+
+    def test_open_at(self):
+        monday = "2026-10-26T10:00:00+05:00"
+        self.assertEqual(self.titles({"open_at": monday}), ["Latte", "Green Tea"])
+        self.assertEqual(
+            self.titles({"open_at": "2026-10-19T10:00:00+05:00"}), ["Latte"]
+        )
+        self.assertEqual(self.titles({"open_at": "2026-10-20T10:00:00+05:00"}), [])
+
+    def test_open_within_radius(self):
+        params = {"latitude": 41.311, "longitude": 69.24, "radius": 5}
+        # The shop's open branch is far away.
+        for read_model in (False, True):
+            with override_settings(
+                PRODUCT_LISTING_READ_MODEL=read_model, GEO_TILE_CACHE_ENABLED=True
+            ):
+                self.assertEqual(
+                    self.titles({**params, "open_at": "2026-10-26T10:00:00+05:00"}),
+                    ["Green Tea"],
+                )
+                self.assertEqual(
+                    self.titles({**params, "open_at": "2026-10-26T21:00:00+05:00"}),
+                    ["Latte"],
+                )
+
+
+class LaggingReplicaCacheTests(APITestCase):
+    """
+    Shared caches are filled from the primary, even when the request reads
+    from a replica that has not replayed the latest writes yet.
+    """
+
+    def setUp(self):
+        clear_detail_cache()
+        self.user = User.objects.create_user(
+            phone_number="+1234567890", password="password"
+        )
+        self.shop = Shop.objects.create(name="Test Coffee Shop", owner=self.user)
+        invalidate_menus([self.shop.id])
+        self.product = Product.objects.create(title="Latte", price=4.50, shop=self.shop)
+        self.client.force_authenticate(user=self.user)
+
+    def test_detail(self):
+        url = reverse("product-detail", args=[self.product.id])
+        with lagging_replica(), patch(
+            "config.replicas.get_read_alias", return_value=LAGGING_REPLICA
+        ):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(url).data["title"], "Latte")
+
+    def test_menu(self):
+        stale_shop = Shop(pk=self.shop.pk, name="Old name")
+        with lagging_replica():
+            data = get_menu(stale_shop, "en")
+        self.assertEqual(data["shop"]["name"], "Test Coffee Shop")
+        self.assertEqual(len(data["categories"][0]["products"]), 1)
+
+    def test_facets(self):
+        params = {"shop": str(self.shop.id)}
+        facets.redis_instance.delete(facets.facets_cache_key(params))
+        with lagging_replica():
+            data = facets.get_facets(
+                Product.objects.filter(shop=self.shop), "from_price", params
+            )
+        self.assertEqual(
+            data["shops"],
+            [{"id": self.shop.id, "name": "Test Coffee Shop", "count": 1}],
+        )
+
+
+@override_settings(PRODUCT_LISTING_READ_MODEL=True)
+class ProductFacetTests(APITestCase):
+    def setUp(self):
+        keys = facets.redis_instance.keys("products:facets:*")
+        if keys:
+            facets.redis_instance.delete(*keys)
+        self.user = User.objects.create_user(
+            phone_number="+1234567890", password="password"
+        )
+        self.shop = Shop.objects.create(name="Coffee Shop", owner=self.user)
+        self.other_shop = Shop.objects.create(name="Tea House", owner=self.user)
+        self.drinks = Category.objects.create(name="Drinks")
+        self.coffee = Category.objects.create(name="Coffee", parent=self.drinks)
+        self.tea = Category.objects.create(name="Tea", parent=self.drinks)
+        for price in (2.50, 4.00, 6.00):
+            Product.objects.create(
+                title="Coffee", price=price, shop=self.shop, category=self.coffee
+            )
+        Product.objects.create(
+            title="Tea", price=3.00, shop=self.other_shop, category=self.tea
+        )
+        Product.objects.create(title="Cookie", price=1.00, shop=self.other_shop)
+        self.url = reverse("product-list")
+        self.client.force_authenticate(user=self.user)
+
+    def test_facet_counts(self):
+        for read_model in (False, True):
+            with override_settings(PRODUCT_LISTING_READ_MODEL=read_model):
+                response = self.client.get(self.url, {"facets": "true"})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.data["results"]), 5)
+            data = response.data["facets"]
+            self.assertEqual(
+                [
+                    (category["name"], category["count"])
+                    for category in data["categories"]
+                ],
+                [("Drinks", 4), ("Coffee", 3), ("Tea", 1)],
+            )
+            self.assertEqual(
+                [(shop["name"], shop["count"]) for shop in data["shops"]],
+                [("Coffee Shop", 3), ("Tea House", 2)],
+            )
+            self.assertEqual(
+                [(bucket["from"], bucket["count"]) for bucket in data["prices"]],
+                [("0.00", 4), ("5.00", 1)],
+            )
+
+    def test_facets_follow_filters_in_one_query(self):
+        params = {"facets": "1", "shop": self.shop.id, "max_price": 5}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        self.assertEqual(
+            [shop["count"] for shop in response.data["facets"]["shops"]], [2]
+        )
+        aggregates = [query for query in queries if "GROUPING SETS" in query["sql"]]
+        self.assertEqual(len(aggregates), 1)
+
+        # Cached for the same filters, whatever the ordering.
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url, {**params, "ordering": "price"})
+        self.assertFalse(any("GROUPING SETS" in query["sql"] for query in queries))
+
+    def test_list_unchanged_without_facets(self):
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data), 5)
+
+
+class ShopMenuTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            phone_number="+1234567890", password="password"
+        )
+        self.shop = Shop.objects.create(name="Test Coffee Shop", owner=self.user)
+        invalidate_menus([self.shop.id])
+        self.coffee = Category.objects.create(name="Coffee")
+        self.tea = Category.objects.create(name="Tea")
+        self.milk = OptionGroup.objects.create(name="Milk", is_required=True)
+        Option.objects.create(group=self.milk, name="Oat", price_adjustment=0.50)
+        self.syrup = OptionGroup.objects.create(name="Syrup")
+        Option.objects.create(group=self.syrup, name="Vanilla")
+        for index in range(10):
+            product = Product.objects.create(
+                title=f"Coffee {index}",
+                price=3.00,
+                shop=self.shop,
+                category=self.coffee,
+            )
+            ProductOption.objects.create(product=product, option_group=self.milk)
+            ProductOption.objects.create(product=product, option_group=self.syrup)
+        self.tea_product = Product.objects.create(
+            title="Green Tea", price=2.00, shop=self.shop, category=self.tea
+        )
+        self.url = reverse("shop-menu", args=[self.shop.id])
+        self.client.force_authenticate(user=self.user)
+
+    def test_menu_in_fixed_number_of_queries(self):
+        # Shop, its name from the primary, products, product options, option
+        # groups and their options.
+        with self.assertNumQueries(6):
+            response = self.client.get(self.url)
+        with self.assertNumQueries(4):
+            build_menu(self.shop)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [category["name"] for category in response.data["categories"]],
+            ["Coffee", "Tea"],
+        )
+        coffees = response.data["categories"][0]["products"]
+        self.assertEqual(len(coffees), 10)
+        self.assertEqual(coffees[0]["option_groups"], [self.milk.id, self.syrup.id])
+        # Shared option groups are listed once.
+        option_groups = response.data["option_groups"]
+        self.assertEqual(len(option_groups), 2)
+        self.assertEqual(option_groups[str(self.milk.id)]["options"][0]["name"], "Oat")
+
+    def test_menu_cached_until_shop_changes(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            cached = self.client.get(self.url)
+        self.assertEqual(len(cached.data["categories"]), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Option.objects.create(group=self.syrup, name="Caramel")
+        response = self.client.get(self.url)
+        options = response.data["option_groups"][str(self.syrup.id)]["options"]
+        self.assertEqual(len(options), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tea_product.delete()
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data["categories"]), 1)
+
+    def test_invalidation_while_building_wins(self):
+        key = menu.menu_cache_key(self.shop.id, "en")
+        generation = menu.redis_instance.get(menu.GENERATION_KEY) or b"0"
+        # The menu changes after the request has read the old rows.
+        invalidate_menus([self.shop.id])
+        menu.cache_menu(key, {"categories": []}, generation)
+        self.assertIsNone(menu.redis_instance.get(key))
+
+        self.client.get(self.url)
+        self.assertIsNotNone(menu.redis_instance.get(key))
+
+    @override_settings(ALLOWED_HOSTS=["cafe.example", "api.example"])
+    def test_image_urls_follow_request_host(self):
+        Product.objects.filter(pk=self.tea_product.pk).update(image="products/tea.jpg")
+        for host in ("cafe.example", "api.example"):
+            response = self.client.get(self.url, HTTP_HOST=host)
+            (tea,) = response.data["categories"][1]["products"]
+            self.assertEqual(tea["image"], f"http://{host}/media/products/tea.jpg")
+            self.assertIsNone(response.data["categories"][0]["products"][0]["image"])
+
+    def test_inactive_shop_not_found(self):
+        self.shop.is_active = False
+        self.shop.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+SMALL_DATASET = {
+    "users": 20,
+    "owners": 3,
+    "shops": 5,
+    "root_categories": 2,
+    "categories": 6,
+    "products": 50,
+    "option_groups": 4,
+    "models_per_brand": 2,
+    "phone_prefix": "70",
+    "stdout": StringIO(),
+}
+
+
+class GenerateDatasetTests(TestCase):
+    def test_generates_consistent_dataset(self):
+        call_command("generate_dataset", **SMALL_DATASET)
+
+        users = User.objects.filter(phone_number__startswith="+99870")
+        self.assertEqual(users.count(), 23)
+        self.assertTrue(users.first().check_password("loadtest"))
+        self.assertEqual(Shop.objects.count(), 5)
+        self.assertFalse(Branch.objects.filter(unit_x__isnull=True).exists())
+        self.assertEqual(
+            OpeningPeriod.objects.values("branch").distinct().count(),
+            OpeningHours.objects.values("branch").distinct().count(),
+        )
+        self.assertEqual(Category.objects.filter(parent__isnull=True).count(), 2)
+        self.assertEqual(Category.objects.count(), 6)
+        self.assertEqual(Product.objects.count(), 50)
+        self.assertEqual(ProductListing.objects.count(), 50)
+        self.assertEqual(Brand.objects.get(name_en="Lada").name_ru, "Лада")
+        for vehicle in Vehicle.objects.select_related("model"):
+            self.assertEqual(vehicle.model.brand_id, vehicle.brand_id)
+
+        # From prices include the required option groups.
+        required = Product.objects.filter(
+            product_options__option_group__is_required=True
+        )
+        self.assertTrue(any(p.from_price != p.price for p in required))
+
+    def test_refuses_to_generate_twice(self):
+        call_command("generate_dataset", **SMALL_DATASET)
+        with self.assertRaises(CommandError):
+            call_command("generate_dataset", **SMALL_DATASET)
+
+    def test_reuses_public_reference_data(self):
+        call_command("generate_dataset", **SMALL_DATASET)
+        call_command("generate_dataset", **{**SMALL_DATASET, "phone_prefix": "71"})
+        self.assertEqual(Brand.objects.filter(user=None).count(), 8)
+        self.assertEqual(Model.objects.filter(user=None).count(), 16)
+        self.assertEqual(Color.objects.filter(user=None).count(), 8)
+        for vehicle in Vehicle.objects.select_related("model"):
+            self.assertEqual(vehicle.model.brand_id, vehicle.brand_id)
+
+
+class LoadTestTests(LiveServerTestCase):
+    def test_scenarios_run_without_failures(self):
+        call_command("generate_dataset", **SMALL_DATASET)
+        stdout = StringIO()
+        call_command(
+            "load_test",
+            base_url=self.live_server_url,
+            users=2,
+            duration=2,
+            phone_prefix="70",
+            stdout=stdout,
+        )
+        rows = [line.split() for line in stdout.getvalue().splitlines()[2:]]
+        self.assertIn("login", [row[0] for row in rows])
+        # requests, failures
+        self.assertTrue(all(int(row[-6]) > 0 and row[-5] == "0" for row in rows))
+
+
+class BenchmarkTests(TestCase):
+    def test_compare_flags_changes_beyond_threshold(self):
+        baseline = {name: {"median_ms": 10.0} for name in ("a", "b", "c")}
+        results = {
+            name: {"median_ms": median}
+            for name, median in [("a", 10.5), ("b", 12.0), ("c", 8.0), ("d", 1.0)]
+        }
+        statuses = {row[0]: row[4] for row in compare(results, baseline, 10)}
+        self.assertEqual(
+            statuses, {"a": "ok", "b": "regression", "c": "improvement", "d": "new"}
+        )
+
+    def test_run_save_and_compare(self):
+        options = {
+            "sizes": [1, 5],
+            "dataset_size": 10,
+            "rounds": 1,
+            "min_time": 0,
+            "stdout": StringIO(),
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "baseline.json")
+            call_command("run_benchmarks", save=path, **options)
+            with open(path) as file:
+                results = json.load(file)["results"]
+            self.assertIn("products.ProductSerializer[5]", results)
+            self.assertIn("accounts.permissions", results)
+            self.assertIn("shops.BranchListView.nearest_queryset", results)
+
+            stdout = StringIO()
+            call_command(
+                "run_benchmarks",
+                compare=path,
+                threshold=1000000,
+                **dict(options, stdout=stdout),
+            )
+            self.assertIn("vehicles.VehicleSerializer[1]", stdout.getvalue())
+            self.assertNotIn("regression", stdout.getvalue())
+
+            with self.assertRaises(CommandError):
+                call_command("run_benchmarks", compare=path, threshold=-100, **options)
+
+
+class IndexUsageTests(TestCase):
+    def test_product_list_uses_shop_id_index(self):
+        plan = explain_without_seqscan(
+            Product.objects.filter(shop__is_active=True, shop_id=1).order_by("id")
+        )
+        self.assertIn("products_product_shop_id_idx", plan)
@@ -1,9 +1,10 @@
 from django.urls import path
 
-from .views import CategoryListView, ProductDetailView, ProductListView
+from .views import CategoryListView, ProductDetailView, ProductListView, ShopMenuView
 
 urlpatterns = [
     path("categories/", CategoryListView.as_view(), name="category-list"),
     path("products/", ProductListView.as_view(), name="product-list"),
     path("products/<int:pk>/", ProductDetailView.as_view(), name="product-detail"),
+    path("shops/<int:shop_pk>/menu/", ShopMenuView.as_view(), name="shop-menu"),
 ]
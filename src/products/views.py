@@ -1,12 +1,34 @@
-from django.db.models import ExpressionWrapper, F, FloatField
-from django.db.models.functions import ACos, Cos, Radians, Sin
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Greatest
+from django.shortcuts import get_object_or_404
+from django.utils.translation import get_language, get_supported_language_variant
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from config.mixins import ConditionalRetrieveMixin
+from shops.locator import get_branch_locator
+from shops.models import Branch, Shop
+from shops.opening_hours import get_open_branches
+from shops.tile_cache import get_tile_cache
 
-from .models import Category, Product
-from .serializers import CategorySerializer, ProductDetailSerializer, ProductSerializer
+from .detail_cache import CachedProductDetailMixin
+from .facets import get_facets
+from .menu import get_menu
+from .models import Category, Product, ProductListing
+from .serializers import (
+    CategorySerializer,
+    ProductDetailSerializer,
+    ProductListingSerializer,
+    ProductSerializer,
+    absolute_image_url,
+)
 
 
 class CategoryListView(generics.ListAPIView):
@@ -32,7 +54,8 @@ class CategoryListView(generics.ListAPIView):
 class ProductListView(generics.ListAPIView):
     """
     GET: Returns a list of products.
-    Supports filtering by category, shop, and radius (based on branch location).
+    Supports filtering by category, shop, radius (based on branch location),
+    open branches and price, and sorting by price.
     """
 
     serializer_class = ProductSerializer
@@ -71,6 +94,49 @@ class ProductListView(generics.ListAPIView):
                 description="Radius in kilometers to filter products by proximity",
                 type=openapi.TYPE_NUMBER,
             ),
+            openapi.Parameter(
+                "open_now",
+                openapi.IN_QUERY,
+                description="Only products of shops with a branch open now, within "
+                "the radius if one is given",
+                type=openapi.TYPE_BOOLEAN,
+            ),
+            openapi.Parameter(
+                "open_at",
+                openapi.IN_QUERY,
+                description="Only products of shops with a branch open at this ISO "
+                "8601 date and time (UTC without an offset), within the radius if "
+                "one is given",
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATETIME,
+            ),
+            openapi.Parameter(
+                "min_price",
+                openapi.IN_QUERY,
+                description="Minimum 'from' price: base price plus the cheapest option "
+                "of each required option group",
+                type=openapi.TYPE_NUMBER,
+            ),
+            openapi.Parameter(
+                "max_price",
+                openapi.IN_QUERY,
+                description="Maximum 'from' price",
+                type=openapi.TYPE_NUMBER,
+            ),
+            openapi.Parameter(
+                "facets",
+                openapi.IN_QUERY,
+                description="Wrap the list as 'results' and add product counts per "
+                "category (including subcategories), shop and price bucket",
+                type=openapi.TYPE_BOOLEAN,
+            ),
+            openapi.Parameter(
+                "ordering",
+                openapi.IN_QUERY,
+                description="Sort by 'from' price",
+                type=openapi.TYPE_STRING,
+                enum=["price", "-price"],
+            ),
         ],
         responses={200: ProductSerializer(many=True)},
     )
@@ -80,13 +146,49 @@ class ProductListView(generics.ListAPIView):
         """
         return super().get(request, *args, **kwargs)
 
-    def get_queryset(self):
-        queryset = (
-            Product.objects.filter(shop__is_active=True)
-            .select_related("shop", "category")
-            .order_by("id")
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get("facets") not in ("1", "true"):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer(queryset, many=True)
+        # Facets do not depend on the ordering of the list.
+        params = {
+            key: value
+            for key, value in request.query_params.items()
+            if key not in ("facets", "ordering")
+        }
+        params["read_model"] = settings.PRODUCT_LISTING_READ_MODEL
+        return Response(
+            {
+                "results": serializer.data,
+                "facets": get_facets(queryset, self.get_price_field(), params),
+            }
         )
 
+    def get_price_field(self):
+        if settings.PRODUCT_LISTING_READ_MODEL:
+            return "min_price"
+        return "from_price"
+
+    def get_serializer_class(self):
+        if settings.PRODUCT_LISTING_READ_MODEL:
+            return ProductListingSerializer
+        return ProductSerializer
+
+    def get_queryset(self):
+        if settings.PRODUCT_LISTING_READ_MODEL:
+            # Every field shown or filtered on is in the listing row.
+            queryset = ProductListing.objects.filter(shop_is_active=True).order_by(
+                "product_id"
+            )
+        else:
+            queryset = (
+                Product.objects.filter(shop__is_active=True)
+                .select_related("shop", "category")
+                .order_by("id")
+            )
+
         # Filter by chosen category
         category_id = self.request.query_params.get("category")
         if category_id:
@@ -97,6 +199,32 @@ class ProductListView(generics.ListAPIView):
         if shop_id:
             queryset = queryset.filter(shop_id=shop_id)
 
+        # Filter and sort by the precomputed "from" price
+        price_field = self.get_price_field()
+        for param, lookup in [("min_price", "gte"), ("max_price", "lte")]:
+            value = self.request.query_params.get(param)
+            if value:
+                try:
+                    value = Decimal(value)
+                except InvalidOperation:
+                    continue
+                queryset = queryset.filter(**{f"{price_field}__{lookup}": value})
+
+        ordering = self.request.query_params.get("ordering")
+        if ordering in ("price", "-price"):
+            direction = "-" if ordering.startswith("-") else ""
+            queryset = queryset.order_by(
+                direction + price_field, direction + queryset.model._meta.pk.name
+            )
+
+        # Filter by shops with an active branch open at the chosen time
+        open_branches = get_open_branches(self.request.query_params)
+        if open_branches is not None:
+            open_branches = Branch.objects.filter(
+                shop=OuterRef("shop"), is_active=True, pk__in=open_branches
+            )
+            queryset = queryset.filter(Exists(open_branches))
+
         # Filter by chosen radius based on branch location
         latitude = self.request.query_params.get("latitude")
         longitude = self.request.query_params.get("longitude")
@@ -111,27 +239,39 @@ class ProductListView(generics.ListAPIView):
                 # Return unfiltered queryset if any values are invalid
                 return queryset
 
-            # Haversine formula for calculating the distance
-            distance_expression = ExpressionWrapper(
-                ACos(
-                    Sin(Radians(F("shop__branches__latitude"))) * Sin(Radians(latitude))
-                    + Cos(Radians(F("shop__branches__latitude")))
-                    * Cos(Radians(latitude))
-                    * Cos(Radians(F("shop__branches__longitude")) - Radians(longitude))
+            if open_branches is not None:
+                # The branch within the radius has to be an open one, which
+                # neither the read model nor the caches know.
+                return queryset.filter(
+                    Exists(open_branches.within_radius(latitude, longitude, radius))
                 )
-                * 6371,  # Radius of Earth in kilometers
-                output_field=FloatField(),
-            )
 
-            # Filter products based on the distance to branches within the given radius
-            queryset = queryset.annotate(distance=distance_expression).filter(
-                distance__lte=radius
-            )
+            # Keep products with at least one active branch within the radius
+            if settings.PRODUCT_LISTING_READ_MODEL:
+                return queryset.within_radius(latitude, longitude, radius)
+
+            locator = get_branch_locator()
+            if locator is not None:
+                shop_ids = locator.shops_within_radius(latitude, longitude, radius)
+                return queryset.filter(shop_id__in=shop_ids.tolist())
+
+            tile_cache = get_tile_cache()
+            if tile_cache is not None:
+                shop_ids = tile_cache.shops_within_radius(latitude, longitude, radius)
+                if shop_ids is not None:
+                    return queryset.filter(shop_id__in=shop_ids)
+
+            branches_in_radius = Branch.objects.filter(
+                shop=OuterRef("shop"), is_active=True
+            ).within_radius(latitude, longitude, radius)
+            queryset = queryset.filter(Exists(branches_in_radius))
 
         return queryset
 
 
-class ProductDetailView(generics.RetrieveAPIView):
+class ProductDetailView(
+    ConditionalRetrieveMixin, CachedProductDetailMixin, generics.RetrieveAPIView
+):
     """
     GET: Returns detailed information about a product, including options.
     """
@@ -156,3 +296,31 @@ class ProductDetailView(generics.RetrieveAPIView):
             .select_related("shop", "category")
             .prefetch_related("product_options__option_group__options")
         )
+
+    def get_last_modified_expression(self):
+        # The payload embeds the shop name.
+        return Greatest("updated_at", "shop__updated_at")
+
+
+class ShopMenuView(APIView):
+    """
+    GET: Returns the full menu of a shop in one response: categories with
+    their products, and the option groups the products refer to by id.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Retrieve the full menu of a shop: categories, products, "
+        "and a lookup table of the option groups referenced by the products.",
+        responses={200: "Shop menu", 404: "Shop not found"},
+    )
+    def get(self, request, shop_pk):
+        shop = get_object_or_404(Shop, pk=shop_pk, is_active=True)
+        # Cached menus are keyed by the LANGUAGES code.
+        language = get_supported_language_variant(get_language())
+        menu = get_menu(shop, language)
+        for category in menu["categories"]:
+            for product in category["products"]:
+                product["image"] = absolute_image_url(request, product["image"])
+        return Response(menu)
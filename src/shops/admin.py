@@ -1,13 +1,32 @@
 from django.contrib import admin
 
-from .models import Branch, Shop
+from config.admin import AutocompleteFilter, ScalableAdminMixin
+
+from .models import Branch, OpeningException, OpeningHours, Shop
 
 
 @admin.register(Shop)
-class ShopAdmin(admin.ModelAdmin):
+class ShopAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ("name", "owner")
+    list_select_related = ("owner",)
+    search_fields = ("name",)
+    autocomplete_fields = ("owner",)
+
+
+class OpeningHoursInline(admin.TabularInline):
+    model = OpeningHours
+    extra = 0
+
+
+class OpeningExceptionInline(admin.TabularInline):
+    model = OpeningException
+    extra = 0
 
 
 @admin.register(Branch)
-class BranchAdmin(admin.ModelAdmin):
+class BranchAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ("shop", "address")
+    list_select_related = ("shop",)
+    list_filter = (("shop", AutocompleteFilter),)
+    autocomplete_fields = ("shop",)
+    inlines = [OpeningHoursInline, OpeningExceptionInline]
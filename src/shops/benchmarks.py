@@ -0,0 +1,40 @@
+from django.utils import timezone
+
+from config.benchmarks import benchmark, build_view
+
+from .models import Branch
+from .opening_hours import filter_open_at
+from .serializers import BranchSerializer
+from .views import BranchListView
+
+# Center of the densest city of the generated dataset.
+LATITUDE, LONGITUDE = 41.311, 69.279
+
+
+@benchmark("shops.BranchSerializer", sized=True)
+def branch_serializer(size):
+    branches = list(
+        Branch.objects.select_related("shop")
+        .prefetch_related("opening_hours")
+        .order_by("id")[:size]
+    )
+    return lambda: BranchSerializer(branches, many=True).data
+
+
+@benchmark("shops.BranchListView.nearest_queryset")
+def branch_nearest_queryset():
+    view = build_view(
+        BranchListView,
+        "/shops/branches/",
+        {"latitude": LATITUDE, "longitude": LONGITUDE},
+    )
+    # The first page of the paginated list.
+    return lambda: list(view.get_queryset()[:5])
+
+
+@benchmark("shops.filter_open_at")
+def branch_open_at():
+    moment = timezone.now()
+    return lambda: list(
+        filter_open_at(Branch.objects.all(), moment).values_list("id", flat=True)
+    )
@@ -0,0 +1,305 @@
+"""
+Server-sent event streams of shops.events, served by config.asgi at
+``/events/`` without going through Django's request handling.
+
+A client opens ``GET /events/?shop=1&shop=2`` or
+``GET /events/?latitude=41.3&longitude=69.2&radius=5`` (or both) with its
+``Authorization: Bearer`` access token, and receives an event for every
+change to the shops, or to the shops with a branch in the area. Events
+published while a client is disconnected are lost: after reconnecting, and
+on a ``reset`` event, clients refetch what they show. When the access token
+expires the stream sends an ``expired`` event and closes, and clients
+reconnect with a refreshed token.
+
+Each stream is a coroutine waiting on its own queue, so idle streams cost a
+few kilobytes and no thread. Each process holds a single Redis subscription
+and hands every event to the queues of the streams watching it.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import weakref
+from urllib.parse import parse_qs
+
+import redis
+import redis.asyncio
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .events import CHANNEL
+from .geo import grid_cells_within_radius
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_DELAY = 1
+# Milliseconds clients wait before reconnecting, sent to them on connect.
+RETRY_MS = 3000
+MAX_CELLS = 400
+HEADERS = [
+    (b"content-type", b"text/event-stream"),
+    (b"cache-control", b"no-cache"),
+    # Stops nginx from buffering the stream.
+    (b"x-accel-buffering", b"no"),
+]
+HEARTBEAT = b": ping\n\n"
+
+
+def format_event(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+class Subscriber:
+    def __init__(self, topics):
+        self.topics = topics
+        self.queue = asyncio.Queue(maxsize=settings.LIVE_EVENTS_QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Rather than buffering without bound, the stream is closed and
+            # the client reconnects and refetches.
+            self.overflowed = True
+
+
+class EventHub:
+    """
+    The Redis subscription of one event loop, dispatching events to the
+    subscribers of their topics: ``shop:<id>`` and ``cell:<id>``.
+    """
+
+    def __init__(self):
+        self.topics = {}
+        self.listener = None
+
+    def add(self, subscriber):
+        for topic in subscriber.topics:
+            self.topics.setdefault(topic, set()).add(subscriber)
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.create_task(self.listen())
+
+    def remove(self, subscriber):
+        for topic in subscriber.topics:
+            subscribers = self.topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self.topics[topic]
+
+    def dispatch(self, raw):
+        event = json.loads(raw)
+        topics = [f"shop:{event['shop']}"]
+        topics.extend(f"cell:{cell}" for cell in event.pop("cells", []))
+        subscribers = set()
+        for topic in topics:
+            subscribers.update(self.topics.get(topic, ()))
+        # Encoded once, whatever the number of streams.
+        message = format_event(event.pop("type"), event)
+        for subscriber in subscribers:
+            subscriber.put(message)
+
+    def broadcast(self, message):
+        for subscriber in set().union(*self.topics.values()):
+            subscriber.put(message)
+
+    async def listen(self):
+        lost = False
+        while True:
+            client = redis.asyncio.Redis(
+                host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0
+            )
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(CHANNEL)
+                    if lost:
+                        # Events may have been missed while disconnected.
+                        self.broadcast(format_event("reset", {}))
+                        lost = False
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        try:
+                            self.dispatch(message["data"])
+                        except (ValueError, KeyError):
+                            logger.exception("Invalid live event %r", message)
+            except (redis.RedisError, OSError):
+                logger.exception("Lost the live event subscription")
+                lost = True
+            finally:
+                await client.aclose()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+
+hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    loop = asyncio.get_running_loop()
+    if loop not in hubs:
+        hubs[loop] = EventHub()
+    return hubs[loop]
+
+
+def get_access_token(scope):
+    """
+    The validated access token of the Authorization header, checked without
+    a query.
+    """
+    authentication = JWTAuthentication()
+    header = dict(scope["headers"]).get(b"authorization")
+    raw_token = header and authentication.get_raw_token(header)
+    if not raw_token:
+        return None
+    try:
+        token = authentication.get_validated_token(raw_token)
+    except InvalidToken:
+        return None
+    if token.get(api_settings.USER_ID_CLAIM) is None:
+        return None
+    return token
+
+
+class InvalidQuery(Exception):
+    pass
+
+
+def get_float(params, name, minimum, maximum, default=None):
+    values = params.get(name)
+    if not values:
+        if default is None:
+            raise InvalidQuery({name: ["This parameter is required."]})
+        return default
+    try:
+        value = float(values[0])
+    except ValueError:
+        raise InvalidQuery({name: ["Expected a number."]})
+    if not minimum <= value <= maximum:
+        raise InvalidQuery({name: [f"Expected a number from {minimum} to {maximum}."]})
+    return value
+
+
+def get_topics(query_string):
+    params = parse_qs(query_string.decode("latin-1"))
+    try:
+        shop_ids = {int(value) for value in params.get("shop", [])}
+    except ValueError:
+        raise InvalidQuery({"shop": ["Expected shop ids."]})
+    if len(shop_ids) > settings.LIVE_EVENTS_MAX_SHOPS:
+        raise InvalidQuery(
+            {"shop": [f"At most {settings.LIVE_EVENTS_MAX_SHOPS} shops."]}
+        )
+    topics = {f"shop:{shop_id}" for shop_id in shop_ids}
+
+    if "latitude" in params or "longitude" in params:
+        latitude = get_float(params, "latitude", -90, 90)
+        longitude = get_float(params, "longitude", -180, 180)
+        radius = get_float(
+            params, "radius", 0, settings.LIVE_EVENTS_MAX_RADIUS, default=5
+        )
+        cells = grid_cells_within_radius(
+            latitude, longitude, radius, settings.LIVE_EVENTS_CELL_SIZE, MAX_CELLS
+        )
+        if cells is None:
+            raise InvalidQuery({"radius": ["The area is too large."]})
+        topics.update(f"cell:{cell}" for cell in cells)
+
+    if not topics:
+        raise InvalidQuery(
+            {"non_field_errors": ["Give shop ids, or latitude and longitude."]}
+        )
+    return topics
+
+
+async def send_json(send, status, data):
+    body = json.dumps(data).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def stream_events(scope, receive, send):
+    """
+    ASGI application of a single event stream.
+    """
+    if scope["method"] != "GET":
+        return await send_json(send, 405, {"detail": "Method not allowed."})
+    token = get_access_token(scope)
+    if token is None:
+        return await send_json(
+            send, 401, {"detail": "Authentication credentials were not provided."}
+        )
+    try:
+        topics = get_topics(scope["query_string"])
+    except InvalidQuery as error:
+        return await send_json(send, 400, error.args[0])
+
+    await send({"type": "http.response.start", "status": 200, "headers": HEADERS})
+    await send(
+        {
+            "type": "http.response.body",
+            "body": f"retry: {RETRY_MS}\n\n".encode(),
+            "more_body": True,
+        }
+    )
+
+    expires_at = token.get("exp")
+    hub = get_hub()
+    subscriber = Subscriber(topics)
+    hub.add(subscriber)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        while not subscriber.overflowed:
+            timeout = settings.LIVE_EVENTS_HEARTBEAT
+            if expires_at is not None:
+                remaining = expires_at - time.time()
+                if remaining <= 0:
+                    await send(
+                        {
+                            "type": "http.response.body",
+                            "body": format_event("expired", {}),
+                            "more_body": True,
+                        }
+                    )
+                    break
+                timeout = min(timeout, remaining)
+            message = asyncio.ensure_future(subscriber.queue.get())
+            done, _ = await asyncio.wait(
+                {message, disconnected},
+                timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnected in done:
+                message.cancel()
+                return
+            if message in done:
+                body = message.result()
+            else:
+                message.cancel()
+                if timeout < settings.LIVE_EVENTS_HEARTBEAT:
+                    # Cut short by the token expiring.
+                    continue
+                # Keeps proxies from timing the stream out.
+                body = HEARTBEAT
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        hub.remove(subscriber)
+        disconnected.cancel()
@@ -0,0 +1,92 @@
+"""
+Live change notifications for clients, published to Redis.
+
+Signals of shops and products call these on commit. Each event names the
+shop it concerns and the grid cells of that shop's branches, so
+shops.event_stream can hand it to the clients watching the shop or one of
+its areas. Events carry no data: clients refetch what changed.
+
+- ``shop``: a shop was changed, activated or deactivated.
+- ``branch``: a branch was added, changed, moved or deleted.
+- ``menu``: products or options of a shop changed.
+"""
+
+import json
+import logging
+import time
+
+import redis
+from django.conf import settings
+
+from config.metrics import InstrumentedRedis
+
+from .geo import grid_cell
+from .models import Branch
+
+logger = logging.getLogger(__name__)
+redis_instance = InstrumentedRedis(
+    host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0
+)
+
+CHANNEL = "shops:events"
+
+
+def get_cells(positions):
+    return sorted(
+        {
+            grid_cell(latitude, longitude, settings.LIVE_EVENTS_CELL_SIZE)
+            for latitude, longitude in positions
+            if latitude is not None and longitude is not None
+        }
+    )
+
+
+def encode(event):
+    return json.dumps({**event, "time": time.time()})
+
+
+def publish(events):
+    try:
+        pipeline = redis_instance.pipeline(transaction=False)
+        for event in events:
+            pipeline.publish(CHANNEL, encode(event))
+        pipeline.execute()
+    except redis.RedisError:
+        # Streams only notify; clients still see the change on their next fetch.
+        logger.exception("Could not publish live events")
+
+
+def publish_shop_events(event_type, shop_ids):
+    """
+    Publish a ``shop`` or ``menu`` event for each shop, to the areas of all
+    of its branches.
+    """
+    shop_ids = set(shop_ids)
+    if not shop_ids:
+        return
+    positions = {shop_id: [] for shop_id in shop_ids}
+    for shop_id, latitude, longitude in Branch.objects.filter(
+        shop_id__in=shop_ids
+    ).values_list("shop_id", "latitude", "longitude"):
+        positions[shop_id].append((latitude, longitude))
+    publish(
+        {"type": event_type, "shop": shop_id, "cells": get_cells(shop_positions)}
+        for shop_id, shop_positions in sorted(positions.items())
+    )
+
+
+def publish_branch_event(branch_id, shop_id, positions):
+    """
+    Publish a ``branch`` event to the areas of each of the branch's
+    ``positions``, the old one too when it moved.
+    """
+    publish(
+        [
+            {
+                "type": "branch",
+                "shop": shop_id,
+                "branch": branch_id,
+                "cells": get_cells(positions),
+            }
+        ]
+    )
@@ -0,0 +1,80 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def unit_vector(latitude, longitude):
+    """
+    Cartesian coordinates of a point on the unit sphere.
+    """
+    latitude = math.radians(float(latitude))
+    longitude = math.radians(float(longitude))
+    return (
+        math.cos(latitude) * math.cos(longitude),
+        math.cos(latitude) * math.sin(longitude),
+        math.sin(latitude),
+    )
+
+
+def chord_km(distance_km):
+    """
+    Straight-line distance through the Earth between two points that are
+    ``distance_km`` apart along its surface.
+    """
+    return 2 * EARTH_RADIUS_KM * math.sin(distance_km / (2 * EARTH_RADIUS_KM))
+
+
+def distance_km(latitude, longitude, other_latitude, other_longitude):
+    """
+    Great-circle distance between two points, from the dot product of their
+    unit vectors.
+    """
+    x, y, z = unit_vector(latitude, longitude)
+    other_x, other_y, other_z = unit_vector(other_latitude, other_longitude)
+    cosine = x * other_x + y * other_y + z * other_z
+    return EARTH_RADIUS_KM * math.acos(max(-1.0, min(1.0, cosine)))
+
+
+def grid_cell(latitude, longitude, size):
+    """
+    Id of the cell of a ``size`` degree latitude/longitude grid holding a point.
+    """
+    columns = round(360 / size)
+    row = math.floor((float(latitude) + 90) / size)
+    column = math.floor((float(longitude) + 180) / size) % columns
+    return row * columns + column
+
+
+def grid_cells_within_radius(latitude, longitude, radius_km, size, max_cells=1000):
+    """
+    Ids of the grid cells that can hold a point within the radius, from the
+    bounding box of the circle. None when there would be more than
+    ``max_cells``.
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    latitude, longitude = float(latitude), float(longitude)
+    south = latitude - math.degrees(angle)
+    north = latitude + math.degrees(angle)
+    columns = round(360 / size)
+    if south <= -90 or north >= 90 or angle >= math.pi / 2:
+        # The circle reaches a pole, every longitude is in range.
+        west_column, east_column = 0, columns - 1
+    else:
+        spread = math.degrees(
+            math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(latitude))))
+        )
+        west_column = math.floor((longitude - spread + 180) / size)
+        east_column = math.floor((longitude + spread + 180) / size)
+        if east_column - west_column >= columns:
+            west_column, east_column = 0, columns - 1
+
+    south_row = math.floor((max(south, -90) + 90) / size)
+    north_row = math.floor((min(north, 90) + 90) / size)
+    count = (north_row - south_row + 1) * (east_column - west_column + 1)
+    if count > max_cells:
+        return None
+    return sorted(
+        row * columns + column % columns
+        for row in range(south_row, north_row + 1)
+        for column in range(west_column, east_column + 1)
+    )
@@ -0,0 +1,216 @@
+import logging
+import threading
+import time
+
+import numpy as np
+import redis
+from django.conf import settings
+
+from config.metrics import InstrumentedRedis
+from config.replicas import read_from_primary
+
+from .geo import EARTH_RADIUS_KM, unit_vector
+from .models import Branch
+
+logger = logging.getLogger(__name__)
+
+redis_instance = InstrumentedRedis(
+    host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0
+)
+
+VERSION_KEY = "shops:branch_locator:version"
+CHANGES_KEY = "shops:branch_locator:changes"
+# How many versions of changes are kept for incremental refreshes. A worker
+# that falls further behind reloads everything.
+MAX_TRACKED_VERSIONS = 10000
+
+
+# Bumps the version and records the changed branches under it in one step,
+# so that no worker can read the new version before its changes.
+PUBLISH_CHANGES = redis_instance.register_script(
+    """
+    local version = redis.call("INCR", KEYS[1])
+    for index = 2, #ARGV do
+        redis.call("ZADD", KEYS[2], version, ARGV[index])
+    end
+    redis.call("ZREMRANGEBYSCORE", KEYS[2], "-inf", version - tonumber(ARGV[1]))
+    return version
+    """
+)
+
+
+def publish_branch_changes(branch_ids):
+    """
+    Bump the shared version counter and record which branches changed, so
+    every worker's locator can patch just those rows on its next request.
+    """
+    branch_ids = list(branch_ids)
+    if not branch_ids:
+        return
+    try:
+        PUBLISH_CHANGES(
+            keys=[VERSION_KEY, CHANGES_KEY], args=[MAX_TRACKED_VERSIONS, *branch_ids]
+        )
+    except redis.RedisError:
+        # Workers still pick the change up on their next full reload.
+        logger.exception("Could not publish branch locator changes")
+
+
+class BranchLocator:
+    """
+    In-process index of active branch positions for proximity queries.
+
+    Ids, shop ids and unit vectors of every active branch of an active shop
+    are kept in contiguous NumPy arrays, so k-nearest and radius queries are
+    a single matrix-vector product instead of a scan of ``shops_branch``.
+    Only the matching rows are then fetched from the database.
+    """
+
+    def __init__(self, max_age=None):
+        self.max_age = settings.BRANCH_LOCATOR_MAX_AGE if max_age is None else max_age
+        self.lock = threading.Lock()
+        self.version = None
+        self.loaded_at = None
+        self.ids = np.empty(0, dtype=np.int64)
+        self.shop_ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, 3), dtype=np.float64)
+
+    def reset(self):
+        with self.lock:
+            self.version = None
+            self.loaded_at = None
+
+    def active_branches(self):
+        return Branch.objects.filter(
+            is_active=True, shop__is_active=True, unit_x__isnull=False
+        ).values_list("id", "shop_id", "unit_x", "unit_y", "unit_z")
+
+    def to_arrays(self, rows):
+        rows = np.array(rows, dtype=np.float64).reshape(-1, 5)
+        return (
+            rows[:, 0].astype(np.int64),
+            rows[:, 1].astype(np.int64),
+            np.ascontiguousarray(rows[:, 2:5]),
+        )
+
+    def load(self, version):
+        self.ids, self.shop_ids, self.vectors = self.to_arrays(
+            list(self.active_branches())
+        )
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+    def apply_changes(self, version):
+        """
+        Patch the arrays with the branches changed since the loaded version.
+        Returns False when the change log no longer reaches back that far.
+        """
+        if not self.version < version <= self.version + MAX_TRACKED_VERSIONS:
+            return False
+
+        # A branch changed twice keeps only its latest version, which is
+        # still newer than ours.
+        changes = redis_instance.zrangebyscore(CHANGES_KEY, self.version + 1, "+inf")
+        changed_ids = np.array([int(member) for member in changes], dtype=np.int64)
+        keep = ~np.isin(self.ids, changed_ids)
+        ids, shop_ids, vectors = self.to_arrays(
+            list(self.active_branches().filter(id__in=changed_ids.tolist()))
+        )
+        self.ids = np.concatenate([self.ids[keep], ids])
+        self.shop_ids = np.concatenate([self.shop_ids[keep], shop_ids])
+        self.vectors = np.ascontiguousarray(
+            np.concatenate([self.vectors[keep], vectors])
+        )
+        self.version = version
+        return True
+
+    def refresh(self):
+        version = int(redis_instance.get(VERSION_KEY) or 0)
+        # The rows have to be at least as new as the version.
+        with self.lock, read_from_primary():
+            expired = (
+                self.loaded_at is None
+                or time.monotonic() - self.loaded_at > self.max_age
+            )
+            if expired:
+                self.load(version)
+            elif version != self.version and not self.apply_changes(version):
+                self.load(version)
+
+    def distances(self, latitude, longitude):
+        query = np.array(unit_vector(latitude, longitude))
+        cosines = np.clip(self.vectors @ query, -1.0, 1.0)
+        return np.arccos(cosines) * EARTH_RADIUS_KM
+
+    def nearest(self, latitude, longitude, limit=None):
+        """
+        Ids and distances in kilometers of the closest branches, nearest first.
+        """
+        distances = self.distances(latitude, longitude)
+        if limit is not None and limit < len(distances):
+            candidates = np.argpartition(distances, limit)[:limit]
+            order = candidates[np.argsort(distances[candidates], kind="stable")]
+        else:
+            order = np.argsort(distances, kind="stable")
+        return self.ids[order], distances[order]
+
+    def shops_within_radius(self, latitude, longitude, radius_km):
+        """
+        Ids of the shops with at least one active branch within the radius.
+        """
+        distances = self.distances(latitude, longitude)
+        return np.unique(self.shop_ids[distances <= radius_km])
+
+
+class LocatedBranchList:
+    """
+    Located branches ordered by distance, nearest first.
+
+    Behaves like a sequence for the paginator: only the slice being served is
+    ranked and fetched from the database, with ``distance`` set on each
+    branch. Branches without coordinates are not part of the locator.
+    """
+
+    def __init__(self, queryset, locator, latitude, longitude):
+        self.queryset = queryset
+        self.locator = locator
+        self.latitude = latitude
+        self.longitude = longitude
+
+    def __len__(self):
+        return len(self.locator.ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[slice(index, index + 1)][0]
+
+        ids, distances = self.locator.nearest(
+            self.latitude, self.longitude, limit=index.stop
+        )
+        ids = ids[index].tolist()
+        branches = self.queryset.in_bulk(ids)
+        located = []
+        for branch_id, distance in zip(ids, distances[index].tolist()):
+            # Rows changed since the last refresh are dropped by the queryset.
+            branch = branches.get(branch_id)
+            if branch is not None:
+                branch.distance = distance
+                located.append(branch)
+        return located
+
+
+_locator = None
+
+
+def get_branch_locator():
+    """
+    The worker's locator, refreshed against the shared version counter, or
+    None when the locator is disabled.
+    """
+    global _locator
+    if not settings.BRANCH_LOCATOR_ENABLED:
+        return None
+    if _locator is None:
+        _locator = BranchLocator()
+    _locator.refresh()
+    return _locator
@@ -0,0 +1,148 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import ExpressionWrapper, F, FloatField
+from django.db.models.functions import ACos, Cos, Radians, Sin
+
+from shops.geo import unit_vector
+from shops.locator import BranchLocator
+from shops.models import Branch, Shop
+
+User = get_user_model()
+
+BATCH_SIZE = 10000
+
+
+def haversine_distance(latitude, longitude):
+    """
+    The per-row trigonometry the branch and product lists used before the
+    unit vectors were stored, kept for comparison.
+    """
+    return ExpressionWrapper(
+        ACos(
+            Sin(Radians(F("latitude"))) * Sin(Radians(latitude))
+            + Cos(Radians(F("latitude")))
+            * Cos(Radians(latitude))
+            * Cos(Radians(F("longitude")) - Radians(longitude))
+        )
+        * 6371,
+        output_field=FloatField(),
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the haversine, unit-vector and in-process locator nearest-branch "
+        "queries on a synthetic set of branches. The data is rolled back afterwards unless "
+        "--keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--branches", type=int, default=200000)
+        parser.add_argument("--samples", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--keep", action="store_true")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+
+        with transaction.atomic():
+            self.create_branches(options["branches"], rng)
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {Branch._meta.db_table}")
+
+            # Points around Tashkent, where the synthetic branches are placed.
+            points = [
+                (rng.uniform(41.2, 41.4), rng.uniform(69.1, 69.4))
+                for _ in range(options["samples"])
+            ]
+            active = Branch.objects.filter(is_active=True, shop__is_active=True)
+            results = {
+                "haversine": self.measure(
+                    points,
+                    lambda lat, lon: active.annotate(
+                        distance=haversine_distance(lat, lon)
+                    ).order_by("distance"),
+                ),
+                "unit vector": self.measure(
+                    points, lambda lat, lon: active.nearest_to(lat, lon)
+                ),
+                "locator": self.measure_locator(points, active),
+            }
+            for name, timings in results.items():
+                self.report(name, timings)
+
+            if not options["keep"]:
+                transaction.set_rollback(True)
+
+    def create_branches(self, count, rng):
+        self.stdout.write(f"Creating {count} branches...")
+        owner = User.objects.create_user(
+            phone_number="+998900000000", password=None, role="owner"
+        )
+        shop = Shop.objects.create(name="Benchmark", owner=owner)
+        branches = []
+        for index in range(count):
+            branch = Branch(
+                shop=shop,
+                address=f"Branch {index}",
+                latitude=round(rng.uniform(41.2, 41.4), 6),
+                longitude=round(rng.uniform(69.1, 69.4), 6),
+            )
+            # bulk_create() skips save(), which maintains the unit vector.
+            branch.unit_x, branch.unit_y, branch.unit_z = unit_vector(
+                branch.latitude, branch.longitude
+            )
+            branches.append(branch)
+        Branch.objects.bulk_create(branches, batch_size=BATCH_SIZE)
+
+    def measure(self, points, make_queryset):
+        """
+        Time the SQL for the first page of the nearest branches.
+        """
+        timings = []
+        with connection.cursor() as cursor:
+            for latitude, longitude in points:
+                queryset = make_queryset(latitude, longitude).values_list("id")[:5]
+                sql, params = queryset.query.sql_with_params()
+                started = time.perf_counter()
+                cursor.execute(sql, params)
+                cursor.fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def measure_locator(self, points, queryset):
+        """
+        Time ranking in NumPy plus fetching the first page of rows by id.
+        """
+        branch_locator = BranchLocator()
+        started = time.perf_counter()
+        branch_locator.load(version=0)
+        self.stdout.write(
+            f"Locator loaded {len(branch_locator.ids)} branches in "
+            f"{(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+
+        timings = []
+        with connection.cursor() as cursor:
+            for latitude, longitude in points:
+                started = time.perf_counter()
+                ids, _ = branch_locator.nearest(latitude, longitude, limit=5)
+                page = queryset.filter(id__in=ids.tolist()).values_list("id")
+                sql, params = page.query.sql_with_params()
+                cursor.execute(sql, params)
+                cursor.fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def report(self, name, timings):
+        timings = sorted(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f"{name:>12}: median {statistics.median(timings):.2f} ms, "
+            f"p95 {p95:.2f} ms over {len(timings)} queries"
+        )
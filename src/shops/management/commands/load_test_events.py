@@ -0,0 +1,243 @@
+import asyncio
+import json
+import random
+import resource
+import time
+from urllib.parse import urlencode, urlsplit
+
+import redis.asyncio
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from config.loadtest import percentile
+from shops.events import CHANNEL, encode, get_cells
+from shops.geo import grid_cells_within_radius
+from shops.models import Branch
+
+User = get_user_model()
+
+SAMPLE_SIZE = 1000
+AREA_RADIUS_KM = 1
+
+
+def read_rss_kb(pid):
+    with open(f"/proc/{pid}/status") as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+
+
+class EventStream:
+    """
+    One client of ``/events/``, reading the chunked stream and recording
+    when each event arrived.
+    """
+
+    def __init__(self, base_url, token, query, topics):
+        url = urlsplit(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.token = token
+        self.query = query
+        self.topics = topics
+        self.received = {}
+        self.connect_time = None
+        self.error = None
+
+    async def connect(self):
+        started = time.perf_counter()
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(
+            (
+                f"GET /events/?{urlencode(self.query)} HTTP/1.1\r\n"
+                f"Host: {self.host}:{self.port}\r\n"
+                f"Authorization: Bearer {self.token}\r\n"
+                "Accept: text/event-stream\r\n\r\n"
+            ).encode()
+        )
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line or int(status_line.split()[1]) != 200:
+            raise ConnectionError(f"Unexpected response {status_line!r}")
+        while (await self.reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        self.connect_time = time.perf_counter() - started
+
+    async def read(self):
+        buffer = b""
+        try:
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if not size:
+                    return
+                buffer += await self.reader.readexactly(size)
+                await self.reader.readline()
+                *messages, buffer = buffer.split(b"\n\n")
+                for message in messages:
+                    self.handle(message)
+        except (OSError, ValueError, asyncio.IncompleteReadError) as error:
+            self.error = error
+
+    def handle(self, message):
+        for line in message.split(b"\n"):
+            if line.startswith(b"data: "):
+                data = json.loads(line[6:])
+                if "seq" in data:
+                    self.received[data["seq"]] = time.time() - data["time"]
+
+    def close(self):
+        self.writer.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Open many concurrent live event streams against a running ASGI server "
+        "(uvicorn config.asgi:application), watching shops or the areas around "
+        "branches, publish menu events for random shops through Redis, and "
+        "report connect times, delivered events and delivery latency "
+        "percentiles. With --server-pid the server's memory per idle stream is "
+        "reported too. Expects a dataset from generate_dataset."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8001")
+        parser.add_argument("--streams", type=int, default=2000)
+        parser.add_argument(
+            "--area-share",
+            type=float,
+            default=0.5,
+            help="Share of the streams watching an area instead of a shop.",
+        )
+        parser.add_argument("--events", type=int, default=200)
+        parser.add_argument("--rate", type=float, default=50, help="Events per second.")
+        parser.add_argument("--connect-concurrency", type=int, default=200)
+        parser.add_argument(
+            "--idle", type=float, default=5, help="Seconds streams stay idle first."
+        )
+        parser.add_argument("--server-pid", type=int)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        # Every stream is an open socket.
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        wanted = options["streams"] + 100
+        if soft < wanted:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+
+        user = User.objects.order_by("id").first()
+        if user is None:
+            raise CommandError("No users found, run generate_dataset first.")
+        branches = list(
+            Branch.objects.filter(
+                is_active=True, shop__is_active=True, latitude__isnull=False
+            )
+            .order_by("?")
+            .values_list("shop_id", "latitude", "longitude")[:SAMPLE_SIZE]
+        )
+        if not branches:
+            raise CommandError("No active branches found, run generate_dataset first.")
+        asyncio.run(self.run(options, str(AccessToken.for_user(user)), branches))
+
+    def make_streams(self, options, token, branches, rng):
+        streams = []
+        for _ in range(options["streams"]):
+            shop_id, latitude, longitude = rng.choice(branches)
+            if rng.random() < options["area_share"]:
+                query = {
+                    "latitude": latitude,
+                    "longitude": longitude,
+                    "radius": AREA_RADIUS_KM,
+                }
+                cells = grid_cells_within_radius(
+                    latitude, longitude, AREA_RADIUS_KM, settings.LIVE_EVENTS_CELL_SIZE
+                )
+                topics = {f"cell:{cell}" for cell in cells}
+            else:
+                query = {"shop": shop_id}
+                topics = {f"shop:{shop_id}"}
+            streams.append(EventStream(options["base_url"], token, query, topics))
+        return streams
+
+    async def run(self, options, token, branches):
+        rng = random.Random(options["seed"])
+        positions = {}
+        for shop_id, latitude, longitude in branches:
+            positions.setdefault(shop_id, []).append((latitude, longitude))
+        streams = self.make_streams(options, token, branches, rng)
+        pid = options["server_pid"]
+        rss_before = read_rss_kb(pid) if pid else None
+
+        self.stdout.write(f"Opening {len(streams)} streams...")
+        semaphore = asyncio.Semaphore(options["connect_concurrency"])
+
+        async def connect(stream):
+            async with semaphore:
+                try:
+                    await stream.connect()
+                except (OSError, ValueError, asyncio.IncompleteReadError) as error:
+                    stream.error = error
+
+        started = time.perf_counter()
+        await asyncio.gather(*(connect(stream) for stream in streams))
+        connected = [stream for stream in streams if stream.error is None]
+        readers = [asyncio.create_task(stream.read()) for stream in connected]
+        self.stdout.write(
+            f"{len(connected)} streams open in {time.perf_counter() - started:.1f} s, "
+            f"{len(streams) - len(connected)} failed"
+        )
+        await asyncio.sleep(options["idle"])
+        rss_idle = read_rss_kb(pid) if pid else None
+
+        client = redis.asyncio.Redis(
+            host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0
+        )
+        expected = 0
+        shop_ids = sorted(positions)
+        for seq in range(options["events"]):
+            shop_id = rng.choice(shop_ids)
+            event = {"type": "menu", "shop": shop_id, "seq": seq}
+            event["cells"] = get_cells(positions[shop_id])
+            topics = {f"shop:{shop_id}", *(f"cell:{cell}" for cell in event["cells"])}
+            expected += sum(1 for stream in connected if stream.topics & topics)
+            await client.publish(CHANNEL, encode(event))
+            await asyncio.sleep(1 / options["rate"])
+        await client.aclose()
+        # Stragglers.
+        await asyncio.sleep(2)
+
+        self.report(connected, expected, rss_before, rss_idle)
+        for stream in connected:
+            stream.close()
+        for reader in readers:
+            reader.cancel()
+
+    def report(self, connected, expected, rss_before, rss_idle):
+        connect_times = sorted(stream.connect_time * 1000 for stream in connected)
+        latencies = sorted(
+            latency * 1000
+            for stream in connected
+            for latency in stream.received.values()
+        )
+        dropped = sum(1 for stream in connected if stream.error is not None)
+        self.stdout.write(
+            f"connect ms: p50 {percentile(connect_times, 0.5) or 0:.1f}, "
+            f"p95 {percentile(connect_times, 0.95) or 0:.1f}, "
+            f"p99 {percentile(connect_times, 0.99) or 0:.1f}"
+        )
+        self.stdout.write(
+            f"events: {len(latencies)} delivered of {expected} expected, "
+            f"{dropped} streams dropped"
+        )
+        if latencies:
+            self.stdout.write(
+                f"delivery ms: p50 {percentile(latencies, 0.5):.1f}, "
+                f"p95 {percentile(latencies, 0.95):.1f}, "
+                f"p99 {percentile(latencies, 0.99):.1f}, max {latencies[-1]:.1f}"
+            )
+        if rss_before is not None and connected:
+            self.stdout.write(
+                f"server RSS: {rss_before / 1024:.1f} MB before, "
+                f"{rss_idle / 1024:.1f} MB with {len(connected)} idle streams, "
+                f"{(rss_idle - rss_before) / len(connected):.1f} KB per stream"
+            )
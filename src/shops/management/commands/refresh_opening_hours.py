@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from shops.models import Branch
+from shops.opening_hours import (
+    get_moved_branch_ids,
+    invalidate_open_now,
+    rebuild_opening_periods,
+)
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the precomputed weekly opening periods of branches whose time "
+        "zone changed its UTC offset, such as for daylight saving time, and "
+        "drop the cached branches open now. Run it hourly. With --all every "
+        "branch is rebuilt."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            branch_ids = list(Branch.objects.values_list("id", flat=True))
+        else:
+            branch_ids = sorted(get_moved_branch_ids())
+        for start in range(0, len(branch_ids), BATCH_SIZE):
+            end = start + BATCH_SIZE
+            rebuild_opening_periods(branch_ids[start:end])
+        if branch_ids:
+            invalidate_open_now()
+        self.stdout.write(f"Rebuilt the opening periods of {len(branch_ids)} branches")
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.2 on 2026-10-19 10:05
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("shops", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="branch",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["shop"],
+                name="shops_branch_active_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="shop",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["id"],
+                name="shops_shop_active_idx",
+            ),
+        ),
+    ]
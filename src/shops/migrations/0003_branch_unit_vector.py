@@ -0,0 +1,47 @@
+# Generated by Django 5.1.2 on 2026-10-19 12:40
+
+from django.db import migrations, models
+
+from shops.geo import unit_vector
+
+
+def populate_unit_vectors(apps, schema_editor):
+    Branch = apps.get_model("shops", "Branch")
+    branches = Branch.objects.filter(
+        latitude__isnull=False, longitude__isnull=False
+    ).only("id", "latitude", "longitude")
+    batch = []
+    for branch in branches.iterator():
+        branch.unit_x, branch.unit_y, branch.unit_z = unit_vector(
+            branch.latitude, branch.longitude
+        )
+        batch.append(branch)
+        if len(batch) >= 1000:
+            Branch.objects.bulk_update(batch, ["unit_x", "unit_y", "unit_z"])
+            batch = []
+    Branch.objects.bulk_update(batch, ["unit_x", "unit_y", "unit_z"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("shops", "0002_active_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="branch",
+            name="unit_x",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="branch",
+            name="unit_y",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="branch",
+            name="unit_z",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(populate_unit_vectors, migrations.RunPython.noop),
+    ]
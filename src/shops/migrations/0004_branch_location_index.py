@@ -0,0 +1,24 @@
+# Generated by Django 5.1.2 on 2026-10-19 14:30
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("shops", "0003_branch_unit_vector"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="branch",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["latitude", "longitude"],
+                name="shops_branch_location_idx",
+            ),
+        ),
+    ]
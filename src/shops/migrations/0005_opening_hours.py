@@ -0,0 +1,167 @@
+# Generated by Django 5.1.2 on 2026-10-19 11:13
+
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+
+import shops.schedule
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("shops", "0004_branch_location_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="branch",
+            name="timezone",
+            field=models.CharField(
+                default="Asia/Tashkent",
+                max_length=64,
+                validators=[shops.schedule.validate_timezone],
+            ),
+        ),
+        migrations.CreateModel(
+            name="OpeningHours",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "weekday",
+                    models.PositiveSmallIntegerField(
+                        choices=[
+                            (0, "Monday"),
+                            (1, "Tuesday"),
+                            (2, "Wednesday"),
+                            (3, "Thursday"),
+                            (4, "Friday"),
+                            (5, "Saturday"),
+                            (6, "Sunday"),
+                        ]
+                    ),
+                ),
+                ("opens", models.TimeField()),
+                ("closes", models.TimeField()),
+                (
+                    "branch",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="opening_hours",
+                        to="shops.branch",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "opening hours",
+                "ordering": ["weekday", "opens"],
+            },
+        ),
+        migrations.CreateModel(
+            name="OpeningException",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("opens", models.TimeField(blank=True, null=True)),
+                ("closes", models.TimeField(blank=True, null=True)),
+                (
+                    "day",
+                    django.contrib.postgres.fields.ranges.DateTimeRangeField(
+                        editable=False
+                    ),
+                ),
+                (
+                    "hours",
+                    django.contrib.postgres.fields.ranges.DateTimeRangeField(
+                        blank=True, editable=False, null=True
+                    ),
+                ),
+                (
+                    "branch",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="opening_exceptions",
+                        to="shops.branch",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["date", "opens"],
+                "indexes": [
+                    models.Index(fields=["date"], name="shops_exception_date_idx"),
+                    django.contrib.postgres.indexes.GistIndex(
+                        fields=["day"], name="shops_exception_day_idx"
+                    ),
+                    django.contrib.postgres.indexes.GistIndex(
+                        fields=["hours"], name="shops_exception_hours_idx"
+                    ),
+                ],
+                "constraints": [
+                    models.CheckConstraint(
+                        condition=models.Q(
+                            models.Q(("closes__isnull", True), ("opens__isnull", True)),
+                            models.Q(
+                                ("closes__isnull", False), ("opens__isnull", False)
+                            ),
+                            _connector="OR",
+                        ),
+                        name="shops_exception_hours_check",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="OpeningPeriod",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("minutes", django.contrib.postgres.fields.ranges.IntegerRangeField()),
+                ("opened", models.SmallIntegerField()),
+                ("utc_offset", models.SmallIntegerField()),
+                (
+                    "branch",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="opening_periods",
+                        to="shops.branch",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    django.contrib.postgres.indexes.GistIndex(
+                        fields=["minutes"], name="shops_period_minutes_idx"
+                    ),
+                    models.Index(
+                        models.F("minutes__startswith"), name="shops_period_start_idx"
+                    ),
+                    models.Index(
+                        models.F("minutes__endswith"), name="shops_period_end_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
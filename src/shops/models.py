@@ -1,5 +1,12 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.fields import DateTimeRangeField, IntegerRangeField
+from django.contrib.postgres.indexes import GistIndex
 from django.db import models
+from django.db.models import F, Q
+
+from .geo import unit_vector
+from .querysets import BranchQuerySet
+from .schedule import day_range, local_range, validate_timezone
 
 User = get_user_model()
 
@@ -15,6 +22,15 @@ class Shop(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=Q(is_active=True),
+                name="shops_shop_active_idx",
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -28,9 +44,154 @@ class Branch(models.Model):
     longitude = models.DecimalField(
         max_digits=9, decimal_places=6, blank=True, null=True
     )
+    # Position on the unit sphere, maintained by save() for proximity queries.
+    unit_x = models.FloatField(blank=True, null=True, editable=False)
+    unit_y = models.FloatField(blank=True, null=True, editable=False)
+    unit_z = models.FloatField(blank=True, null=True, editable=False)
     is_active = models.BooleanField(default=True)
+    # Opening hours are in the branch's local time.
+    timezone = models.CharField(
+        max_length=64, default="Asia/Tashkent", validators=[validate_timezone]
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = BranchQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["shop"],
+                condition=Q(is_active=True),
+                name="shops_branch_active_idx",
+            ),
+            models.Index(
+                fields=["latitude", "longitude"],
+                condition=Q(is_active=True),
+                name="shops_branch_location_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.shop.name} - {self.address}"
+
+    def save(self, *args, **kwargs):
+        if self.latitude is None or self.longitude is None:
+            self.unit_x = self.unit_y = self.unit_z = None
+        else:
+            self.unit_x, self.unit_y, self.unit_z = unit_vector(
+                self.latitude, self.longitude
+            )
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"latitude", "longitude"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "unit_x", "unit_y", "unit_z"}
+        super().save(*args, **kwargs)
+
+
+class Weekday(models.IntegerChoices):
+    MONDAY = 0
+    TUESDAY = 1
+    WEDNESDAY = 2
+    THURSDAY = 3
+    FRIDAY = 4
+    SATURDAY = 5
+    SUNDAY = 6
+
+
+class OpeningHours(models.Model):
+    """
+    Weekly opening hours of a branch. Hours closing at or before they open
+    end on the next day, so 22:00 to 02:00 is open overnight and 00:00 to
+    00:00 all day.
+    """
+
+    branch = models.ForeignKey(
+        Branch, on_delete=models.CASCADE, related_name="opening_hours"
+    )
+    weekday = models.PositiveSmallIntegerField(choices=Weekday.choices)
+    opens = models.TimeField()
+    closes = models.TimeField()
+
+    class Meta:
+        ordering = ["weekday", "opens"]
+        verbose_name_plural = "opening hours"
+
+    def __str__(self):
+        return f"{self.get_weekday_display()} {self.opens:%H:%M}-{self.closes:%H:%M}"
+
+
+class OpeningException(models.Model):
+    """
+    Opening hours replacing the weekly ones on a date, such as a holiday.
+    Without hours the branch is closed all day; several exceptions on the
+    same date add up. Weekly hours opening the evening before and running
+    past midnight are kept.
+    """
+
+    branch = models.ForeignKey(
+        Branch, on_delete=models.CASCADE, related_name="opening_exceptions"
+    )
+    date = models.DateField()
+    opens = models.TimeField(blank=True, null=True)
+    closes = models.TimeField(blank=True, null=True)
+    # The local date and the hours as moments, maintained by save() and
+    # shops.opening_hours for the open filters.
+    day = DateTimeRangeField(editable=False)
+    hours = DateTimeRangeField(blank=True, null=True, editable=False)
+
+    class Meta:
+        ordering = ["date", "opens"]
+        indexes = [
+            models.Index(fields=["date"], name="shops_exception_date_idx"),
+            GistIndex(fields=["day"], name="shops_exception_day_idx"),
+            GistIndex(fields=["hours"], name="shops_exception_hours_idx"),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(opens__isnull=True, closes__isnull=True)
+                | Q(opens__isnull=False, closes__isnull=False),
+                name="shops_exception_hours_check",
+            ),
+        ]
+
+    def __str__(self):
+        if self.opens is None:
+            return f"{self.date} closed"
+        return f"{self.date} {self.opens:%H:%M}-{self.closes:%H:%M}"
+
+    def set_ranges(self, timezone_name):
+        self.day = day_range(self.date, timezone_name)
+        if self.opens is None:
+            self.hours = None
+        else:
+            self.hours = local_range(self.date, self.opens, self.closes, timezone_name)
+
+    def save(self, *args, **kwargs):
+        self.set_ranges(self.branch.timezone)
+        super().save(*args, **kwargs)
+
+
+class OpeningPeriod(models.Model):
+    """
+    The weekly opening hours of a branch as ranges of minutes since Monday
+    00:00 UTC, rebuilt by shops.opening_hours. ``opened`` is the minute
+    the hours opened at, negative for the part of hours carried over from
+    the previous week, to find the date they belong to. ``utc_offset`` is
+    the branch's offset in minutes they were computed with, to find the
+    periods a daylight saving change moved.
+    """
+
+    branch = models.ForeignKey(
+        Branch, on_delete=models.CASCADE, related_name="opening_periods"
+    )
+    minutes = IntegerRangeField()
+    opened = models.SmallIntegerField()
+    utc_offset = models.SmallIntegerField()
+
+    class Meta:
+        indexes = [
+            GistIndex(fields=["minutes"], name="shops_period_minutes_idx"),
+            # For the next moment a branch opens or closes.
+            models.Index(F("minutes__startswith"), name="shops_period_start_idx"),
+            models.Index(F("minutes__endswith"), name="shops_period_end_idx"),
+        ]
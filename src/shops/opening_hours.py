@@ -0,0 +1,258 @@
+"""
+Which branches are open at a moment, answered from precomputed ranges
+behind GiST indexes rather than by working through schedules row by row.
+
+Weekly hours are kept as OpeningPeriod ranges of minutes since Monday
+00:00 UTC and exceptions as ranges of moments, so a branch is open when
+
+    (a weekly period contains the minute of the week and no exception
+    falls on the day it opened) or the hours of an exception contain the
+    moment
+
+Periods are built with each time zone's current UTC offset; the
+refresh_opening_hours command rebuilds those a daylight saving change moved.
+
+The branches open now are cached in Redis until the next moment one of
+them opens or closes, and dropped when a schedule changes.
+"""
+
+import json
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    DateTimeField,
+    Exists,
+    ExpressionWrapper,
+    OuterRef,
+    Q,
+    Value,
+)
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from config.metrics import InstrumentedRedis
+from config.replicas import read_from_primary
+
+from .models import Branch, OpeningException, OpeningHours, OpeningPeriod
+from .schedule import (
+    MINUTES_PER_WEEK,
+    UTC,
+    minute_of_week,
+    utc_offset,
+    week_start,
+    weekly_periods,
+)
+
+logger = logging.getLogger(__name__)
+
+redis_instance = InstrumentedRedis(
+    host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0
+)
+
+OPEN_NOW_KEY = "shops:open_now"
+OPEN_NOW_GENERATION_KEY = "shops:open_now:generation"
+
+
+def filter_open_at(queryset, moment):
+    """
+    Branches of ``queryset`` open at the aware datetime ``moment``.
+    Branches without opening hours are never open.
+    """
+    # Exceptions replace the hours opening on their date, but not the end
+    # of the previous evening's hours running past midnight.
+    opened = ExpressionWrapper(
+        Value(week_start(moment)) + OuterRef("opened") * Value(timedelta(minutes=1)),
+        output_field=DateTimeField(),
+    )
+    replaced = OpeningException.objects.filter(
+        branch_id=OuterRef("branch_id"), day__contains=opened
+    )
+    weekly = OpeningPeriod.objects.filter(
+        ~Exists(replaced), minutes__contains=minute_of_week(moment)
+    )
+    exceptional = OpeningException.objects.filter(hours__contains=moment)
+    return queryset.filter(
+        Q(pk__in=weekly.values("branch_id")) | Q(pk__in=exceptional.values("branch_id"))
+    )
+
+
+def rebuild_opening_periods(branch_ids, moment=None):
+    """
+    Rebuild the weekly periods and exception ranges of branches from their
+    opening hours, with the UTC offsets of their time zones at ``moment``.
+    """
+    moment = moment or timezone.now()
+    timezones = dict(
+        Branch.objects.filter(pk__in=list(branch_ids)).values_list("id", "timezone")
+    )
+    offsets = {name: utc_offset(name, moment) for name in set(timezones.values())}
+    hours = defaultdict(list)
+    for branch_id, *row in OpeningHours.objects.filter(
+        branch_id__in=timezones
+    ).values_list("branch_id", "weekday", "opens", "closes"):
+        hours[branch_id].append(row)
+    periods = []
+    for branch_id, branch_hours in hours.items():
+        offset = offsets[timezones[branch_id]]
+        for row in branch_hours:
+            # Hours split at the end of the week opened in the week before
+            # their second part.
+            parts = weekly_periods([row], offset)
+            opened = parts[0][0]
+            periods.extend(
+                OpeningPeriod(
+                    branch_id=branch_id,
+                    minutes=period,
+                    opened=opened - index * MINUTES_PER_WEEK,
+                    utc_offset=offset,
+                )
+                for index, period in enumerate(parts)
+            )
+    exceptions = list(OpeningException.objects.filter(branch_id__in=timezones))
+    for exception in exceptions:
+        exception.set_ranges(timezones[exception.branch_id])
+
+    with transaction.atomic():
+        OpeningPeriod.objects.filter(branch_id__in=timezones).delete()
+        OpeningPeriod.objects.bulk_create(periods, batch_size=1000)
+        OpeningException.objects.bulk_update(
+            exceptions, ["day", "hours"], batch_size=1000
+        )
+
+
+def get_moved_branch_ids(moment=None):
+    """
+    Ids of the branches whose periods were built with another UTC offset
+    than their time zone has at ``moment``.
+    """
+    moment = moment or timezone.now()
+    branch_ids = set()
+    for name in Branch.objects.values_list("timezone", flat=True).distinct():
+        branch_ids.update(
+            OpeningPeriod.objects.filter(branch__timezone=name)
+            .exclude(utc_offset=utc_offset(name, moment))
+            .values_list("branch_id", flat=True)
+        )
+    return branch_ids
+
+
+def next_change(moment):
+    """
+    The next moment after ``moment`` at which a branch opens or closes, or
+    None without any opening hours.
+    """
+    minute = minute_of_week(moment)
+    start = week_start(moment)
+    changes = []
+    for bound in ("minutes__startswith", "minutes__endswith"):
+        periods = OpeningPeriod.objects.order_by(bound).values_list(bound, flat=True)
+        later = periods.filter(**{f"{bound}__gt": minute}).first()
+        if later is None:
+            # The first of next week.
+            later = periods.first()
+            later = None if later is None else later + MINUTES_PER_WEEK
+        if later is not None:
+            changes.append(start + timedelta(minutes=later))
+
+    # Exception ranges start on their date and end at most a day later.
+    exceptions = OpeningException.objects.filter(
+        date__gte=(moment - timedelta(days=2)).date()
+    )
+    for bound in (
+        "day__startswith",
+        "day__endswith",
+        "hours__startswith",
+        "hours__endswith",
+    ):
+        later = (
+            exceptions.filter(**{f"{bound}__gt": moment})
+            .order_by(bound)
+            .values_list(bound, flat=True)
+            .first()
+        )
+        if later is not None:
+            changes.append(later)
+    return min(changes, default=None)
+
+
+def get_branch_ids_open_now():
+    """
+    Ids of the branches open now, whether active or not.
+    """
+    try:
+        cached, generation = redis_instance.mget(OPEN_NOW_KEY, OPEN_NOW_GENERATION_KEY)
+        generation = generation or b"0"
+    except redis.RedisError:
+        logger.exception("Could not read the branches open now")
+        cached, generation = None, None
+    if cached is not None:
+        return json.loads(cached)
+
+    now = timezone.now()
+    with read_from_primary():
+        branch_ids = sorted(
+            filter_open_at(Branch.objects.all(), now).values_list("id", flat=True)
+        )
+        change = next_change(now)
+    timeout = settings.OPEN_NOW_CACHE_TIMEOUT
+    if change is not None:
+        timeout = min(timeout, (change - now).total_seconds())
+    if timeout > 0 and generation is not None:
+        cache_open_now(branch_ids, int(timeout * 1000), generation)
+    return branch_ids
+
+
+def cache_open_now(branch_ids, timeout_ms, generation):
+    """
+    Cache branch ids computed after reading ``generation``, unless an
+    invalidation has happened since and they may be stale already.
+    """
+    try:
+        with redis_instance.pipeline() as pipeline:
+            pipeline.watch(OPEN_NOW_GENERATION_KEY)
+            if (pipeline.get(OPEN_NOW_GENERATION_KEY) or b"0") != generation:
+                return
+            pipeline.multi()
+            pipeline.set(OPEN_NOW_KEY, json.dumps(branch_ids), px=timeout_ms)
+            pipeline.execute()
+    except redis.WatchError:
+        # Invalidated while caching.
+        pass
+    except redis.RedisError:
+        logger.exception("Could not cache the branches open now")
+
+
+def invalidate_open_now():
+    try:
+        redis_instance.incr(OPEN_NOW_GENERATION_KEY)
+        redis_instance.delete(OPEN_NOW_KEY)
+    except redis.RedisError:
+        logger.exception("Could not invalidate the branches open now")
+
+
+def get_open_branches(query_params):
+    """
+    The branches open at the time a request's ``open_at`` (an ISO 8601 date
+    and time, UTC without an offset) or ``open_now`` parameter asks for, as
+    ids or a subquery for ``pk__in``. None when the request asks for neither.
+    """
+    open_at = query_params.get("open_at")
+    if open_at:
+        try:
+            moment = parse_datetime(open_at)
+        except ValueError:
+            moment = None
+        if moment is None:
+            raise ValidationError({"open_at": "Expected an ISO 8601 date and time."})
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment, UTC)
+        return filter_open_at(Branch.objects.all(), moment).values("pk")
+    if query_params.get("open_now") in ("1", "true"):
+        return get_branch_ids_open_now()
+    return None
@@ -0,0 +1,51 @@
+from django.db import models
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Least, Sqrt
+
+from .geo import EARTH_RADIUS_KM, chord_km, unit_vector
+
+
+class BranchQuerySet(models.QuerySet):
+    """
+    Proximity queries over the unit vectors stored on each branch.
+
+    The dot product of two unit vectors is the cosine of the angle between
+    them, so distance only needs three multiplications per row instead of
+    the per-row trigonometry of the haversine formula. It is clamped to 1
+    because rounding can push it just above when the user stands at the
+    branch, which would otherwise make the square root fail.
+    """
+
+    def annotate_distance(self, latitude, longitude):
+        """
+        Annotate ``distance``: the chord length in kilometers. It grows with
+        the surface distance, so it can be used for sorting and for radius
+        filters through ``geo.chord_km()``.
+        """
+        x, y, z = unit_vector(latitude, longitude)
+        dot = Least(
+            F("unit_x") * Value(x) + F("unit_y") * Value(y) + F("unit_z") * Value(z),
+            Value(1.0),
+        )
+        distance = Sqrt(Value(2.0) - Value(2.0) * dot) * Value(EARTH_RADIUS_KM)
+        return self.annotate(
+            distance=models.ExpressionWrapper(distance, output_field=FloatField())
+        )
+
+    def nearest_to(self, latitude, longitude):
+        return self.annotate_distance(latitude, longitude).order_by("distance")
+
+    def within_radius(self, latitude, longitude, radius_km):
+        return self.annotate_distance(latitude, longitude).filter(
+            distance__lte=chord_km(radius_km)
+        )
+
+    def within_bbox(self, west, south, east, north):
+        """
+        Branches inside a bounding box. A box whose west edge is greater than
+        its east edge crosses the antimeridian.
+        """
+        queryset = self.filter(latitude__gte=south, latitude__lte=north)
+        if west <= east:
+            return queryset.filter(longitude__gte=west, longitude__lte=east)
+        return queryset.filter(Q(longitude__gte=west) | Q(longitude__lte=east))
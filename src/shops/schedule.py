@@ -0,0 +1,89 @@
+"""
+Opening hours arithmetic, without the models.
+"""
+
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.core.exceptions import ValidationError
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+UTC = ZoneInfo("UTC")
+
+
+def validate_timezone(value):
+    try:
+        ZoneInfo(value)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValidationError(f"{value!r} is not a known time zone.")
+
+
+def week_start(moment):
+    """
+    Monday 00:00 UTC of the week of ``moment``.
+    """
+    moment = moment.astimezone(UTC)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(
+        days=moment.weekday()
+    )
+
+
+def minute_of_week(moment):
+    """
+    Whole minutes since Monday 00:00 UTC.
+    """
+    return int((moment - week_start(moment)).total_seconds() // 60)
+
+
+def minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def utc_offset(timezone_name, moment):
+    """
+    Offset of the time zone from UTC at ``moment``, in minutes.
+    """
+    offset = moment.astimezone(ZoneInfo(timezone_name)).utcoffset()
+    return int(offset.total_seconds() // 60)
+
+
+def weekly_periods(hours, offset):
+    """
+    ``(start, end)`` UTC minutes of the week during which a branch is open,
+    from ``(weekday, opens, closes)`` in local time ``offset`` minutes ahead
+    of UTC. Hours closing at or before they open end on the next day.
+    Periods running past the end of the week are split in two.
+    """
+    periods = []
+    for weekday, opens, closes in hours:
+        start = weekday * MINUTES_PER_DAY + minutes(opens)
+        end = weekday * MINUTES_PER_DAY + minutes(closes)
+        if end <= start:
+            end += MINUTES_PER_DAY
+        start, end = start - offset, end - offset
+        shift = start // MINUTES_PER_WEEK * MINUTES_PER_WEEK
+        start, end = start - shift, end - shift
+        if end > MINUTES_PER_WEEK:
+            periods.append((start, MINUTES_PER_WEEK))
+            periods.append((0, end - MINUTES_PER_WEEK))
+        else:
+            periods.append((start, end))
+    return periods
+
+
+def local_range(date, opens, closes, timezone_name):
+    """
+    Aware start and end of ``opens`` to ``closes`` on a local date, ending
+    on the next day when ``closes`` is not after ``opens``.
+    """
+    zone = ZoneInfo(timezone_name)
+    end_date = date if closes > opens else date + timedelta(days=1)
+    return (
+        datetime.combine(date, opens, tzinfo=zone),
+        datetime.combine(end_date, closes, tzinfo=zone),
+    )
+
+
+def day_range(date, timezone_name):
+    return local_range(date, time.min, time.min, timezone_name)
@@ -1,6 +1,8 @@
+from django.db import transaction
 from rest_framework import serializers
 
-from .models import Branch, Shop
+from .models import Branch, OpeningHours, Shop
+from .opening_hours import invalidate_open_now, rebuild_opening_periods
 
 
 class ShopSerializer(serializers.ModelSerializer):
@@ -19,8 +21,15 @@ class ShopSerializer(serializers.ModelSerializer):
         extra_kwargs = {"owner": {"read_only": True}}
 
 
+class OpeningHoursSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OpeningHours
+        fields = ["weekday", "opens", "closes"]
+
+
 class BranchSerializer(serializers.ModelSerializer):
     shop = ShopSerializer(read_only=True)
+    opening_hours = OpeningHoursSerializer(many=True, required=False)
 
     class Meta:
         model = Branch
@@ -31,6 +40,26 @@ class BranchSerializer(serializers.ModelSerializer):
             "latitude",
             "longitude",
             "is_active",
+            "timezone",
+            "opening_hours",
             "created_at",
             "updated_at",
         ]
+
+    def create(self, validated_data):
+        opening_hours = validated_data.pop("opening_hours", [])
+        branch = super().create(validated_data)
+        OpeningHours.objects.bulk_create(
+            OpeningHours(branch=branch, **hours) for hours in opening_hours
+        )
+        rebuild_opening_periods([branch.pk])
+        transaction.on_commit(invalidate_open_now)
+        return branch
+
+
+class BranchMarkerSerializer(serializers.ModelSerializer):
+    shop_name = serializers.CharField(source="shop.name", read_only=True)
+
+    class Meta:
+        model = Branch
+        fields = ["id", "shop", "shop_name", "address", "latitude", "longitude"]
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .events import publish_branch_event, publish_shop_events
+from .locator import publish_branch_changes
+from .models import Branch, OpeningException, OpeningHours, Shop
+from .opening_hours import invalidate_open_now, rebuild_opening_periods
+from .tile_cache import GeoTileCache
+
+
+@receiver(pre_save, sender=Branch)
+def remember_previous_branch(sender, instance, **kwargs):
+    if not instance.pk:
+        return
+    previous = (
+        Branch.objects.filter(pk=instance.pk)
+        .values_list("latitude", "longitude", "timezone")
+        .first()
+    )
+    if previous is None:
+        return
+    # A moved branch leaves the tiles and areas around its old position too.
+    if settings.GEO_TILE_CACHE_ENABLED or settings.LIVE_EVENTS_ENABLED:
+        instance._previous_position = previous[:2]
+    instance._previous_timezone = previous[2]
+
+
+@receiver([post_save, post_delete], sender=Branch)
+def branch_changed(sender, instance, **kwargs):
+    if settings.BRANCH_LOCATOR_ENABLED:
+        branch_ids = [instance.pk]
+        transaction.on_commit(lambda: publish_branch_changes(branch_ids))
+    if settings.GEO_TILE_CACHE_ENABLED:
+        positions = [(instance.latitude, instance.longitude)]
+        previous_position = getattr(instance, "_previous_position", None)
+        if previous_position and previous_position != positions[0]:
+            positions.append(previous_position)
+        transaction.on_commit(lambda: GeoTileCache().invalidate(positions))
+    if settings.LIVE_EVENTS_ENABLED:
+        branch_id, shop_id = instance.pk, instance.shop_id
+        areas = [(instance.latitude, instance.longitude)]
+        if getattr(instance, "_previous_position", None):
+            areas.append(instance._previous_position)
+        transaction.on_commit(lambda: publish_branch_event(branch_id, shop_id, areas))
+
+
+@receiver(post_save, sender=Branch)
+def branch_saved(sender, instance, created, update_fields, **kwargs):
+    # Periods and exception ranges depend on the branch's time zone.
+    previous_timezone = getattr(instance, "_previous_timezone", None)
+    if (
+        not created
+        and (update_fields is None or "timezone" in update_fields)
+        and previous_timezone not in (None, instance.timezone)
+    ):
+        rebuild_opening_periods([instance.pk])
+        transaction.on_commit(invalidate_open_now)
+
+
+@receiver([post_save, post_delete], sender=OpeningHours)
+@receiver([post_save, post_delete], sender=OpeningException)
+def schedule_changed(sender, instance, **kwargs):
+    rebuild_opening_periods([instance.branch_id])
+    transaction.on_commit(invalidate_open_now)
+
+
+@receiver(post_save, sender=Shop)
+def shop_changed(sender, instance, **kwargs):
+    # Activating or deactivating a shop adds or removes all of its branches.
+    if settings.BRANCH_LOCATOR_ENABLED:
+        branch_ids = list(instance.branches.values_list("id", flat=True))
+        transaction.on_commit(lambda: publish_branch_changes(branch_ids))
+    if settings.GEO_TILE_CACHE_ENABLED:
+        positions = list(instance.branches.values_list("latitude", "longitude"))
+        transaction.on_commit(lambda: GeoTileCache().invalidate(positions))
+    if settings.LIVE_EVENTS_ENABLED:
+        shop_ids = [instance.pk]
+        transaction.on_commit(lambda: publish_shop_events("shop", shop_ids))
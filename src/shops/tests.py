@@ -1,9 +1,43 @@
+import asyncio
+import json
+from datetime import date, datetime, time, timedelta
+from io import StringIO
+from unittest.mock import patch
+
+import redis
+import redis.asyncio
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
-from shops.models import Branch, Shop
+from config.asgi import application
+from config.testing import explain_without_seqscan, lagging_replica
+from products.models import Product
+from shops import events, locator, opening_hours
+from shops.event_stream import Subscriber
+from shops.geo import grid_cell
+from shops.locator import CHANGES_KEY, VERSION_KEY, BranchLocator, redis_instance
+from shops.models import (
+    Branch,
+    OpeningException,
+    OpeningHours,
+    OpeningPeriod,
+    Shop,
+    Weekday,
+)
+from shops.schedule import weekly_periods
+from shops.tile_cache import (
+    ACTIVE_COUNT_KEY,
+    TILE_INDEX_KEY,
+    UNCACHEABLE_TIMEOUT,
+    GeoTileCache,
+)
 
 User = get_user_model()
 
@@ -103,6 +137,31 @@ class BranchTests(APITestCase):
         # Assert that branches are sorted by distance
         self.assertEqual(response.data["results"][0]["address"], "Branch 1")
 
+    def test_list_branches_at_branch_location(self):
+        """The distance stays defined when the user stands at a branch"""
+        branch = Branch.objects.create(
+            shop=self.shop, address="Branch 1", latitude=41.311081, longitude=69.240562
+        )
+        self.client.force_authenticate(user=self.owner_user)
+        response = self.client.get(
+            f"{self.all_branches_url}?latitude=41.311081&longitude=69.240562"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"][0]["id"], branch.id)
+
+    def test_unit_vector_follows_coordinates(self):
+        branch = Branch.objects.create(
+            shop=self.shop, address="Branch 1", latitude=0, longitude=90
+        )
+        self.assertAlmostEqual(branch.unit_x, 0)
+        self.assertAlmostEqual(branch.unit_y, 1)
+        self.assertAlmostEqual(branch.unit_z, 0)
+
+        branch.latitude = 90
+        branch.save(update_fields=["latitude"])
+        branch.refresh_from_db()
+        self.assertAlmostEqual(branch.unit_z, 1)
+
     def test_list_branches_without_location_filter(self):
         Branch.objects.create(
             shop=self.shop, address="Branch 1", latitude=40.7128, longitude=-74.0060
@@ -114,3 +173,751 @@ class BranchTests(APITestCase):
         response = self.client.get(self.all_branches_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data["results"]), 2)
+
+
+class IndexUsageTests(TestCase):
+    def test_active_branch_list_uses_partial_indexes(self):
+        plan = explain_without_seqscan(
+            Branch.objects.filter(is_active=True, shop__is_active=True)
+        )
+        # Both partial indexes on branches cover exactly the active rows.
+        self.assertRegex(plan, "shops_branch_(active|location)_idx")
+        self.assertIn("shops_shop_active_idx", plan)
+
+    def test_map_viewport_uses_location_index(self):
+        plan = explain_without_seqscan(
+            Branch.objects.filter(is_active=True).within_bbox(69.0, 41.2, 69.5, 41.5)
+        )
+        self.assertIn("shops_branch_location_idx", plan)
+
+
+@override_settings(BRANCH_LOCATOR_ENABLED=True)
+class BranchLocatorTests(APITestCase):
+    def setUp(self):
+        redis_instance.delete(VERSION_KEY, CHANGES_KEY)
+        locator._locator = None
+        self.owner_user = User.objects.create_user(
+            phone_number="+1234567890", password="password", role="owner"
+        )
+        self.shop = Shop.objects.create(name="Coffee Shop", owner=self.owner_user)
+        self.other_shop = Shop.objects.create(name="Tea House", owner=self.owner_user)
+        self.near = Branch.objects.create(
+            shop=self.shop, address="Near", latitude=41.311081, longitude=69.240562
+        )
+        self.middle = Branch.objects.create(
+            shop=self.other_shop, address="Middle", latitude=41.33, longitude=69.28
+        )
+        self.far = Branch.objects.create(
+            shop=self.other_shop, address="Far", latitude=39.65, longitude=66.96
+        )
+        self.locator = BranchLocator()
+        self.locator.refresh()
+
+    def test_nearest_matches_sql_ordering(self):
+        ids, distances = self.locator.nearest(41.31, 69.24)
+        expected = Branch.objects.nearest_to(41.31, 69.24).values_list("id", flat=True)
+        self.assertEqual(ids.tolist(), list(expected))
+        self.assertLess(distances[0], 1)
+
+        ids, _ = self.locator.nearest(41.31, 69.24, limit=2)
+        self.assertEqual(ids.tolist(), [self.near.id, self.middle.id])
+
+    def test_shops_within_radius(self):
+        shop_ids = self.locator.shops_within_radius(41.31, 69.24, 1)
+        self.assertEqual(shop_ids.tolist(), [self.shop.id])
+        shop_ids = self.locator.shops_within_radius(41.31, 69.24, 10)
+        self.assertEqual(shop_ids.tolist(), [self.shop.id, self.other_shop.id])
+
+    def test_refresh_applies_changes_incrementally(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.near.is_active = False
+            self.near.save()
+            moved = Branch.objects.create(
+                shop=self.shop, address="New", latitude=41.3, longitude=69.2
+            )
+
+        with patch.object(self.locator, "load") as load:
+            self.locator.refresh()
+        load.assert_not_called()
+        self.assertNotIn(self.near.id, self.locator.ids.tolist())
+        self.assertIn(moved.id, self.locator.ids.tolist())
+
+    def test_shop_deactivation_removes_its_branches(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other_shop.is_active = False
+            self.other_shop.save()
+
+        self.locator.refresh()
+        self.assertEqual(self.locator.ids.tolist(), [self.near.id])
+
+    def test_changes_published_with_their_version(self):
+        redis_instance.set(VERSION_KEY, 20000)
+        redis_instance.zadd(CHANGES_KEY, {"999": 1})
+        locator.publish_branch_changes([self.near.id, self.far.id])
+        self.assertEqual(int(redis_instance.get(VERSION_KEY)), 20001)
+        # Versions too old to apply are trimmed.
+        changes = redis_instance.zrange(CHANGES_KEY, 0, -1, withscores=True)
+        self.assertEqual(
+            {int(branch_id): version for branch_id, version in changes},
+            {self.near.id: 20001, self.far.id: 20001},
+        )
+
+    def test_refresh_reads_from_primary(self):
+        locator._locator = None
+        with self.captureOnCommitCallbacks(execute=True):
+            added = Branch.objects.create(
+                shop=self.shop, address="New", latitude=41.3, longitude=69.2
+            )
+        with lagging_replica():
+            self.locator.refresh()
+            fresh = BranchLocator()
+            fresh.refresh()
+        self.assertIn(added.id, self.locator.ids.tolist())
+        self.assertIn(added.id, fresh.ids.tolist())
+
+    def test_branch_list_served_by_locator(self):
+        self.client.force_authenticate(user=self.owner_user)
+        url = reverse("branch-list")
+        response = self.client.get(url, {"latitude": 39.6, "longitude": 66.9})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 3)
+        addresses = [branch["address"] for branch in response.data["results"]]
+        self.assertEqual(addresses, ["Far", "Near", "Middle"])
+
+
+@override_settings(GEO_TILE_CACHE_ENABLED=True)
+class GeoTileCacheTests(APITestCase):
+    def setUp(self):
+        self.cache = GeoTileCache()
+        self.clear_tiles()
+        self.owner_user = User.objects.create_user(
+            phone_number="+1234567890", password="password", role="owner"
+        )
+        self.shop = Shop.objects.create(name="Coffee Shop", owner=self.owner_user)
+        self.other_shop = Shop.objects.create(name="Tea House", owner=self.owner_user)
+        self.near = Branch.objects.create(
+            shop=self.shop, address="Near", latitude=41.311081, longitude=69.240562
+        )
+        self.middle = Branch.objects.create(
+            shop=self.other_shop, address="Middle", latitude=41.33, longitude=69.28
+        )
+        self.far = Branch.objects.create(
+            shop=self.other_shop, address="Far", latitude=39.65, longitude=66.96
+        )
+
+    def clear_tiles(self):
+        tiles = [tile.decode() for tile in redis_instance.zrange(TILE_INDEX_KEY, 0, -1)]
+        keys = [key for tile in tiles for key in redis_instance.keys(f"{tile}:*")]
+        redis_instance.delete(TILE_INDEX_KEY, ACTIVE_COUNT_KEY, *keys)
+
+    def test_shops_within_radius_served_from_tile(self):
+        self.assertEqual(
+            self.cache.shops_within_radius(41.311, 69.242, 1), [self.shop.id]
+        )
+        # Any point of the same tile and radius bucket reuses the entry.
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.cache.shops_within_radius(41.312, 69.241, 0.5), [self.shop.id]
+            )
+        self.assertEqual(
+            self.cache.shops_within_radius(41.312, 69.241, 4),
+            [self.shop.id, self.other_shop.id],
+        )
+        self.assertIsNone(self.cache.shops_within_radius(41.31, 69.24, 500))
+
+    @patch("shops.tile_cache.NEAREST_CANDIDATES", 2)
+    def test_tiles_filled_from_primary(self):
+        with lagging_replica():
+            nearest = self.cache.nearest_branches(41.31, 69.24)
+            shop_ids = self.cache.shops_within_radius(41.311, 69.242, 1)
+            count = self.cache.count(Branch.objects.filter(is_active=True))
+        self.assertEqual(nearest[0][0], self.near.id)
+        self.assertEqual(shop_ids, [self.shop.id])
+        self.assertEqual(count, 3)
+
+    @patch("shops.tile_cache.NEAREST_CANDIDATES", 3)
+    def test_nearest_branches_match_sql_ordering(self):
+        nearest = GeoTileCache(max_radius=1000).nearest_branches(41.31, 69.24)
+        expected = Branch.objects.nearest_to(41.31, 69.24).values_list("id", flat=True)
+        self.assertEqual([branch_id for branch_id, _ in nearest], list(expected))
+        self.assertLess(nearest[0][1], 1)
+
+    @patch("shops.tile_cache.NEAREST_CANDIDATES", 2)
+    def test_nearest_branches_keep_only_reachable_candidates(self):
+        nearest = self.cache.nearest_branches(41.31, 69.24)
+        self.assertEqual(
+            [branch_id for branch_id, _ in nearest], [self.near.id, self.middle.id]
+        )
+
+    def test_sparse_nearest_branches_not_cached(self):
+        # Fewer branches than candidates: a branch added anywhere would
+        # belong in the entry.
+        self.assertIsNone(self.cache.nearest_branches(41.31, 69.24))
+        # Remembered for a short while, to go straight to SQL.
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.cache.nearest_branches(41.31, 69.24))
+        key = f"{self.cache.get_tile(41.31, 69.24).key}:nearest"
+        self.assertLessEqual(redis_instance.ttl(key), UNCACHEABLE_TIMEOUT)
+
+    def test_invalidation_while_loading_wins(self):
+        tile = self.cache.get_tile(41.31, 69.24)
+        key = f"{tile.key}:r1"
+        _, generation = self.cache.get_cached(key)
+        # The branch moves after the request has read the old rows.
+        self.cache.invalidate([(41.31, 69.24)])
+        self.cache.fill(key, "[]", 60, generation, tile)
+        self.assertIsNone(redis_instance.get(key))
+
+        _, generation = self.cache.get_cached(key)
+        self.cache.fill(key, "[]", 60, generation, tile)
+        self.assertEqual(redis_instance.get(key), b"[]")
+
+    def test_redis_outage_falls_back_to_sql(self):
+        self.client.force_authenticate(user=self.owner_user)
+        with patch(
+            "shops.tile_cache.redis_instance.mget", side_effect=redis.ConnectionError
+        ), self.assertLogs("shops.tile_cache", "ERROR"):
+            self.assertIsNone(self.cache.shops_within_radius(41.31, 69.24, 1))
+            self.assertIsNone(self.cache.count(Branch.objects.all()))
+            response = self.client.get(
+                reverse("branch-list"), {"latitude": 41.34, "longitude": 69.29}
+            )
+        addresses = [branch["address"] for branch in response.data["results"]]
+        self.assertEqual(addresses, ["Middle", "Near", "Far"])
+
+    def test_moving_branch_invalidates_old_and_new_tiles(self):
+        self.cache.shops_within_radius(41.33, 69.28, 1)
+        self.cache.shops_within_radius(39.65, 66.96, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.middle.latitude = 39.651
+            self.middle.longitude = 66.961
+            self.middle.save()
+
+        self.assertEqual(self.cache.shops_within_radius(41.33, 69.28, 1), [])
+        self.assertEqual(
+            self.cache.shops_within_radius(39.65, 66.96, 1), [self.other_shop.id]
+        )
+
+    def test_deactivation_invalidates_tiles(self):
+        self.assertEqual(
+            self.cache.shops_within_radius(41.31, 69.24, 1), [self.shop.id]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.near.is_active = False
+            self.near.save()
+        self.assertEqual(self.cache.shops_within_radius(41.31, 69.24, 1), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Branch.objects.create(
+                shop=self.other_shop, address="New", latitude=41.3105, longitude=69.24
+            )
+        self.assertEqual(
+            self.cache.shops_within_radius(41.31, 69.24, 1), [self.other_shop.id]
+        )
+
+    @override_settings(GEO_TILE_CACHE_MAX_RADIUS=1000)
+    @patch("shops.tile_cache.NEAREST_CANDIDATES", 3)
+    def test_branch_list_served_from_tile(self):
+        self.client.force_authenticate(user=self.owner_user)
+        url = reverse("branch-list")
+        response = self.client.get(url, {"latitude": 41.34, "longitude": 69.29})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 3)
+        addresses = [branch["address"] for branch in response.data["results"]]
+        self.assertEqual(addresses, ["Middle", "Near", "Far"])
+        self.assertTrue(redis_instance.zcard(TILE_INDEX_KEY))
+
+        # Pages past the ranked candidates fall back to SQL.
+        with patch("shops.tile_cache.NEAREST_CANDIDATES", 1):
+            self.clear_tiles()
+            response = self.client.get(
+                url, {"latitude": 41.34, "longitude": 69.29, "page": 2, "page_size": 2}
+            )
+        addresses = [branch["address"] for branch in response.data["results"]]
+        self.assertEqual(addresses, ["Far"])
+
+
+class BranchMapTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            phone_number="+1234567890", password="password", role="owner"
+        )
+        self.shop = Shop.objects.create(name="Coffee Shop", owner=self.user)
+        # Two groups of branches about 10 km apart
+        for index in range(3):
+            Branch.objects.create(
+                shop=self.shop,
+                address=f"Center {index}",
+                latitude=41.31 + index * 0.001,
+                longitude=69.24,
+            )
+        for index in range(2):
+            Branch.objects.create(
+                shop=self.shop,
+                address=f"North {index}",
+                latitude=41.40 + index * 0.001,
+                longitude=69.30,
+            )
+        Branch.objects.create(
+            shop=self.shop, address="Outside", latitude=39.65, longitude=66.96
+        )
+        self.url = reverse("branch-map")
+        self.client.force_authenticate(user=self.user)
+
+    def test_small_viewport_returns_branches(self):
+        response = self.client.get(
+            self.url, {"bbox": "69.0,41.2,69.5,41.5", "zoom": 11}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["type"], "branches")
+        self.assertEqual(len(response.data["results"]), 5)
+
+    @patch("shops.views.BranchMapView.max_markers", 2)
+    def test_crowded_viewport_returns_clusters(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                self.url, {"bbox": "69.0,41.2,69.5,41.5", "zoom": 11}
+            )
+        self.assertEqual(response.data["type"], "clusters")
+        clusters = sorted(response.data["results"], key=lambda item: item["count"])
+        self.assertEqual([cluster["count"] for cluster in clusters], [2, 3])
+        self.assertAlmostEqual(clusters[1]["latitude"], 41.311, places=3)
+
+    @patch("shops.views.BranchMapView.max_markers", 2)
+    def test_crowded_close_up_viewport_returns_clusters(self):
+        response = self.client.get(
+            self.url, {"bbox": "69.23,41.30,69.25,41.32", "zoom": 16}
+        )
+        self.assertEqual(response.data["type"], "clusters")
+        self.assertEqual(sum(item["count"] for item in response.data["results"]), 3)
+
+    def test_invalid_bbox(self):
+        response = self.client.get(self.url, {"bbox": "69.0,41.2", "zoom": 11})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {"bbox": "69.0,91,69.5,92", "zoom": 11})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # The whole world at a street zoom level.
+        response = self.client.get(self.url, {"bbox": "-180,-85,180,85", "zoom": 16})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(LIVE_EVENTS_ENABLED=True)
+class LiveEventTests(APITestCase):
+    def setUp(self):
+        self.owner_user = User.objects.create_user(
+            phone_number="+1234567890", password="password", role="owner"
+        )
+        self.shop = Shop.objects.create(name="Coffee Shop", owner=self.owner_user)
+        self.branch = Branch.objects.create(
+            shop=self.shop, address="Center", latitude=41.311, longitude=69.24
+        )
+        self.pubsub = events.redis_instance.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(events.CHANNEL)
+        # Reads the subscription confirmation.
+        self.pubsub.get_message(timeout=1)
+
+    def tearDown(self):
+        self.pubsub.close()
+
+    def published(self):
+        messages = []
+        while message := self.pubsub.get_message(timeout=0.2):
+            event = json.loads(message["data"])
+            del event["time"]
+            messages.append(event)
+        return messages
+
+    def cell(self, latitude, longitude):
+        return grid_cell(latitude, longitude, settings.LIVE_EVENTS_CELL_SIZE)
+
+    def test_moved_branch_is_published_to_old_and_new_area(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.branch.latitude = 41.5
+            self.branch.save()
+
+        cells = sorted({self.cell(41.311, 69.24), self.cell(41.5, 69.24)})
+        self.assertEqual(
+            self.published(),
+            [
+                {
+                    "type": "branch",
+                    "shop": self.shop.id,
+                    "branch": self.branch.id,
+                    "cells": cells,
+                }
+            ],
+        )
+
+    def test_shop_and_menu_changes_are_published_to_branch_areas(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shop.is_active = False
+            self.shop.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(title="Latte", price=3, shop=self.shop)
+
+        cells = [self.cell(41.311, 69.24)]
+        self.assertEqual(
+            self.published(),
+            [
+                {"type": "shop", "shop": self.shop.id, "cells": cells},
+                {"type": "menu", "shop": self.shop.id, "cells": cells},
+            ],
+        )
+
+
+class EventStreamTests(SimpleTestCase):
+    def setUp(self):
+        self.token = str(AccessToken.for_user(User(id=1)))
+
+    def stream(self, query, scenario, authenticated=True):
+        """
+        Run ``scenario(messages)`` against a stream of ``/events/?query``,
+        ``messages`` being a queue of what the application sends.
+        """
+
+        async def main():
+            messages = asyncio.Queue()
+            disconnected = asyncio.Event()
+
+            async def receive():
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+
+            headers = []
+            if authenticated:
+                headers.append((b"authorization", f"Bearer {self.token}".encode()))
+            scope = {
+                "type": "http",
+                "method": "GET",
+                "path": "/events/",
+                "query_string": query.encode(),
+                "headers": headers,
+            }
+            task = asyncio.create_task(application(scope, receive, messages.put))
+            try:
+                return await asyncio.wait_for(scenario(messages), 5)
+            finally:
+                disconnected.set()
+                await asyncio.wait_for(task, 5)
+
+        return asyncio.run(main())
+
+    async def read_body(self, messages):
+        return (await messages.get())["body"]
+
+    def test_streams_events_of_watched_shops_and_areas(self):
+        cell = grid_cell(41.311, 69.24, settings.LIVE_EVENTS_CELL_SIZE)
+
+        async def scenario(messages):
+            client = redis.asyncio.Redis(
+                host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0
+            )
+            subscribed = (await client.pubsub_numsub(events.CHANNEL))[0][1]
+            self.assertEqual((await messages.get())["status"], 200)
+            self.assertEqual(await self.read_body(messages), b"retry: 3000\n\n")
+            while (await client.pubsub_numsub(events.CHANNEL))[0][1] == subscribed:
+                await asyncio.sleep(0.01)
+            for event in [
+                {"type": "menu", "shop": 2, "cells": []},
+                {"type": "menu", "shop": 1, "cells": []},
+                {"type": "branch", "shop": 3, "branch": 4, "cells": [cell]},
+            ]:
+                await client.publish(events.CHANNEL, events.encode(event))
+            await client.aclose()
+            return [await self.read_body(messages) for _ in range(2)]
+
+        first, second = self.stream(
+            "shop=1&latitude=41.311&longitude=69.24&radius=1", scenario
+        )
+        self.assertTrue(first.startswith(b"event: menu\ndata: "))
+        self.assertEqual(json.loads(first.split(b"data: ")[1])["shop"], 1)
+        self.assertTrue(second.startswith(b"event: branch\ndata: "))
+        self.assertEqual(json.loads(second.split(b"data: ")[1])["branch"], 4)
+
+    @override_settings(LIVE_EVENTS_HEARTBEAT=0.01)
+    def test_idle_stream_sends_heartbeats(self):
+        async def scenario(messages):
+            await messages.get()
+            await messages.get()
+            return await self.read_body(messages)
+
+        self.assertEqual(self.stream("shop=1", scenario), b": ping\n\n")
+
+    def test_stream_closes_when_token_expires(self):
+        token = AccessToken.for_user(User(id=1))
+        token.set_exp(lifetime=timedelta(seconds=2))
+        self.token = str(token)
+
+        async def scenario(messages):
+            await messages.get()
+            await messages.get()
+            return [await self.read_body(messages) for _ in range(2)]
+
+        self.assertEqual(
+            self.stream("shop=1", scenario), [b"event: expired\ndata: {}\n\n", b""]
+        )
+
+    def test_rejected_streams(self):
+        async def status_of(messages):
+            return (await messages.get())["status"]
+
+        self.assertEqual(self.stream("shop=1", status_of, authenticated=False), 401)
+        self.assertEqual(self.stream("", status_of), 400)
+        self.assertEqual(self.stream("shop=one", status_of), 400)
+        self.assertEqual(self.stream("latitude=41.3", status_of), 400)
+        self.assertEqual(
+            self.stream("latitude=41&longitude=69&radius=500", status_of), 400
+        )
+
+    @override_settings(LIVE_EVENTS_QUEUE_SIZE=1)
+    def test_slow_subscriber_overflows(self):
+        subscriber = Subscriber({"shop:1"})
+        subscriber.put(b"first")
+        self.assertFalse(subscriber.overflowed)
+        subscriber.put(b"second")
+        self.assertTrue(subscriber.overflowed)
+
+
+def at(value):
+    return datetime.fromisoformat(value)
+
+
+class OpeningHoursTests(APITestCase):
+    def setUp(self):
+        opening_hours.invalidate_open_now()
+        self.owner_user = User.objects.create_user(
+            phone_number="+1234567890", password="password", role="owner"
+        )
+        self.shop = Shop.objects.create(name="Coffee Shop", owner=self.owner_user)
+        # Tashkent is UTC+5 all year.
+        self.day = Branch.objects.create(shop=self.shop, address="Day")
+        self.night = Branch.objects.create(shop=self.shop, address="Night")
+        self.unscheduled = Branch.objects.create(shop=self.shop, address="None")
+        for weekday in range(5):
+            OpeningHours.objects.create(
+                branch=self.day, weekday=weekday, opens=time(9), closes=time(18)
+            )
+        # Sunday night into Monday, across the end of the week.
+        OpeningHours.objects.create(
+            branch=self.night, weekday=6, opens=time(22), closes=time(2)
+        )
+        self.url = reverse("branch-list")
+
+    def open_at(self, moment):
+        return set(
+            opening_hours.filter_open_at(Branch.objects.all(), at(moment)).values_list(
+                "address", flat=True
+            )
+        )
+
+    def test_weekly_periods(self):
+        # Monday 01:00 to 03:00 at UTC+5 starts on Sunday 20:00 UTC.
+        self.assertEqual(weekly_periods([(0, time(1), time(3))], 300), [(9840, 9960)])
+        # Sunday 22:00 to 02:00 UTC runs past the end of the week.
+        self.assertEqual(
+            weekly_periods([(6, time(22), time(2))], 0), [(9960, 10080), (0, 120)]
+        )
+        self.assertEqual(weekly_periods([(2, time(0), time(0))], 0), [(2880, 4320)])
+
+    def test_open_at_local_hours(self):
+        self.assertEqual(self.open_at("2026-10-19T04:00:00+00:00"), {"Day"})
+        self.assertEqual(self.open_at("2026-10-19T09:00:00+05:00"), {"Day"})
+        self.assertEqual(self.open_at("2026-10-19T13:00:00+00:00"), set())
+        self.assertEqual(self.open_at("2026-10-24T10:00:00+05:00"), set())
+        # Sunday 23:30 and Monday 01:59 in Tashkent.
+        self.assertEqual(self.open_at("2026-10-18T18:30:00+00:00"), {"Night"})
+        self.assertEqual(self.open_at("2026-10-19T01:59:00+05:00"), {"Night"})
+        self.assertEqual(self.open_at("2026-10-19T02:00:00+05:00"), set())
+
+    def test_exceptions(self):
+        OpeningException.objects.create(branch=self.day, date=date(2026, 10, 19))
+        OpeningException.objects.create(
+            branch=self.day, date=date(2026, 10, 24), opens=time(10), closes=time(14)
+        )
+        self.assertEqual(self.open_at("2026-10-19T10:00:00+05:00"), set())
+        self.assertEqual(self.open_at("2026-10-20T10:00:00+05:00"), {"Day"})
+        self.assertEqual(self.open_at("2026-10-24T09:30:00+05:00"), set())
+        self.assertEqual(self.open_at("2026-10-24T10:00:00+05:00"), {"Day"})
+        self.assertEqual(self.open_at("2026-10-31T10:00:00+05:00"), set())
+
+    def test_closed_day_keeps_hours_from_the_evening_before(self):
+        late = Branch.objects.create(shop=self.shop, address="Late")
+        for weekday in (Weekday.FRIDAY, Weekday.SATURDAY):
+            OpeningHours.objects.create(
+                branch=late, weekday=weekday, opens=time(22), closes=time(2)
+            )
+        OpeningException.objects.create(branch=late, date=date(2026, 10, 24))
+        # Friday's hours run into the closed Saturday, Saturday's do not open.
+        self.assertEqual(self.open_at("2026-10-24T01:00:00+05:00"), {"Late"})
+        self.assertEqual(self.open_at("2026-10-24T23:00:00+05:00"), set())
+        self.assertEqual(self.open_at("2026-10-25T01:00:00+05:00"), set())
+
+    def test_closed_day_after_hours_split_at_end_of_week(self):
+        self.night.timezone = "UTC"
+        self.night.save()
+        OpeningException.objects.create(branch=self.night, date=date(2026, 10, 19))
+        # Sunday's hours run into the closed Monday, past the end of the week.
+        self.assertEqual(self.open_at("2026-10-19T01:00:00+00:00"), {"Night"})
+        OpeningException.objects.create(branch=self.night, date=date(2026, 10, 18))
+        self.assertEqual(self.open_at("2026-10-19T01:00:00+00:00"), set())
+
+    def test_time_zone_change_rebuilds_periods(self):
+        self.day.timezone = "UTC"
+        self.day.save()
+        self.assertEqual(self.open_at("2026-10-19T04:00:00+00:00"), set())
+        self.assertEqual(self.open_at("2026-10-19T17:00:00+00:00"), {"Day"})
+
+    def test_only_time_zone_changes_rebuild_periods(self):
+        with patch("shops.signals.rebuild_opening_periods") as rebuild:
+            self.day.address = "Day and evening"
+            self.day.save()
+            self.day.timezone = "Asia/Tashkent"
+            self.day.save()
+            rebuild.assert_not_called()
+            self.day.timezone = "UTC"
+            self.day.save()
+            rebuild.assert_called_once_with([self.day.pk])
+
+    def test_daylight_saving_change(self):
+        self.day.timezone = "Europe/Berlin"
+        self.day.save()
+        summer = at("2026-07-06T12:00:00+00:00")
+        winter = at("2026-11-02T12:00:00+00:00")
+        opening_hours.rebuild_opening_periods([self.day.pk], summer)
+        self.assertEqual(opening_hours.get_moved_branch_ids(summer), set())
+        self.assertEqual(opening_hours.get_moved_branch_ids(winter), {self.day.pk})
+        # 08:30 UTC is 09:30 in a Berlin winter, 10:30 in summer.
+        self.assertEqual(self.open_at("2026-11-02T07:30:00+00:00"), {"Day"})
+
+        opening_hours.rebuild_opening_periods([self.day.pk], winter)
+        self.assertEqual(self.open_at("2026-11-02T07:30:00+00:00"), set())
+        self.assertEqual(self.open_at("2026-11-02T08:30:00+00:00"), {"Day"})
+
+    @override_settings(OPEN_NOW_CACHE_TIMEOUT=86400)
+    def test_open_now_cached_until_next_change(self):
+        now = at("2026-10-19T08:00:00+00:00")
+        with patch("shops.opening_hours.timezone.now", return_value=now):
+            self.assertEqual(opening_hours.get_branch_ids_open_now(), [self.day.pk])
+            # Closes at 18:00 in Tashkent, in five hours.
+            ttl = opening_hours.redis_instance.pttl(opening_hours.OPEN_NOW_KEY)
+            self.assertAlmostEqual(ttl / 1000, 5 * 3600, delta=1)
+            with self.assertNumQueries(0):
+                opening_hours.get_branch_ids_open_now()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                OpeningException.objects.create(
+                    branch=self.day, date=date(2026, 10, 19)
+                )
+            self.assertEqual(opening_hours.get_branch_ids_open_now(), [])
+
+    def test_invalidation_while_computing_open_now_wins(self):
+        now = at("2026-10-19T08:00:00+00:00")
+        next_change = opening_hours.next_change
+
+        def invalidate_first(moment):
+            # An exception is added after the open branches were read.
+            opening_hours.invalidate_open_now()
+            return next_change(moment)
+
+        with patch("shops.opening_hours.timezone.now", return_value=now):
+            with patch("shops.opening_hours.next_change", invalidate_first):
+                opening_hours.get_branch_ids_open_now()
+            self.assertIsNone(
+                opening_hours.redis_instance.get(opening_hours.OPEN_NOW_KEY)
+            )
+            opening_hours.get_branch_ids_open_now()
+            with self.assertNumQueries(0):
+                opening_hours.get_branch_ids_open_now()
+
+    def test_open_now_read_from_primary(self):
+        now = at("2026-10-19T08:00:00+00:00")
+        with patch("shops.opening_hours.timezone.now", return_value=now):
+            with lagging_replica():
+                branch_ids = opening_hours.get_branch_ids_open_now()
+        self.assertEqual(branch_ids, [self.day.pk])
+
+    def test_next_change_wraps_around_the_week(self):
+        OpeningHours.objects.all().delete()
+        OpeningHours.objects.create(
+            branch=self.day, weekday=0, opens=time(9), closes=time(18)
+        )
+        self.assertEqual(
+            opening_hours.next_change(at("2026-10-20T00:00:00+00:00")),
+            at("2026-10-26T04:00:00+00:00"),
+        )
+
+    def test_list_open_at(self):
+        self.client.force_authenticate(user=self.owner_user)
+        response = self.client.get(self.url, {"open_at": "2026-10-19T10:00:00+05:00"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [branch["address"] for branch in response.data["results"]], ["Day"]
+        )
+        self.assertEqual(
+            response.data["results"][0]["opening_hours"][0],
+            {"weekday": 0, "opens": "09:00:00", "closes": "18:00:00"},
+        )
+
+        # Naive times are in UTC.
+        response = self.client.get(self.url, {"open_at": "2026-10-18T18:30:00"})
+        self.assertEqual(
+            [branch["address"] for branch in response.data["results"]], ["Night"]
+        )
+
+        response = self.client.get(self.url, {"open_at": "tomorrow"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(GEO_TILE_CACHE_ENABLED=True)
+    def test_list_open_now_nearest(self):
+        self.day.latitude, self.day.longitude = 41.3, 69.2
+        self.day.save()
+        self.night.latitude, self.night.longitude = 41.31, 69.24
+        self.night.save()
+        now = at("2026-10-19T08:00:00+00:00")
+        self.client.force_authenticate(user=self.owner_user)
+        with patch("shops.opening_hours.timezone.now", return_value=now):
+            response = self.client.get(
+                self.url, {"open_now": "1", "latitude": 41.31, "longitude": 69.24}
+            )
+        self.assertEqual(
+            [branch["address"] for branch in response.data["results"]], ["Day"]
+        )
+
+    def test_create_branch_with_opening_hours(self):
+        self.client.force_authenticate(user=self.owner_user)
+        url = reverse("branch-list-create", kwargs={"shop_pk": self.shop.id})
+        data = {
+            "address": "New",
+            "timezone": "UTC",
+            "opening_hours": [
+                {"weekday": weekday, "opens": "07:00", "closes": "19:00"}
+                for weekday in range(7)
+            ],
+        }
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["opening_hours"]), 7)
+        self.assertIn("New", self.open_at("2026-10-25T18:59:00+00:00"))
+
+        response = self.client.post(
+            url, {"address": "Elsewhere", "timezone": "Mars/Olympus"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_open_at_uses_range_indexes(self):
+        plan = explain_without_seqscan(
+            opening_hours.filter_open_at(Branch.objects.all(), timezone.now())
+        )
+        self.assertIn("shops_period_minutes_idx", plan)
+        self.assertIn("shops_exception_day_idx", plan)
+        self.assertIn("shops_exception_hours_idx", plan)
+
+    def test_refresh_command(self):
+        OpeningPeriod.objects.all().delete()
+        call_command("refresh_opening_hours", all=True, stdout=StringIO())
+        self.assertEqual(self.open_at("2026-10-19T10:00:00+05:00"), {"Day"})
+        stdout = StringIO()
+        call_command("refresh_opening_hours", stdout=stdout)
+        self.assertIn("of 0 branches", stdout.getvalue())
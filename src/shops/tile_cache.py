@@ -0,0 +1,322 @@
+import json
+import logging
+import math
+
+import redis
+from django.conf import settings
+
+from config.metrics import InstrumentedRedis
+from config.replicas import read_from_primary
+
+from .geo import distance_km
+from .models import Branch
+
+logger = logging.getLogger(__name__)
+
+redis_instance = InstrumentedRedis(
+    host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0
+)
+
+# Redis GEO set of the centers of every tile with cached candidates, used to
+# find the tiles a branch change affects.
+TILE_INDEX_KEY = "shops:tiles"
+ACTIVE_COUNT_KEY = "shops:tiles:active_count"
+# Incremented by every invalidation, see GeoTileCache.fill().
+GENERATION_KEY = "shops:tiles:generation"
+RADIUS_BUCKETS_KM = (1, 2, 5, 10, 20, 50)
+# How many nearest branches a tile can serve before falling back to SQL.
+NEAREST_CANDIDATES = 50
+# Seconds an entry too sparse or far reaching to cache is remembered as such,
+# so that requests go straight to SQL.
+UNCACHEABLE_TIMEOUT = 60
+
+
+def active_branches():
+    return Branch.objects.filter(
+        is_active=True, shop__is_active=True, unit_x__isnull=False
+    )
+
+
+def to_rows(branches):
+    """
+    JSON friendly ``[id, shop_id, latitude, longitude]`` rows of a queryset.
+    """
+    rows = branches.values_list("id", "shop_id", "latitude", "longitude")
+    return [
+        [branch_id, shop_id, float(latitude), float(longitude)]
+        for branch_id, shop_id, latitude, longitude in rows
+    ]
+
+
+class Tile:
+    """
+    A square of the latitude/longitude grid that proximity requests are
+    snapped to.
+    """
+
+    def __init__(self, latitude, longitude, size):
+        self.row = math.floor(latitude / size)
+        self.column = math.floor(longitude / size)
+        self.latitude = (self.row + 0.5) * size
+        self.longitude = (self.column + 0.5) * size
+        self.key = f"shops:tile:{size}:{self.row}:{self.column}"
+        # Farthest a point of the tile can be from its center. The corner
+        # nearer the equator is the wider one, so check both.
+        self.margin_km = max(
+            distance_km(
+                self.latitude,
+                self.longitude,
+                self.row * size + edge,
+                self.column * size,
+            )
+            for edge in (0, size)
+        )
+
+
+class GeoTileCache:
+    """
+    Caches the branches near each map tile so that proximity requests from
+    anywhere in the tile share one cache entry.
+
+    An entry holds every candidate branch, with its coordinates, that can be
+    relevant to a point of the tile. Distances are recomputed exactly for
+    the requesting point, so filtering and ordering stay correct.
+    """
+
+    def __init__(self, tile_size=None, timeout=None, max_radius=None):
+        self.tile_size = tile_size or settings.GEO_TILE_SIZE
+        self.timeout = timeout or settings.GEO_TILE_CACHE_TIMEOUT
+        self.max_radius = max_radius or settings.GEO_TILE_CACHE_MAX_RADIUS
+
+    def get_tile(self, latitude, longitude):
+        return Tile(latitude, longitude, self.tile_size)
+
+    def get_cached(self, key):
+        """
+        The cached value of ``key`` or None, and the generation of the cache
+        to pass on to ``fill()``.
+        """
+        cached, generation = redis_instance.mget(key, GENERATION_KEY)
+        return cached, generation or b"0"
+
+    def fill(self, key, value, timeout, generation, tile=None):
+        """
+        Cache a value loaded after reading ``generation``, unless the cache
+        was invalidated since: the value may have been loaded from the rows
+        before the change, as in ``products.detail_cache.cache_detail()``.
+        """
+        try:
+            with redis_instance.pipeline() as pipeline:
+                pipeline.watch(GENERATION_KEY)
+                if (pipeline.get(GENERATION_KEY) or b"0") != generation:
+                    return
+                pipeline.multi()
+                pipeline.set(key, value, ex=timeout)
+                if tile is not None:
+                    pipeline.geoadd(
+                        TILE_INDEX_KEY, (tile.longitude, tile.latitude, tile.key)
+                    )
+                pipeline.execute()
+        except redis.WatchError:
+            # Invalidated while caching.
+            pass
+        except redis.RedisError:
+            logger.exception("Could not fill geo tile cache")
+
+    def get_candidates(self, tile, name, load):
+        """
+        Cached rows of a tile entry, see ``to_rows``, or None when Redis is
+        unavailable or ``load`` returned None because the entry would reach
+        too far to cache.
+        """
+        key = f"{tile.key}:{name}"
+        try:
+            cached, generation = self.get_cached(key)
+        except redis.RedisError:
+            logger.exception("Could not read geo tile cache")
+            return None
+        if cached is not None:
+            # A cached null marks an entry that is not worth loading.
+            return json.loads(cached)
+
+        with read_from_primary():
+            rows = load()
+        timeout = self.timeout if rows is not None else UNCACHEABLE_TIMEOUT
+        self.fill(key, json.dumps(rows), timeout, generation, tile)
+        return rows
+
+    def branches_within(self, latitude, longitude, radius_km):
+        return to_rows(active_branches().within_radius(latitude, longitude, radius_km))
+
+    def shops_within_radius(self, latitude, longitude, radius_km):
+        """
+        Ids of the shops with an active branch within the radius, or None when
+        the radius is too large to cache or Redis is unavailable.
+        """
+        bucket = next(
+            (
+                bucket
+                for bucket in RADIUS_BUCKETS_KM
+                if radius_km <= bucket <= self.max_radius
+            ),
+            None,
+        )
+        if bucket is None:
+            return None
+
+        tile = self.get_tile(latitude, longitude)
+        rows = self.get_candidates(
+            tile,
+            f"r{bucket}",
+            lambda: self.branches_within(
+                tile.latitude, tile.longitude, bucket + tile.margin_km
+            ),
+        )
+        if rows is None:
+            return None
+        return sorted(
+            {
+                shop_id
+                for _, shop_id, branch_latitude, branch_longitude in rows
+                if distance_km(latitude, longitude, branch_latitude, branch_longitude)
+                <= radius_km
+            }
+        )
+
+    def load_nearest(self, tile):
+        """
+        Every branch that can be among the nearest ``NEAREST_CANDIDATES`` of
+        some point of the tile: if the last of them is ``d`` away from the
+        center, none of a point's nearest is farther than ``d + 2 * margin``
+        from the center. None when there are fewer active branches than
+        that: the entry would have to change with every branch added anywhere.
+        """
+        nearest = to_rows(
+            active_branches().nearest_to(tile.latitude, tile.longitude)[
+                :NEAREST_CANDIDATES
+            ]
+        )
+        if len(nearest) < NEAREST_CANDIDATES:
+            return None
+
+        reach = (
+            max(
+                distance_km(tile.latitude, tile.longitude, row[2], row[3])
+                for row in nearest
+            )
+            + 2 * tile.margin_km
+        )
+        if reach > self.max_radius:
+            return None
+        return self.branches_within(tile.latitude, tile.longitude, reach)
+
+    def nearest_branches(self, latitude, longitude):
+        """
+        ``(id, distance_km)`` of the nearest branches, nearest first, or None
+        when the tile's branches are too sparse to cache or Redis is
+        unavailable.
+        """
+        tile = self.get_tile(latitude, longitude)
+        rows = self.get_candidates(tile, "nearest", lambda: self.load_nearest(tile))
+        if rows is None:
+            return None
+        ranked = sorted(
+            (distance_km(latitude, longitude, row[2], row[3]), row[0]) for row in rows
+        )
+        return [
+            (branch_id, distance) for distance, branch_id in ranked[:NEAREST_CANDIDATES]
+        ]
+
+    def count(self, queryset):
+        """
+        The number of active branches, or None when Redis is unavailable.
+        """
+        try:
+            cached, generation = self.get_cached(ACTIVE_COUNT_KEY)
+        except redis.RedisError:
+            logger.exception("Could not read geo tile cache")
+            return None
+        if cached is not None:
+            return int(cached)
+
+        with read_from_primary():
+            count = queryset.count()
+        self.fill(ACTIVE_COUNT_KEY, count, self.timeout, generation)
+        return count
+
+    def invalidate(self, positions):
+        """
+        Drop the entries of every tile that can hold a branch at one of the
+        given ``(latitude, longitude)`` positions.
+        """
+        names = ["nearest", *(f"r{bucket}" for bucket in RADIUS_BUCKETS_KM)]
+        margin_km = Tile(0, 0, self.tile_size).margin_km
+        try:
+            # Before looking up the tiles, so that no entry can be added unseen.
+            redis_instance.incr(GENERATION_KEY)
+            redis_instance.delete(ACTIVE_COUNT_KEY)
+            for latitude, longitude in positions:
+                if latitude is None or longitude is None:
+                    continue
+                tiles = redis_instance.geosearch(
+                    TILE_INDEX_KEY,
+                    longitude=float(longitude),
+                    latitude=float(latitude),
+                    radius=self.max_radius + margin_km,
+                    unit="km",
+                )
+                if not tiles:
+                    continue
+                keys = [f"{tile.decode()}:{name}" for tile in tiles for name in names]
+                pipeline = redis_instance.pipeline()
+                pipeline.delete(*keys)
+                pipeline.zrem(TILE_INDEX_KEY, *tiles)
+                pipeline.execute()
+        except redis.RedisError:
+            logger.exception("Could not invalidate geo tile cache")
+
+
+class TileNearestBranchList:
+    """
+    Active branches ordered by distance, nearest first, served from a tile's
+    candidates.
+
+    Behaves like a sequence for the paginator. Pages past the candidates the
+    tile can rank fall back to the SQL ordering.
+    """
+
+    def __init__(self, queryset, nearest, count, latitude, longitude):
+        self.queryset = queryset
+        self.nearest = nearest
+        self.count = count
+        self.latitude = latitude
+        self.longitude = longitude
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[slice(index, index + 1)][0]
+
+        if index.stop is None or index.stop > len(self.nearest):
+            return list(self.queryset.nearest_to(self.latitude, self.longitude)[index])
+
+        page = self.nearest[index]
+        branches = self.queryset.in_bulk([branch_id for branch_id, _ in page])
+        located = []
+        for branch_id, distance in page:
+            branch = branches.get(branch_id)
+            if branch is not None:
+                branch.distance = distance
+                located.append(branch)
+        return located
+
+
+def get_tile_cache():
+    """
+    The geo tile cache, or None when it is disabled.
+    """
+    if not settings.GEO_TILE_CACHE_ENABLED:
+        return None
+    return GeoTileCache()
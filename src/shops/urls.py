@@ -1,6 +1,11 @@
 from django.urls import path
 
-from .views import BranchListByShopIdCreateView, BranchListView, ShopListCreateView
+from .views import (
+    BranchListByShopIdCreateView,
+    BranchListView,
+    BranchMapView,
+    ShopListCreateView,
+)
 
 urlpatterns = [
     path("shops/", ShopListCreateView.as_view(), name="shop-list"),
@@ -10,4 +15,5 @@ urlpatterns = [
         name="branch-list-create",
     ),
     path("branches/", BranchListView.as_view(), name="branch-list"),
+    path("branches/map/", BranchMapView.as_view(), name="branch-map"),
 ]
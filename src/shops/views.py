@@ -1,17 +1,24 @@
-from django.db.models import ExpressionWrapper, F, FloatField
-from django.db.models.functions import ACos, Cos, Radians, Sin
+from decimal import Decimal
+
+from django.db.models import Avg, Count, F
+from django.db.models.functions import Floor
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import generics
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.filters import SearchFilter
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from config.paginations import CustomPageNumberPagination
 
+from .locator import LocatedBranchList, get_branch_locator
 from .models import Branch, Shop
+from .opening_hours import get_open_branches
 from .permissions import IsOwnerOrReadOnly
-from .serializers import BranchSerializer, ShopSerializer
+from .serializers import BranchMarkerSerializer, BranchSerializer, ShopSerializer
+from .tile_cache import TileNearestBranchList, get_tile_cache
 
 
 class ShopListCreateView(generics.ListCreateAPIView):
@@ -80,7 +87,9 @@ class BranchListByShopIdCreateView(generics.ListCreateAPIView):
         responses={200: BranchSerializer(many=True)},
     )
     def get_queryset(self):
-        return Branch.objects.filter(is_active=True, shop__is_active=True)
+        return Branch.objects.filter(
+            is_active=True, shop__is_active=True
+        ).prefetch_related("opening_hours")
 
     @swagger_auto_schema(
         operation_description="Create a new branch for a shop. Only the shop owner can create branches.",
@@ -97,6 +106,28 @@ class BranchListByShopIdCreateView(generics.ListCreateAPIView):
                 "longitude": openapi.Schema(
                     type=openapi.TYPE_NUMBER, description="Branch longitude (optional)"
                 ),
+                "timezone": openapi.Schema(
+                    type=openapi.TYPE_STRING,
+                    description="Time zone of the opening hours (optional)",
+                ),
+                "opening_hours": openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(
+                        type=openapi.TYPE_OBJECT,
+                        properties={
+                            "weekday": openapi.Schema(
+                                type=openapi.TYPE_INTEGER,
+                                description="0 for Monday to 6 for Sunday",
+                            ),
+                            "opens": openapi.Schema(type=openapi.TYPE_STRING),
+                            "closes": openapi.Schema(
+                                type=openapi.TYPE_STRING,
+                                description="At or before 'opens' for the next day",
+                            ),
+                        },
+                    ),
+                    description="Weekly opening hours (optional)",
+                ),
             },
         ),
         responses={
@@ -118,7 +149,8 @@ class BranchListByShopIdCreateView(generics.ListCreateAPIView):
 class BranchListView(generics.ListAPIView):
     """
     get:
-    List all active branches, optionally ordered by proximity to a given location.
+    List all active branches, optionally only those open at a given time and
+    ordered by proximity to a given location.
     """
 
     serializer_class = BranchSerializer
@@ -126,8 +158,9 @@ class BranchListView(generics.ListAPIView):
     pagination_class = CustomPageNumberPagination
 
     @swagger_auto_schema(
-        operation_description="List all active branches, "
-        "optionally ordered by proximity to the given latitude and longitude.",
+        operation_description="List all active branches, optionally only those "
+        "open now or at a given time, and ordered by proximity to the given "
+        "latitude and longitude.",
         manual_parameters=[
             openapi.Parameter(
                 "latitude",
@@ -141,11 +174,33 @@ class BranchListView(generics.ListAPIView):
                 type=openapi.TYPE_NUMBER,
                 description="Longitude for location-based sorting",
             ),
+            openapi.Parameter(
+                "open_now",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_BOOLEAN,
+                description="Only branches open now",
+            ),
+            openapi.Parameter(
+                "open_at",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATETIME,
+                description="Only branches open at this ISO 8601 date and time, "
+                "UTC without an offset",
+            ),
         ],
         responses={200: BranchSerializer(many=True)},
     )
     def get_queryset(self):
-        queryset = Branch.objects.filter(is_active=True, shop__is_active=True)
+        queryset = (
+            Branch.objects.filter(is_active=True, shop__is_active=True)
+            .select_related("shop")
+            .prefetch_related("opening_hours")
+        )
+
+        open_branches = get_open_branches(self.request.query_params)
+        if open_branches is not None:
+            queryset = queryset.filter(pk__in=open_branches)
 
         latitude = self.request.query_params.get("latitude")
         longitude = self.request.query_params.get("longitude")
@@ -157,21 +212,140 @@ class BranchListView(generics.ListAPIView):
             except ValueError:
                 return queryset
 
-            # Haversine formula for calculating the distance
-            distance_expression = ExpressionWrapper(
-                ACos(
-                    Sin(Radians(F("latitude"))) * Sin(Radians(latitude))
-                    + Cos(Radians(F("latitude")))
-                    * Cos(Radians(latitude))
-                    * Cos(Radians(F("longitude")) - Radians(longitude))
-                )
-                * 6371,  # Radius of Earth in kilometers
-                output_field=FloatField(),
-            )
+            # The locator and tile cache know every active branch, not which
+            # are open.
+            locator = get_branch_locator() if open_branches is None else None
+            if locator is not None:
+                return LocatedBranchList(queryset, locator, latitude, longitude)
 
-            # Annotate the queryset with the calculated distance and order by it
-            queryset = queryset.annotate(distance=distance_expression).order_by(
-                "distance"
-            )
+            tile_cache = get_tile_cache() if open_branches is None else None
+            if tile_cache is not None:
+                nearest = tile_cache.nearest_branches(latitude, longitude)
+                count = None if nearest is None else tile_cache.count(queryset)
+                if count is not None:
+                    return TileNearestBranchList(
+                        queryset, nearest, count, latitude, longitude
+                    )
+
+            queryset = queryset.nearest_to(latitude, longitude)
 
         return queryset
+
+
+class BranchMapView(APIView):
+    """
+    get:
+    Markers for the active branches inside a map viewport. Zoomed-out views
+    get grid clusters with a branch count and centroid instead of every branch.
+    """
+
+    permission_classes = [IsAuthenticated]
+    # Viewports with at most this many branches are never clustered.
+    max_markers = 200
+    # From this zoom level on branches are always returned individually.
+    cluster_max_zoom = 16
+    # Cluster cells per 256px map tile edge, i.e. 64px cells.
+    cells_per_tile = 4
+    # Widest viewport accepted, in 256px map tiles at the requested zoom.
+    max_viewport_tiles = 16
+
+    @swagger_auto_schema(
+        operation_description="Return the branches inside a bounding box, "
+        "clustered on a zoom-dependent grid when there are too many to draw.",
+        manual_parameters=[
+            openapi.Parameter(
+                "bbox",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="Viewport as west,south,east,north in degrees",
+                required=True,
+            ),
+            openapi.Parameter(
+                "zoom",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description="Map zoom level, 0 to 22",
+                required=True,
+            ),
+        ],
+    )
+    def get(self, request, *args, **kwargs):
+        zoom = self.get_zoom()
+        west, south, east, north = self.get_bbox(zoom)
+        queryset = Branch.objects.filter(
+            is_active=True, shop__is_active=True
+        ).within_bbox(west, south, east, north)
+
+        if zoom < self.cluster_max_zoom:
+            clusters = self.get_clusters(queryset, zoom)
+            if sum(cluster["count"] for cluster in clusters) > self.max_markers:
+                return Response({"type": "clusters", "results": clusters})
+            branches = queryset.select_related("shop")
+        else:
+            # Fetch one more than can be drawn to know whether to cluster.
+            branches = list(queryset.select_related("shop")[: self.max_markers + 1])
+            if len(branches) > self.max_markers:
+                clusters = self.get_clusters(queryset, zoom)
+                return Response({"type": "clusters", "results": clusters})
+
+        return Response(
+            {
+                "type": "branches",
+                "results": BranchMarkerSerializer(branches, many=True).data,
+            }
+        )
+
+    def get_bbox(self, zoom):
+        try:
+            west, south, east, north = (
+                float(value) for value in self.request.query_params["bbox"].split(",")
+            )
+        except (KeyError, ValueError):
+            raise ValidationError({"bbox": "Expected west,south,east,north."})
+        if not (
+            -90 <= south <= north <= 90
+            and -180 <= min(west, east) <= max(west, east) <= 180
+        ):
+            raise ValidationError({"bbox": "Coordinates are out of range."})
+        # A box whose west edge is greater than its east edge crosses the
+        # antimeridian.
+        width = east - west if west <= east else 360 - (west - east)
+        max_size = 360 / 2**zoom * self.max_viewport_tiles
+        if width > max_size or north - south > max_size:
+            raise ValidationError({"bbox": "The viewport is too large for the zoom."})
+        return west, south, east, north
+
+    def get_zoom(self):
+        try:
+            zoom = int(self.request.query_params["zoom"])
+        except (KeyError, ValueError):
+            raise ValidationError({"zoom": "Expected an integer zoom level."})
+        if not 0 <= zoom <= 22:
+            raise ValidationError({"zoom": "Zoom must be between 0 and 22."})
+        return zoom
+
+    def get_clusters(self, queryset, zoom):
+        """
+        Group branches by grid cell in SQL, one row per non-empty cell.
+        """
+        cell_size = Decimal(360) / (2**zoom * self.cells_per_tile)
+        cells = (
+            queryset.annotate(
+                cell_x=Floor(F("longitude") / cell_size),
+                cell_y=Floor(F("latitude") / cell_size),
+            )
+            .values("cell_x", "cell_y")
+            .annotate(
+                count=Count("id"),
+                center_latitude=Avg("latitude"),
+                center_longitude=Avg("longitude"),
+            )
+        )
+        return [
+            {
+                "count": cell["count"],
+                "latitude": round(float(cell["center_latitude"]), 6),
+                "longitude": round(float(cell["center_longitude"]), 6),
+            }
+            for cell in cells
+        ]
@@ -0,0 +1,211 @@
+"""
+Delta sync of the catalogue.
+
+A client without a cursor first pages through a snapshot of every feed,
+then through the change log from where the snapshot started. Each page
+carries the next cursor:
+
+- ``snapshot:<horizon>:<kind>:<last id>`` while in the snapshot,
+- ``<txid>:<id>``, a position in the change log, afterwards.
+
+Log rows become visible out of ``(txid, id)`` order, as transactions commit
+in any order. Pages only include rows of transactions older than the oldest
+one still running, the horizon, so no row can later appear behind a cursor.
+Changes are sent as the object's current state, which makes replaying a row
+twice harmless: the snapshot starts the log at its own horizon, and rows of
+transactions that committed while it was read are sent again.
+"""
+
+from dataclasses import dataclass
+
+from django.db import connections, router
+from django.db.models import Q
+from rest_framework.exceptions import APIException, ValidationError
+
+from products.models import Category, Option, OptionGroup, Product
+from products.serializers import CategorySerializer, OptionGroupSerializer
+from shops.models import Branch, Shop
+from shops.serializers import BranchSerializer, ShopSerializer
+from vehicles.models import Brand, Color, Model
+from vehicles.serializers import BrandSerializer, ColorSerializer, ModelSerializer
+
+from .log import KINDS, OWNED_MODELS
+from .models import Change, Truncation
+from .serializers import SyncOptionSerializer, SyncProductSerializer
+
+MAX_PAGE_SIZE = 1000
+
+
+class CursorExpired(APIException):
+    status_code = 410
+    default_detail = "The cursor is older than the change log. Sync from scratch."
+    default_code = "cursor_expired"
+
+
+@dataclass
+class Feed:
+    model: type
+    serializer_class: type
+
+    @property
+    def kind(self):
+        return KINDS[self.model]
+
+    def visible(self, queryset, user):
+        """
+        The rows of ``queryset`` the catalogue lists show to ``user``, by id.
+        """
+        if self.model in OWNED_MODELS:
+            return queryset.visible_to(user)
+        return queryset.order_by("pk")
+
+
+class CategoryFeed(Feed):
+    def visible(self, queryset, user):
+        return super().visible(queryset.filter(is_active=True), user)
+
+
+class OptionGroupFeed(Feed):
+    def visible(self, queryset, user):
+        return super().visible(queryset.prefetch_related("options"), user)
+
+
+class ShopFeed(Feed):
+    def visible(self, queryset, user):
+        return super().visible(queryset.filter(is_active=True), user)
+
+
+class BranchFeed(Feed):
+    def visible(self, queryset, user):
+        queryset = queryset.filter(is_active=True, shop__is_active=True)
+        queryset = queryset.select_related("shop").prefetch_related("opening_hours")
+        return super().visible(queryset, user)
+
+
+class ProductFeed(Feed):
+    def visible(self, queryset, user):
+        queryset = queryset.filter(shop__is_active=True)
+        queryset = queryset.select_related("shop", "category").prefetch_related(
+            "product_options"
+        )
+        return super().visible(queryset, user)
+
+
+# In the order pages list them, referenced rows first.
+FEEDS = [
+    Feed(Brand, BrandSerializer),
+    Feed(Model, ModelSerializer),
+    Feed(Color, ColorSerializer),
+    CategoryFeed(Category, CategorySerializer),
+    OptionGroupFeed(OptionGroup, OptionGroupSerializer),
+    Feed(Option, SyncOptionSerializer),
+    ShopFeed(Shop, ShopSerializer),
+    BranchFeed(Branch, BranchSerializer),
+    ProductFeed(Product, SyncProductSerializer),
+]
+FEEDS_BY_KIND = {feed.kind: feed for feed in FEEDS}
+
+
+def get_horizon():
+    """
+    Id of the oldest transaction still running: every log row with a lower
+    txid is committed or rolled back for good.
+    """
+    with connections[router.db_for_read(Change)].cursor() as cursor:
+        cursor.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        return cursor.fetchone()[0]
+
+
+def parse_cursor(cursor):
+    """
+    ``(txid, id)`` of a log cursor, or ``(horizon, kind, last id)`` of a
+    snapshot cursor.
+    """
+    parts = cursor.split(":")
+    try:
+        if parts[0] == "snapshot" and len(parts) == 4 and parts[2] in FEEDS_BY_KIND:
+            return int(parts[1]), parts[2], int(parts[3])
+        if len(parts) == 2:
+            return int(parts[0]), int(parts[1])
+    except ValueError:
+        pass
+    raise ValidationError({"since": "Not a sync cursor."})
+
+
+def check_not_truncated(position):
+    truncation = Truncation.objects.order_by("-id").first()
+    if truncation is not None and position < (truncation.txid, truncation.change_id):
+        raise CursorExpired
+
+
+def serialize(feed, queryset, request):
+    serializer = feed.serializer_class(
+        queryset, many=True, context={"request": request}
+    )
+    return [
+        {"kind": feed.kind, "id": data["id"], "deleted": False, "data": data}
+        for data in serializer.data
+    ]
+
+
+def get_snapshot_page(request, horizon, kind, last_id, limit):
+    changes = []
+    start = [feed.kind for feed in FEEDS].index(kind)
+    for feed in FEEDS[start:]:
+        if feed.kind != kind:
+            last_id = 0
+        queryset = feed.visible(feed.model.objects.filter(pk__gt=last_id), request.user)
+        changes += serialize(feed, queryset[: limit - len(changes)], request)
+        if len(changes) == limit:
+            return changes, f"snapshot:{horizon}:{feed.kind}:{changes[-1]['id']}", True
+    return changes, f"{horizon}:0", True
+
+
+def get_log_page(request, position, limit):
+    check_not_truncated(position)
+    horizon = get_horizon()
+    user = request.user
+    rows = list(
+        Change.objects.filter(
+            Q(txid__gt=position[0]) | Q(txid=position[0], id__gt=position[1]),
+            Q(user__isnull=True) | Q(user=user),
+            txid__lt=horizon,
+        )
+        .order_by("txid", "id")
+        .values_list("txid", "id", "kind", "object_id")[:limit]
+    )
+
+    object_ids = {}
+    for _, _, kind, object_id in rows:
+        object_ids.setdefault(kind, set()).add(object_id)
+    changes = []
+    for feed in FEEDS:
+        ids = object_ids.get(feed.kind)
+        if not ids:
+            continue
+        queryset = feed.visible(feed.model.objects.filter(pk__in=ids), user)
+        upserts = serialize(feed, queryset, request)
+        ids -= {change["id"] for change in upserts}
+        changes += upserts
+        changes += [
+            {"kind": feed.kind, "id": object_id, "deleted": True}
+            for object_id in sorted(ids)
+        ]
+
+    if len(rows) == limit:
+        return changes, f"{rows[-1][0]}:{rows[-1][1]}", True
+    # Everything below the horizon has been sent.
+    return changes, f"{horizon}:0", False
+
+
+def get_page(request, since, limit):
+    """
+    ``(changes, next cursor, has more)`` after the ``since`` cursor.
+    """
+    if not since:
+        return get_snapshot_page(request, get_horizon(), FEEDS[0].kind, 0, limit)
+    position = parse_cursor(since)
+    if len(position) == 3:
+        check_not_truncated((position[0], 0))
+        return get_snapshot_page(request, *position, limit)
+    return get_log_page(request, position, limit)
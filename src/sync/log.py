@@ -0,0 +1,55 @@
+"""
+Writing the change log. Only imports models, so the apps whose bulk writes
+bypass signals can use it.
+"""
+
+from products.models import Category, Option, OptionGroup, Product
+from shops.models import Branch, Shop
+from vehicles.models import Brand, Color, Model
+
+from .models import Change
+
+BATCH_SIZE = 1000
+
+KINDS = {
+    Brand: "brand",
+    Model: "model",
+    Color: "color",
+    Category: "category",
+    OptionGroup: "optiongroup",
+    Option: "option",
+    Shop: "shop",
+    Branch: "branch",
+    Product: "product",
+}
+# Rows of these with a user are private to that user.
+OWNED_MODELS = {Brand, Model, Color}
+
+
+def record_changes(objects):
+    """
+    Log a change of each object, in the current transaction. Signals do it
+    for single saves and deletes; bulk writes have to call this.
+    """
+    Change.objects.bulk_create(
+        (
+            Change(
+                kind=KINDS[type(obj)],
+                object_id=obj.pk,
+                user_id=obj.user_id if type(obj) in OWNED_MODELS else None,
+            )
+            for obj in objects
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+def record_owner_change(obj, previous_user_id):
+    """
+    Log a change of reference data ``obj`` for the clients that could see it
+    under its previous owner, all of them if it was public, so those that no
+    longer can get a tombstone.
+    """
+    Change.objects.create(
+        kind=KINDS[type(obj)], object_id=obj.pk, user_id=previous_user_id
+    )
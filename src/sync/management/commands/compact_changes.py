@@ -0,0 +1,62 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from sync.feeds import get_horizon
+from sync.models import Change, Truncation
+
+
+class Command(BaseCommand):
+    help = (
+        "Compact the sync change log: delete entries superseded by a later "
+        "entry of the same object, and entries older than SYNC_RETENTION_DAYS. "
+        "Clients with a cursor from before the deleted old entries get a 410 "
+        "and sync from scratch. Run it daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.SYNC_RETENTION_DAYS,
+            help="Keep entries of the last this many days.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            horizon = get_horizon()
+            # Only entries every client will see can supersede another, so
+            # both must be committed for good, and seen by the same users:
+            # an owner change leaves a tombstone for the previous owner.
+            newer = Change.objects.filter(
+                Q(txid__gt=OuterRef("txid"))
+                | Q(txid=OuterRef("txid"), id__gt=OuterRef("id")),
+                Q(user__isnull=True) | Q(user=OuterRef("user")),
+                kind=OuterRef("kind"),
+                object_id=OuterRef("object_id"),
+                txid__lt=horizon,
+            )
+            superseded, _ = Change.objects.filter(Exists(newer)).delete()
+            self.stdout.write(f"Deleted {superseded} superseded entries")
+
+            cutoff = timezone.now() - timedelta(days=options["days"])
+            floor = (
+                Change.objects.filter(created_at__lt=cutoff, txid__lt=horizon)
+                .order_by("-txid", "-id")
+                .values_list("txid", "id")
+                .first()
+            )
+            if floor is None:
+                return
+            txid, change_id = floor
+            # Cursors are positions in the log, so everything up to the last
+            # old entry goes, and the floor is recorded for them.
+            expired, _ = Change.objects.filter(
+                Q(txid__lt=txid) | Q(txid=txid, id__lte=change_id)
+            ).delete()
+            Truncation.objects.create(txid=txid, change_id=change_id)
+            self.stdout.write(f"Deleted {expired} entries up to {txid}:{change_id}")
@@ -0,0 +1,63 @@
+from django.contrib.auth import get_user_model
+from django.db import models
+
+User = get_user_model()
+
+
+class TransactionId(models.Func):
+    """
+    Id of the current transaction, 64 bits wide so it never wraps around.
+    """
+
+    function = "txid_current"
+    output_field = models.BigIntegerField()
+
+
+class Change(models.Model):
+    """
+    Change log of the catalogue models, one row per save or delete, written
+    by sync.signals in the transaction making the change.
+
+    Rows only name the object; the sync endpoint sends its current state,
+    or a tombstone when it is gone. Clients page through the log in
+    ``(txid, id)`` order, which only grows for committed rows below the
+    oldest running transaction, see sync.feeds.
+    """
+
+    txid = models.BigIntegerField(db_default=TransactionId())
+    kind = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    # Owner of private reference data, null for public rows. Not a
+    # constraint: rows are written while the owner may be deleted.
+    user = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["txid", "id"], name="sync_change_cursor_idx"),
+            models.Index(fields=["kind", "object_id"], name="sync_change_object_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}"
+
+
+class Truncation(models.Model):
+    """
+    Log position below which compact_changes deleted every row. Clients
+    with an older cursor have to sync from scratch.
+    """
+
+    txid = models.BigIntegerField()
+    change_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.txid}:{self.change_id}"
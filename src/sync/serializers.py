@@ -0,0 +1,43 @@
+from rest_framework import serializers
+
+from products.models import Product
+from products.serializers import OptionSerializer, ProductSerializer
+
+
+class SyncOptionSerializer(OptionSerializer):
+    class Meta(OptionSerializer.Meta):
+        fields = [*OptionSerializer.Meta.fields, "group"]
+
+
+class SyncProductSerializer(ProductSerializer):
+    """
+    Product with the ids of its shop, category and option groups, which the
+    client has in its own cache.
+    """
+
+    option_groups = serializers.SerializerMethodField()
+
+    class Meta(ProductSerializer.Meta):
+        model = Product
+        fields = [*ProductSerializer.Meta.fields, "shop", "category", "option_groups"]
+
+    def get_option_groups(self, product):
+        return [
+            product_option.option_group_id
+            for product_option in product.product_options.all()
+        ]
+
+
+class SyncChangeSerializer(serializers.Serializer):
+    kind = serializers.CharField()
+    id = serializers.IntegerField()
+    deleted = serializers.BooleanField()
+    data = serializers.DictField(
+        required=False, help_text="Current state of the object, unless deleted."
+    )
+
+
+class SyncPageSerializer(serializers.Serializer):
+    changes = SyncChangeSerializer(many=True)
+    cursor = serializers.CharField(help_text="Send as ?since= for the next page.")
+    has_more = serializers.BooleanField()
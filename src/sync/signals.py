@@ -0,0 +1,99 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from products.models import Category, Option, OptionGroup, Product, ProductOption
+from shops.models import Branch, OpeningHours, Shop
+from vehicles.models import Brand, Color, Model
+
+from .log import record_changes, record_owner_change
+
+
+@receiver([post_save, post_delete], sender=Brand)
+@receiver([post_save, post_delete], sender=Model)
+@receiver([post_save, post_delete], sender=Color)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=OptionGroup)
+@receiver([post_save, post_delete], sender=Shop)
+@receiver([post_save, post_delete], sender=Branch)
+@receiver([post_save, post_delete], sender=Product)
+def catalogue_changed(sender, instance, **kwargs):
+    record_changes([instance])
+
+
+@receiver(pre_save, sender=Brand)
+@receiver(pre_save, sender=Model)
+@receiver(pre_save, sender=Color)
+def remember_owner(sender, instance, **kwargs):
+    if instance.pk:
+        instance._sync_owner = (
+            sender.objects.filter(pk=instance.pk).values_list("user_id").first()
+        )
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Model)
+@receiver(post_save, sender=Color)
+def reference_saved(sender, instance, **kwargs):
+    # catalogue_changed only logs the change for the new owner.
+    previous = getattr(instance, "_sync_owner", None)
+    if previous is not None and previous[0] != instance.user_id:
+        record_owner_change(instance, previous[0])
+
+
+@receiver(post_save, sender=Shop)
+def shop_saved(sender, instance, **kwargs):
+    # Deactivating a shop hides its branches and products, and both embed
+    # the shop.
+    record_changes(instance.branches.only("id"))
+    record_changes(instance.products.only("id"))
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    # Products embed the category name.
+    if not created:
+        record_changes(Product.objects.filter(category=instance).only("id"))
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_products(sender, instance, **kwargs):
+    instance._sync_products = list(Product.objects.filter(category=instance).only("id"))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    # Products lose the category through SET_NULL, which sends no signals.
+    record_changes(getattr(instance, "_sync_products", []))
+
+
+@receiver([post_save, post_delete], sender=Option)
+def option_changed(sender, instance, **kwargs):
+    # Groups embed their options, and options change the products' from_price.
+    record_changes([instance])
+    record_changes(OptionGroup.objects.filter(pk=instance.group_id).only("id"))
+    record_changes(
+        Product.objects.filter(product_options__option_group_id=instance.group_id)
+        .distinct()
+        .only("id")
+    )
+
+
+@receiver(post_save, sender=OptionGroup)
+def option_group_saved(sender, instance, created, **kwargs):
+    if not created:
+        record_changes(
+            Product.objects.filter(product_options__option_group=instance)
+            .distinct()
+            .only("id")
+        )
+
+
+@receiver([post_save, post_delete], sender=ProductOption)
+def product_option_changed(sender, instance, **kwargs):
+    record_changes(Product.objects.filter(pk=instance.product_id).only("id"))
+
+
+@receiver([post_save, post_delete], sender=OpeningHours)
+def opening_hours_changed(sender, instance, **kwargs):
+    # Branches embed their opening hours.
+    record_changes(Branch.objects.filter(pk=instance.branch_id).only("id"))
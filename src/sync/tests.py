@@ -0,0 +1,263 @@
+import io
+from datetime import time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import RequestFactory
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITransactionTestCase
+
+from products.models import Category, Option, OptionGroup, Product, ProductOption
+from shops.models import Branch, OpeningHours, Shop
+from sync.feeds import FEEDS, serialize
+from sync.models import Change
+from vehicles.models import Brand, Color, Model
+
+User = get_user_model()
+
+
+# Transaction test cases: log rows of the test's own open transaction would
+# never fall below the horizon.
+class SyncTests(APITransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            phone_number="+1234567890", password="password"
+        )
+        self.other_user = User.objects.create_user(
+            phone_number="+1234567891", password="password"
+        )
+        self.url = reverse("sync")
+        self.client.force_authenticate(user=self.user)
+
+    def expected_state(self):
+        """
+        What the catalogue lists show the user, as synced changes.
+        """
+        request = RequestFactory().get("/", SERVER_NAME="testserver")
+        request.user = self.user
+        return {
+            (change["kind"], change["id"]): change["data"]
+            for feed in FEEDS
+            for change in serialize(
+                feed, feed.visible(feed.model.objects.all(), self.user), request
+            )
+        }
+
+    def fetch(self, since, limit=3):
+        params = {"limit": limit}
+        if since is not None:
+            params["since"] = since
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return response.data
+
+    def apply(self, state, page):
+        for change in page["changes"]:
+            key = (change["kind"], change["id"])
+            if change["deleted"]:
+                state.pop(key, None)
+            else:
+                state[key] = change["data"]
+
+    def sync(self, state, since, limit=3):
+        """
+        Page until caught up, returning the last cursor.
+        """
+        while True:
+            page = self.fetch(since, limit)
+            self.apply(state, page)
+            since = page["cursor"]
+            if not page["has_more"]:
+                return since
+
+    def mutations(self):
+        """
+        Changes covering every path into the change log, one step each.
+        """
+        objects = {}
+
+        def create_references():
+            objects["brand"] = Brand.objects.create(name="Toyota")
+            objects["own_brand"] = Brand.objects.create(name="Mine", user=self.user)
+            Brand.objects.create(name="Theirs", user=self.other_user)
+            Model.objects.create(name="Corolla", brand=objects["brand"])
+            objects["color"] = Color.objects.create(name="Black", rgb_code="#000000")
+            objects["given_brand"] = Brand.objects.create(name="Given", user=self.user)
+
+        def create_catalogue():
+            objects["root"] = Category.objects.create(name="Coffee")
+            objects["leaf"] = Category.objects.create(
+                name="Latte", parent=objects["root"]
+            )
+            group = objects["group"] = OptionGroup.objects.create(name="Milk")
+            objects["option"] = Option.objects.create(group=group, name="Oat")
+            objects["extra"] = Option.objects.create(group=group, name="Soy")
+            shop = objects["shop"] = Shop.objects.create(name="Bean", owner=self.user)
+            Branch.objects.create(shop=shop, address="Main street")
+            objects["branch"] = Branch.objects.create(shop=shop, address="Side")
+            objects["product"] = Product.objects.create(
+                title="Latte",
+                price=Decimal("3.00"),
+                shop=shop,
+                category=objects["root"],
+            )
+            objects["other"] = Product.objects.create(
+                title="Mocha", price=Decimal("4.00"), shop=shop
+            )
+
+        def link_option_group():
+            ProductOption.objects.create(
+                product=objects["product"], option_group=objects["group"]
+            )
+
+        def set_opening_hours():
+            OpeningHours.objects.create(
+                branch=objects["branch"], weekday=0, opens=time(8), closes=time(20)
+            )
+
+        def rename_category():
+            objects["root"].name = "Hot coffee"
+            objects["root"].save()
+
+        def change_option_price():
+            objects["option"].price_adjustment = Decimal("0.50")
+            objects["option"].save()
+
+        def deactivate_shop():
+            objects["shop"].is_active = False
+            objects["shop"].save()
+
+        def reactivate_shop():
+            objects["shop"].is_active = True
+            objects["shop"].save()
+
+        def change_reference_owners():
+            objects["given_brand"].user = self.other_user
+            objects["given_brand"].save()
+            objects["color"].user = self.other_user
+            objects["color"].save()
+
+        def delete_categories():
+            objects["leaf"].delete()
+            objects["root"].delete()
+
+        def delete_rows():
+            objects["extra"].delete()
+            objects["other"].delete()
+            objects["branch"].delete()
+            objects["own_brand"].delete()
+
+        def batch_create_references():
+            response = self.client.post(
+                reverse("vehicle-batch"),
+                {
+                    "brands": [{"ref": "b", "name": "Lada"}],
+                    "models": [{"name": "Niva", "brand": "b"}],
+                },
+                format="json",
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        return [
+            create_references,
+            create_catalogue,
+            link_option_group,
+            set_opening_hours,
+            rename_category,
+            change_option_price,
+            deactivate_shop,
+            reactivate_shop,
+            change_reference_owners,
+            delete_rows,
+            delete_categories,
+            batch_create_references,
+        ]
+
+    def test_clients_converge_from_any_cursor(self):
+        state = {}
+        cursor = self.sync(state, None)
+        checkpoints = [(dict(state), cursor)]
+        # A full sync with changes between its pages, from the first page of
+        # the snapshot to the end of the log.
+        in_flight_state, in_flight_cursor = {}, None
+        for mutate in self.mutations():
+            mutate()
+            page = self.fetch(in_flight_cursor, limit=2)
+            self.apply(in_flight_state, page)
+            in_flight_cursor = page["cursor"]
+            cursor = self.sync(state, cursor)
+            self.assertEqual(state, self.expected_state(), mutate.__name__)
+            checkpoints.append((dict(state), cursor))
+
+        expected = self.expected_state()
+        self.assertIn(("product", Product.objects.get().pk), expected)
+        self.assertTrue(Brand.objects.filter(name="Lada").exists())
+        self.sync(in_flight_state, in_flight_cursor, limit=2)
+        self.assertEqual(in_flight_state, expected)
+        state = {}
+        self.sync(state, None, limit=2)
+        self.assertEqual(state, expected)
+        for state, cursor in checkpoints:
+            self.sync(state, cursor, limit=2)
+            self.assertEqual(state, expected)
+
+    def test_private_references_of_other_users_are_not_sent(self):
+        Brand.objects.create(name="Theirs", user=self.other_user)
+        own = Brand.objects.create(name="Mine", user=self.user)
+        public = Brand.objects.create(name="Toyota")
+        state = {}
+        cursor = self.sync(state, None)
+        self.assertEqual(set(state), {("brand", own.pk), ("brand", public.pk)})
+
+        Brand.objects.create(name="Theirs too", user=self.other_user)
+        page = self.fetch(cursor)
+        self.assertEqual(page["changes"], [])
+
+    def test_compaction_keeps_clients_converging(self):
+        state = {}
+        cursor = self.sync(state, None)
+        category = Category.objects.create(name="Tea")
+        for name in ["Green tea", "Black tea", "Herbal tea"]:
+            category.name = name
+            category.save()
+
+        call_command("compact_changes", stdout=io.StringIO())
+        self.assertEqual(Change.objects.filter(kind="category").count(), 1)
+        self.sync(state, cursor)
+        self.assertEqual(state, self.expected_state())
+
+    def test_compaction_keeps_tombstones_of_previous_owners(self):
+        brand = Brand.objects.create(name="Mine", user=self.user)
+        state = {}
+        cursor = self.sync(state, None)
+        self.assertIn(("brand", brand.pk), state)
+        brand.user = self.other_user
+        brand.save()
+
+        call_command("compact_changes", stdout=io.StringIO())
+        self.sync(state, cursor)
+        self.assertNotIn(("brand", brand.pk), state)
+
+    def test_cursor_older_than_retention_is_gone(self):
+        state = {}
+        cursor = self.sync(state, None)
+        Category.objects.create(name="Tea")
+        newer_cursor = self.sync(state, cursor)
+        Change.objects.update(
+            created_at=Change.objects.get().created_at - timedelta(days=31)
+        )
+
+        call_command("compact_changes", stdout=io.StringIO())
+        response = self.client.get(self.url, {"since": cursor})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        self.assertEqual(self.fetch(newer_cursor)["changes"], [])
+        # Starting over works.
+        state = {}
+        self.sync(state, None)
+        self.assertEqual(state, self.expected_state())
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"since": "snapshot:1:vehicle:0"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
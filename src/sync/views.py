@@ -0,0 +1,58 @@
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .feeds import MAX_PAGE_SIZE, get_page
+from .serializers import SyncPageSerializer
+
+
+class SyncView(APIView):
+    """
+    get:
+    Changes to the catalogue since a cursor, for clients keeping their own
+    copy of it. Without a cursor, pages through everything first.
+    """
+
+    permission_classes = [IsAuthenticated]
+    default_page_size = 500
+
+    @swagger_auto_schema(
+        operation_description="Return the brands, models, colors, categories, "
+        "option groups, options, shops, branches and products changed since the "
+        "cursor: the current state of each, or a tombstone for the ones deleted "
+        "or hidden. Request the returned cursor until has_more is false, and "
+        "keep the last one for the next sync. A 410 response means the cursor "
+        "is too old: drop the cache and sync without one.",
+        manual_parameters=[
+            openapi.Parameter(
+                "since",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="Cursor of the previous page, empty for a full sync",
+            ),
+            openapi.Parameter(
+                "limit",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description=f"Changes per page, at most {MAX_PAGE_SIZE}",
+            ),
+        ],
+        responses={200: SyncPageSerializer},
+    )
+    def get(self, request, *args, **kwargs):
+        changes, cursor, has_more = get_page(
+            request, request.query_params.get("since"), self.get_limit()
+        )
+        return Response({"changes": changes, "cursor": cursor, "has_more": has_more})
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.query_params.get("limit", self.default_page_size))
+        except ValueError:
+            raise ValidationError({"limit": "Expected an integer."})
+        if limit < 1:
+            raise ValidationError({"limit": "Expected a positive integer."})
+        return min(limit, MAX_PAGE_SIZE)
@@ -1,32 +1,44 @@
 from django.contrib import admin
 from modeltranslation.admin import TranslationAdmin
 
+from config.admin import AutocompleteFilter, ScalableAdminMixin
+
 from .models import Brand, Color, Model, Vehicle
 
 
 @admin.register(Brand)
-class BrandAdmin(TranslationAdmin):
+class BrandAdmin(ScalableAdminMixin, TranslationAdmin):
     list_display = ("name", "user", "created_at", "updated_at")
+    list_select_related = ("user",)
     search_fields = ("name",)
-    list_filter = ("user", "created_at")
+    list_filter = (("user", AutocompleteFilter), "created_at")
+    autocomplete_fields = ("user",)
 
 
 @admin.register(Model)
-class ModelAdmin(TranslationAdmin):
+class ModelAdmin(ScalableAdminMixin, TranslationAdmin):
     list_display = ("name", "brand", "user", "created_at", "updated_at")
+    list_select_related = ("brand", "user")
     search_fields = ("name", "brand__name")
-    list_filter = ("brand", "user", "created_at")
+    list_filter = (
+        ("brand", AutocompleteFilter),
+        ("user", AutocompleteFilter),
+        "created_at",
+    )
+    autocomplete_fields = ("brand", "user")
 
 
 @admin.register(Color)
-class ColorAdmin(TranslationAdmin):
+class ColorAdmin(ScalableAdminMixin, TranslationAdmin):
     list_display = ("name", "rgb_code", "user", "created_at", "updated_at")
+    list_select_related = ("user",)
     search_fields = ("name", "rgb_code")
-    list_filter = ("user", "created_at")
+    list_filter = (("user", AutocompleteFilter), "created_at")
+    autocomplete_fields = ("user",)
 
 
 @admin.register(Vehicle)
-class VehicleAdmin(admin.ModelAdmin):
+class VehicleAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = (
         "plate_number",
         "brand",
@@ -36,5 +48,13 @@ class VehicleAdmin(admin.ModelAdmin):
         "created_at",
         "updated_at",
     )
+    list_select_related = ("brand", "model", "color", "user")
     search_fields = ("plate_number", "brand__name", "model__name", "color__name")
-    list_filter = ("brand", "model", "color", "user", "created_at")
+    list_filter = (
+        ("brand", AutocompleteFilter),
+        ("model", AutocompleteFilter),
+        ("color", AutocompleteFilter),
+        ("user", AutocompleteFilter),
+        "created_at",
+    )
+    autocomplete_fields = ("brand", "model", "color", "user")
@@ -0,0 +1,232 @@
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from sync.log import record_changes
+
+from .models import Brand, Color, Model, Vehicle
+from .references import resolve_references
+from .utils import normalize_plate_number
+
+MAX_BATCH_SIZE = 1000
+PLATE_CONSTRAINT = "vehicles_unique_plate_per_user"
+
+# Payload lists in the order they are written, with the fields an item sets.
+BATCH_LISTS = [
+    ("brands", Brand, ["name"]),
+    ("models", Model, ["name", "brand"]),
+    ("colors", Color, ["name", "rgb_code"]),
+    ("vehicles", Vehicle, ["plate_number", "brand", "model", "color"]),
+]
+REFERENCE_LISTS = {"brand": "brands", "model": "models", "color": "colors"}
+
+
+def is_same_row(first, second):
+    return first is second or (first.pk is not None and first.pk == second.pk)
+
+
+class VehicleBatch:
+    """
+    Brands, models, colors and vehicles created or updated together.
+
+    Items of the batch refer to each other through temporary ``ref`` strings,
+    so a new brand, one of its models and a vehicle of that model can be sent
+    in one request. The whole batch is checked with a fixed number of queries,
+    whatever its size, and written with one bulk query per list and operation.
+    """
+
+    def __init__(self, user, data):
+        self.user = user
+        self.items = {name: data.get(name, []) for name, *_ in BATCH_LISTS}
+        self.errors = {name: [{} for _ in items] for name, items in self.items.items()}
+        self.objects = {}
+
+    def add_error(self, name, index, field, message):
+        self.errors[name][index].setdefault(field, []).append(message)
+
+    def get_errors(self):
+        return {
+            name: errors
+            for name, errors in self.errors.items()
+            if any(error for error in errors)
+        }
+
+    def validate(self):
+        """
+        Build the unsaved objects of the batch, raising ``ValidationError``
+        with per-item errors, in the shape of a ``many=True`` serializer.
+        """
+        self.refs = self.get_refs()
+        self.targets = self.get_targets()
+        self.resolved = self.resolve()
+        for name, model, fields in BATCH_LISTS:
+            self.objects[name] = [
+                self.build(name, index, model, fields, item)
+                for index, item in enumerate(self.items[name])
+            ]
+        self.check_brands()
+        self.check_plate_numbers()
+
+        errors = self.get_errors()
+        if errors:
+            raise ValidationError(errors)
+
+    def get_refs(self):
+        refs = {}
+        for name, items in self.items.items():
+            refs[name] = {}
+            for index, item in enumerate(items):
+                if "ref" not in item:
+                    continue
+                if item["ref"] in refs[name]:
+                    self.add_error(name, index, "ref", "Duplicate reference.")
+                else:
+                    refs[name][item["ref"]] = index
+        return refs
+
+    def get_targets(self):
+        """
+        The user's own rows updated by the batch, one query per list.
+        """
+        targets = {}
+        for name, model, _ in BATCH_LISTS:
+            ids = {item["id"] for item in self.items[name] if "id" in item}
+            targets[name] = (
+                model.objects.filter(user=self.user).in_bulk(ids) if ids else {}
+            )
+            seen = set()
+            for index, item in enumerate(self.items[name]):
+                if "id" not in item:
+                    continue
+                if item["id"] not in targets[name]:
+                    self.add_error(name, index, "id", "Not found.")
+                elif item["id"] in seen:
+                    self.add_error(name, index, "id", "Duplicate id.")
+                seen.add(item["id"])
+        return targets
+
+    def resolve(self):
+        """
+        The existing brands, models and colors the batch refers to by id,
+        in one query.
+        """
+        ids = {kind: set() for kind in REFERENCE_LISTS}
+        for name, _, fields in BATCH_LISTS:
+            for item in self.items[name]:
+                for kind in REFERENCE_LISTS:
+                    value = item.get(kind) if kind in fields else None
+                    if isinstance(value, int):
+                        ids[kind].add(value)
+        for kind, name in REFERENCE_LISTS.items():
+            ids[kind] -= self.targets[name].keys()
+        return resolve_references(
+            self.user, **{f"{kind}_ids": ids[kind] for kind in REFERENCE_LISTS}
+        )
+
+    def get_reference(self, kind, value):
+        name = REFERENCE_LISTS[kind]
+        if isinstance(value, str):
+            index = self.refs[name].get(value)
+            return None if index is None else self.objects[name][index]
+        return self.targets[name].get(value) or self.resolved[kind].get(value)
+
+    def build(self, name, index, model, fields, item):
+        instance = self.targets[name].get(item.get("id")) or model(user=self.user)
+        for field in fields:
+            value = item[field]
+            if field in REFERENCE_LISTS:
+                value = self.get_reference(field, value)
+                if value is None:
+                    self.add_error(name, index, field, "Unknown reference.")
+                    continue
+            setattr(instance, field, value)
+        return instance
+
+    def check_brands(self):
+        for index, vehicle in enumerate(self.objects["vehicles"]):
+            if self.errors["vehicles"][index]:
+                continue
+            model = vehicle.model
+            if model.brand_id is None and not Model.brand.is_cached(model):
+                continue  # The model itself is invalid.
+            if Model.brand.is_cached(model):
+                matches = is_same_row(model.brand, vehicle.brand)
+            else:
+                matches = model.brand_id == vehicle.brand.pk
+            if not matches:
+                self.add_error(
+                    "vehicles",
+                    index,
+                    "model",
+                    "This model does not belong to the selected brand.",
+                )
+
+    def check_plate_numbers(self):
+        plates = {}
+        for index, vehicle in enumerate(self.objects["vehicles"]):
+            plate = normalize_plate_number(vehicle.plate_number)
+            vehicle.normalized_plate_number = plate
+            if plate in plates:
+                self.add_error(
+                    "vehicles",
+                    index,
+                    "plate_number",
+                    "This plate number is already in the batch.",
+                )
+            plates.setdefault(plate, index)
+        if not plates:
+            return
+
+        taken = (
+            Vehicle.objects.filter(user=self.user, normalized_plate_number__in=plates)
+            .exclude(id__in=self.targets["vehicles"].keys())
+            .values_list("normalized_plate_number", flat=True)
+        )
+        for plate in taken:
+            self.add_error(
+                "vehicles",
+                plates[plate],
+                "plate_number",
+                "You already have a vehicle with this plate number.",
+            )
+
+    def save(self):
+        """
+        Write the batch in one transaction and return ``{list: [(ref,
+        instance), ...]}`` in payload order.
+        """
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                for name, model, fields in BATCH_LISTS:
+                    objects = self.objects[name]
+                    model.objects.bulk_create(
+                        [obj for obj in objects if obj.pk is None]
+                    )
+                    updated = self.targets[name].values()
+                    if updated:
+                        for obj in updated:
+                            obj.updated_at = now
+                        update_fields = [*fields, "updated_at"]
+                        if model is Vehicle:
+                            update_fields.append("normalized_plate_number")
+                        model.objects.bulk_update(updated, update_fields)
+                    if model is not Vehicle:
+                        # Bulk writes send no signals.
+                        record_changes(objects)
+        except IntegrityError as error:
+            diag = getattr(error.__cause__, "diag", None)
+            if getattr(diag, "constraint_name", None) != PLATE_CONSTRAINT:
+                raise
+            # Plate numbers swapped between two of the user's vehicles.
+            raise ValidationError(
+                {"non_field_errors": ["Plate numbers conflict with each other."]}
+            )
+
+        return {
+            name: [
+                (item.get("ref"), obj)
+                for item, obj in zip(self.items[name], self.objects[name])
+            ]
+            for name in self.items
+        }
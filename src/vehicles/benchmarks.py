@@ -0,0 +1,12 @@
+from config.benchmarks import benchmark
+
+from .models import Vehicle
+from .serializers import VehicleSerializer
+
+
+@benchmark("vehicles.VehicleSerializer", sized=True)
+def vehicle_serializer(size):
+    vehicles = list(
+        Vehicle.objects.select_related("brand", "model", "color").order_by("id")[:size]
+    )
+    return lambda: VehicleSerializer(vehicles, many=True).data
@@ -0,0 +1,123 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from vehicles.models import Brand, Color, Model
+
+User = get_user_model()
+
+BATCH_SIZE = 10000
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the OR filter and the UNION ALL rewrite of the public-plus-owned "
+        "reference list queries on a synthetic dataset. The dataset is rolled "
+        "back afterwards unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model", choices=["brand", "model", "color"], default="brand"
+        )
+        parser.add_argument("--users", type=int, default=100000)
+        parser.add_argument("--rows", type=int, default=1000000)
+        parser.add_argument("--public-rows", type=int, default=500)
+        parser.add_argument("--samples", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--keep", action="store_true")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+
+        with transaction.atomic():
+            users = self.create_users(options["users"])
+            queryset = self.create_rows(options, users, rng)
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {queryset.model._meta.db_table}")
+
+            sample = rng.sample(users, min(options["samples"], len(users)))
+            results = {
+                "or": self.measure(
+                    sample,
+                    lambda user: queryset.filter(
+                        Q(user=user) | Q(user__isnull=True)
+                    ).order_by("id"),
+                ),
+                "union all": self.measure(
+                    sample, lambda user: queryset.visible_to(user)
+                ),
+            }
+            for name, timings in results.items():
+                self.report(name, timings)
+
+            if not options["keep"]:
+                transaction.set_rollback(True)
+
+    def create_users(self, count):
+        self.stdout.write(f"Creating {count} users...")
+        users = [
+            User(phone_number=f"+99890{index:07d}", password="!")
+            for index in range(count)
+        ]
+        return User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+
+    def create_rows(self, options, users, rng):
+        model_name = options["model"]
+        self.stdout.write(
+            f"Creating {options['public_rows']} public and {options['rows']} "
+            f"private {model_name} rows..."
+        )
+        brand = None
+        if model_name == "model":
+            brand = Brand.objects.create(name="Benchmark")
+
+        def build(index, user):
+            if model_name == "color":
+                return Color(name=f"Color {index}", rgb_code="#000000", user=user)
+            if model_name == "model":
+                return Model(name=f"Model {index}", brand=brand, user=user)
+            return Brand(name=f"Brand {index}", user=user)
+
+        model = type(build(0, None))
+        model.objects.bulk_create(
+            [build(index, None) for index in range(options["public_rows"])],
+            batch_size=BATCH_SIZE,
+        )
+        for start in range(0, options["rows"], BATCH_SIZE):
+            stop = min(start + BATCH_SIZE, options["rows"])
+            model.objects.bulk_create(
+                [build(index, rng.choice(users)) for index in range(start, stop)]
+            )
+
+        if brand is not None:
+            return Model.objects.filter(brand=brand)
+        return model.objects.all()
+
+    def measure(self, users, make_queryset):
+        """
+        Time the raw SQL round trip so model instantiation does not mask the
+        difference between the query plans.
+        """
+        timings = []
+        with connection.cursor() as cursor:
+            for user in users:
+                sql, params = make_queryset(user).query.sql_with_params()
+                started = time.perf_counter()
+                cursor.execute(sql, params)
+                cursor.fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def report(self, name, timings):
+        timings = sorted(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f"{name:>10}: median {statistics.median(timings):.2f} ms, "
+            f"p95 {p95:.2f} ms over {len(timings)} users"
+        )
@@ -0,0 +1,85 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from vehicles.models import Brand, Color, Model, Vehicle
+from vehicles.views import VehicleBatchView, VehicleListView
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare registering vehicles with one POST each against a single "
+        "batch POST. Every run is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=1000)
+        parser.add_argument("--samples", type=int, default=5)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        count = options["items"]
+
+        def single(user, brand, model, color):
+            view = VehicleListView.as_view()
+            for item in self.payload(count, brand, model, color):
+                request = factory.post("/vehicles/vehicles/", item, format="json")
+                force_authenticate(request, user=user)
+                response = view(request)
+                assert response.status_code == 201, response.data
+
+        def batch(user, brand, model, color):
+            data = {"vehicles": self.payload(count, brand, model, color)}
+            request = factory.post("/vehicles/vehicles/batch/", data, format="json")
+            force_authenticate(request, user=user)
+            response = VehicleBatchView.as_view()(request)
+            assert response.status_code == 201, response.data
+
+        self.stdout.write(f"{count} vehicles:")
+        for name, run in [("single", single), ("batch", batch)]:
+            self.report(name, *self.measure(run, options["samples"]))
+
+    def payload(self, count, brand, model, color):
+        return [
+            {
+                "plate_number": f"01A{index:06d}",
+                "brand": brand.id,
+                "model": model.id,
+                "color": color.id,
+            }
+            for index in range(count)
+        ]
+
+    def measure(self, run, samples):
+        timings, queries = [], 0
+        for _ in range(samples):
+            with transaction.atomic():
+                user = User.objects.create(phone_number="+998900000000", password="!")
+                brand = Brand.objects.create(name="Benchmark")
+                model = Model.objects.create(name="Benchmark", brand=brand)
+                color = Color.objects.create(name="Benchmark", rgb_code="#000000")
+                executed = []
+                with connection.execute_wrapper(
+                    lambda execute, *args: executed.append(args[0]) or execute(*args)
+                ):
+                    started = time.perf_counter()
+                    run(user, brand, model, color)
+                    timings.append((time.perf_counter() - started) * 1000)
+                queries = len(executed)
+                assert Vehicle.objects.filter(user=user).count() > 0
+                transaction.set_rollback(True)
+        return timings, queries
+
+    def report(self, name, timings, queries):
+        timings = sorted(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f"{name:>10}: median {statistics.median(timings):.2f} ms, "
+            f"p95 {p95:.2f} ms over {len(timings)} runs, {queries} queries"
+        )
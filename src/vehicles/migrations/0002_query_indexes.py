@@ -0,0 +1,54 @@
+# Generated by Django 5.1.2 on 2026-10-19 10:05
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("vehicles", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="brand",
+            index=models.Index(
+                condition=models.Q(("user__isnull", True)),
+                fields=["id"],
+                name="vehicles_brand_public_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="color",
+            index=models.Index(
+                condition=models.Q(("user__isnull", True)),
+                fields=["id"],
+                name="vehicles_color_public_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="model",
+            index=models.Index(
+                fields=["brand", "user"], name="vehicles_model_brand_user_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="model",
+            index=models.Index(
+                condition=models.Q(("user__isnull", True)),
+                fields=["brand"],
+                name="vehicles_model_public_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="vehicle",
+            index=models.Index(
+                fields=["user", "created_at"], name="vehicles_user_created_idx"
+            ),
+        ),
+    ]
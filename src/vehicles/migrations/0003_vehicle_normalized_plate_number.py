@@ -0,0 +1,72 @@
+# Generated by Django 5.1.2 on 2026-10-19 11:20
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import migrations, models
+from django.db.models import Count
+
+from vehicles.utils import normalize_plate_number
+
+
+def populate_normalized_plate_numbers(apps, schema_editor):
+    Vehicle = apps.get_model("vehicles", "Vehicle")
+    batch = []
+    for vehicle in Vehicle.objects.only("id", "plate_number").iterator():
+        vehicle.normalized_plate_number = normalize_plate_number(vehicle.plate_number)
+        batch.append(vehicle)
+        if len(batch) >= 1000:
+            Vehicle.objects.bulk_update(batch, ["normalized_plate_number"])
+            batch = []
+    Vehicle.objects.bulk_update(batch, ["normalized_plate_number"])
+
+
+def check_plate_number_collisions(apps, schema_editor):
+    """
+    Plates that were distinct before normalization, such as "01 A 123 BC"
+    and "01a123bc", may collide under the unique constraint. Which of the
+    vehicles to keep is the user's choice, so stop and list them instead.
+    """
+    Vehicle = apps.get_model("vehicles", "Vehicle")
+    collisions = (
+        Vehicle.objects.values("user_id", "normalized_plate_number")
+        .annotate(count=Count("id"), ids=ArrayAgg("id", ordering="id"))
+        .filter(count__gt=1)
+        .order_by("user_id", "normalized_plate_number")
+    )
+    if collisions:
+        lines = [
+            f"user {row['user_id']}, plate {row['normalized_plate_number']}: "
+            f"vehicles {', '.join(map(str, row['ids']))}"
+            for row in collisions
+        ]
+        raise RuntimeError(
+            "Vehicles of the same user share a normalized plate number. "
+            "Merge or delete the duplicates, then migrate again:\n" + "\n".join(lines)
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("vehicles", "0002_query_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="vehicle",
+            name="normalized_plate_number",
+            field=models.CharField(default="", editable=False, max_length=20),
+            preserve_default=False,
+        ),
+        migrations.RunPython(
+            populate_normalized_plate_numbers, migrations.RunPython.noop
+        ),
+        migrations.RunPython(check_plate_number_collisions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="vehicle",
+            constraint=models.UniqueConstraint(
+                fields=("user", "normalized_plate_number"),
+                name="vehicles_unique_plate_per_user",
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.2 on 2026-10-19 11:20
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("vehicles", "0003_vehicle_normalized_plate_number"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name="vehicle",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["normalized_plate_number"],
+                name="vehicles_plate_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+    ]
@@ -1,5 +1,10 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
+from django.db.models import Q
+
+from .querysets import PublicOrOwnedQuerySet
+from .utils import normalize_plate_number
 
 User = get_user_model()
 
@@ -13,6 +18,17 @@ class Brand(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PublicOrOwnedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=Q(user__isnull=True),
+                name="vehicles_brand_public_idx",
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -24,6 +40,20 @@ class Model(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PublicOrOwnedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["brand", "user"], name="vehicles_model_brand_user_idx"
+            ),
+            models.Index(
+                fields=["brand"],
+                condition=Q(user__isnull=True),
+                name="vehicles_model_public_idx",
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -35,12 +65,25 @@ class Color(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PublicOrOwnedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=Q(user__isnull=True),
+                name="vehicles_color_public_idx",
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
 
 class Vehicle(models.Model):
     plate_number = models.CharField(max_length=20)
+    # Maintained by save(), see vehicles.utils.normalize_plate_number.
+    normalized_plate_number = models.CharField(max_length=20, editable=False)
     brand = models.ForeignKey(Brand, on_delete=models.CASCADE)
     model = models.ForeignKey(Model, on_delete=models.CASCADE)
     color = models.ForeignKey(Color, on_delete=models.CASCADE)
@@ -48,5 +91,30 @@ class Vehicle(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "created_at"], name="vehicles_user_created_idx"
+            ),
+            GinIndex(
+                fields=["normalized_plate_number"],
+                opclasses=["gin_trgm_ops"],
+                name="vehicles_plate_trgm_idx",
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "normalized_plate_number"],
+                name="vehicles_unique_plate_per_user",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.plate_number} - {self.brand.name} {self.model.name}"
+
+    def save(self, *args, **kwargs):
+        self.normalized_plate_number = normalize_plate_number(self.plate_number)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "plate_number" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "normalized_plate_number"}
+        super().save(*args, **kwargs)
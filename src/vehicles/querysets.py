@@ -0,0 +1,31 @@
+from django.db import models
+
+
+class PublicOrOwnedQuerySet(models.QuerySet):
+    """
+    QuerySet for reference data that is either public (``user`` is null) or
+    private to the user who created it.
+
+    ``visible_to()`` replaces ``Q(user=user) | Q(user__isnull=True)``: an OR
+    across a nullable FK usually cannot be answered by a single index scan,
+    while each half of the UNION ALL maps onto its own index (the partial
+    ``user IS NULL`` index and the ``user_id`` index) and the halves never
+    overlap, so no de-duplication is needed.
+    """
+
+    def public(self):
+        return self.filter(user__isnull=True)
+
+    def owned_by(self, user):
+        return self.filter(user=user)
+
+    def visible_to(self, user, ordering=("id",)):
+        """
+        Public rows plus the rows owned by ``user``, in a stable order.
+
+        Apply any other filters before calling this: the result is a combined
+        query, so Django only allows ordering, slicing and ``values()`` on it.
+        """
+        if user is None or not user.is_authenticated:
+            return self.public().order_by(*ordering)
+        return self.public().union(self.owned_by(user), all=True).order_by(*ordering)
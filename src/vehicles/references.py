@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, IntegerField, Q, Value
+from django.db.models.fields import CharField
+from modeltranslation.utils import build_localized_fieldname
+
+from .models import Brand, Color, Model
+
+# Every translation of ``name``, so the instances keep modeltranslation's
+# fallback to the default language.
+NAME_FIELDS = [
+    build_localized_fieldname("name", language) for language, _ in settings.LANGUAGES
+]
+
+
+def visible_rows(model, kind, ids, user):
+    queryset = model.objects.filter(pk__in=ids)
+    if user is not None and user.is_authenticated:
+        queryset = queryset.filter(Q(user__isnull=True) | Q(user=user))
+    else:
+        queryset = queryset.filter(user__isnull=True)
+    brand = F("brand_id") if model is Model else Value(None, IntegerField())
+    return queryset.annotate(
+        ref_kind=Value(kind, CharField()),
+        ref_id=F("id"),
+        ref_user=F("user_id"),
+        ref_brand=brand,
+        **{f"ref_{name}": F(name) for name in NAME_FIELDS},
+    ).values_list(
+        "ref_kind",
+        "ref_id",
+        "ref_user",
+        "ref_brand",
+        *(f"ref_{name}" for name in NAME_FIELDS),
+    )
+
+
+def to_instance(model, values):
+    """
+    A model instance with only the given ``{attname: value}`` loaded.
+    """
+    field_names = [
+        field.attname
+        for field in model._meta.concrete_fields
+        if field.attname in values
+    ]
+    return model.from_db(
+        connection.alias, field_names, [values[name] for name in field_names]
+    )
+
+
+def resolve_references(user, brand_ids=(), model_ids=(), color_ids=()):
+    """
+    The brands, models and colors with the given ids that ``user`` may use,
+    as ``{"brand": {id: Brand}, "model": {...}, "color": {...}}``, fetched
+    with one UNION ALL query.
+
+    The instances only have ``id``, ``name``, ``user`` and, for models,
+    ``brand`` loaded, which is all a vehicle needs to be saved and shown.
+    """
+    lookups = [
+        (Brand, "brand", set(brand_ids)),
+        (Model, "model", set(model_ids)),
+        (Color, "color", set(color_ids)),
+    ]
+    querysets = [
+        visible_rows(model, kind, ids, user) for model, kind, ids in lookups if ids
+    ]
+    resolved = {kind: {} for _, kind, _ in lookups}
+    if not querysets:
+        return resolved
+
+    models = {kind: model for model, kind, _ in lookups}
+    rows = querysets[0].union(*querysets[1:], all=True)
+    for kind, pk, user_id, brand_id, *names in rows:
+        values = {"id": pk, "user_id": user_id, **dict(zip(NAME_FIELDS, names))}
+        if models[kind] is Model:
+            values["brand_id"] = brand_id
+        resolved[kind][pk] = to_instance(models[kind], values)
+    return resolved
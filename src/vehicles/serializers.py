@@ -1,6 +1,11 @@
 from rest_framework import serializers
 
+from accounts.serializers import UserDetailSerializer
+
+from .batch import MAX_BATCH_SIZE, VehicleBatch
 from .models import Brand, Color, Model, Vehicle
+from .references import resolve_references
+from .utils import normalize_plate_number
 
 
 class BrandSerializer(serializers.ModelSerializer):
@@ -21,10 +26,28 @@ class ColorSerializer(serializers.ModelSerializer):
         fields = ["id", "name", "rgb_code", "created_at", "updated_at", "user"]
 
 
+class ReferenceField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key of a brand, model or color, taken without a lookup.
+    ``VehicleSerializer.validate`` resolves all of them in one query.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            return int(data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+
+
 class VehicleSerializer(serializers.ModelSerializer):
     brand_name = serializers.CharField(source="brand.name", read_only=True)
     model_name = serializers.CharField(source="model.name", read_only=True)
     color_name = serializers.CharField(source="color.name", read_only=True)
+    brand = ReferenceField(queryset=Brand.objects.all())
+    model = ReferenceField(queryset=Model.objects.all())
+    color = ReferenceField(queryset=Color.objects.all())
 
     class Meta:
         model = Vehicle
@@ -40,3 +63,180 @@ class VehicleSerializer(serializers.ModelSerializer):
             "created_at",
             "updated_at",
         ]
+
+    def validate_plate_number(self, value):
+        normalized = normalize_plate_number(value)
+        if not normalized:
+            raise serializers.ValidationError("Enter a valid plate number.")
+
+        request = self.context.get("request")
+        if request is not None:
+            duplicates = Vehicle.objects.filter(
+                user=request.user, normalized_plate_number=normalized
+            )
+            if self.instance is not None:
+                duplicates = duplicates.exclude(pk=self.instance.pk)
+            if duplicates.exists():
+                raise serializers.ValidationError(
+                    "You already have a vehicle with this plate number."
+                )
+        return value
+
+    def validate(self, attrs):
+        """
+        Resolve the brand, model and color in one query restricted to public
+        rows and the user's own, and check that the model is of the brand.
+        The resolved objects are kept for saving and for the response.
+        """
+        names = [name for name in ("brand", "model", "color") if name in attrs]
+        if not names:
+            return attrs
+
+        request = self.context.get("request")
+        resolved = resolve_references(
+            request.user if request is not None else None,
+            **{f"{name}_ids": [attrs[name]] for name in names},
+        )
+        errors = {}
+        for name in names:
+            reference = resolved[name].get(attrs[name])
+            if reference is None:
+                message = self.fields[name].error_messages["does_not_exist"]
+                errors[name] = [message.format(pk_value=attrs[name])]
+            else:
+                attrs[name] = reference
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        brand_id = attrs["brand"].pk if "brand" in attrs else self.instance.brand_id
+        model = attrs["model"] if "model" in attrs else self.instance.model
+        if model.brand_id != brand_id:
+            raise serializers.ValidationError(
+                {"model": ["This model does not belong to the selected brand."]}
+            )
+        return attrs
+
+
+class VehiclePlateLookupSerializer(VehicleSerializer):
+    owner = UserDetailSerializer(source="user", read_only=True)
+    similarity = serializers.FloatField(read_only=True)
+
+    class Meta(VehicleSerializer.Meta):
+        fields = VehicleSerializer.Meta.fields + ["owner", "similarity"]
+
+
+class PlateLookupOwnerSerializer(UserDetailSerializer):
+    class Meta(UserDetailSerializer.Meta):
+        fields = ("id", "first_name", "last_name")
+
+
+class ShopPlateLookupSerializer(VehiclePlateLookupSerializer):
+    """
+    A plate match for shop staff, who may greet the customer but not see
+    their contact details.
+    """
+
+    owner = PlateLookupOwnerSerializer(source="user", read_only=True)
+
+
+class BatchReferenceField(serializers.Field):
+    """
+    Id of an existing brand, model or color, or the ``ref`` of one sent in
+    the same batch.
+    """
+
+    default_error_messages = {"invalid": "Expected an id or a reference string."}
+
+    def to_internal_value(self, data):
+        if isinstance(data, int) and not isinstance(data, bool):
+            return data
+        if isinstance(data, str) and data:
+            return data
+        self.fail("invalid")
+
+    def to_representation(self, value):
+        return value
+
+
+class BatchItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField(
+        required=False, help_text="Id of one of your own rows to update"
+    )
+    ref = serializers.CharField(
+        required=False,
+        max_length=64,
+        help_text="Temporary id other items of the batch can refer to",
+    )
+
+    def validate(self, attrs):
+        if "id" in attrs and "ref" in attrs:
+            raise serializers.ValidationError(
+                "Give either an id to update or a ref for a new item."
+            )
+        return attrs
+
+
+class BatchBrandSerializer(BatchItemSerializer):
+    name = serializers.CharField(max_length=100)
+
+
+class BatchModelSerializer(BatchItemSerializer):
+    name = serializers.CharField(max_length=100)
+    brand = BatchReferenceField()
+
+
+class BatchColorSerializer(BatchItemSerializer):
+    name = serializers.CharField(max_length=50)
+    rgb_code = serializers.CharField(max_length=7)
+
+
+class BatchVehicleSerializer(BatchItemSerializer):
+    plate_number = serializers.CharField(max_length=20)
+    brand = BatchReferenceField()
+    model = BatchReferenceField()
+    color = BatchReferenceField()
+
+    def validate_plate_number(self, value):
+        if not normalize_plate_number(value):
+            raise serializers.ValidationError("Enter a valid plate number.")
+        return value
+
+
+class VehicleBatchSerializer(serializers.Serializer):
+    """
+    Creates and updates brands, models, colors and vehicles in one request.
+    See ``vehicles.batch.VehicleBatch``.
+    """
+
+    brands = BatchBrandSerializer(many=True, required=False, max_length=MAX_BATCH_SIZE)
+    models = BatchModelSerializer(many=True, required=False, max_length=MAX_BATCH_SIZE)
+    colors = BatchColorSerializer(many=True, required=False, max_length=MAX_BATCH_SIZE)
+    vehicles = BatchVehicleSerializer(
+        many=True, required=False, max_length=MAX_BATCH_SIZE
+    )
+
+    output_serializers = {
+        "brands": BrandSerializer,
+        "models": ModelSerializer,
+        "colors": ColorSerializer,
+        "vehicles": VehicleSerializer,
+    }
+
+    def validate(self, attrs):
+        if not any(attrs.values()):
+            raise serializers.ValidationError("The batch is empty.")
+        self.batch = VehicleBatch(self.context["request"].user, attrs)
+        self.batch.validate()
+        return attrs
+
+    def create(self, validated_data):
+        return self.batch.save()
+
+    def to_representation(self, instance):
+        data = {}
+        for name, serializer in self.output_serializers.items():
+            items = instance.get(name, [])
+            # One list serializer per kind, so fields are only built once.
+            rows = serializer([obj for _, obj in items], many=True).data
+            data[name] = [{**row, "ref": ref} for (ref, _), row in zip(items, rows)]
+        return data
@@ -2,16 +2,32 @@ import io
 import os
 import shutil
 import tempfile
+from unittest.mock import patch
 
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import override_settings
+from django.db import IntegrityError, connection, connections
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
 from PIL import Image
 from rest_framework import status
-from rest_framework.test import APITestCase
-
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from config.replicas import (
+    PIN_COOKIE,
+    ReplicaRouter,
+    get_pin_key,
+    get_read_alias,
+    lags,
+    read_alias,
+)
+from config.replicas import redis_instance as replicas_redis
+from config.replicas import replica_lag
+from config.testing import explain_without_seqscan
 from vehicles.models import Brand, Color, Model, Vehicle
+from vehicles.utils import normalize_plate_number
 
 User = get_user_model()
 
@@ -216,6 +232,67 @@ class VehicleTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(response.data["plate_number"], "XYZ123")
 
+    def test_create_vehicle_resolves_references_in_one_query(self):
+        self.client.force_authenticate(user=self.user)
+        data = {
+            "plate_number": "XYZ123",
+            "brand": self.brand.id,
+            "model": self.model.id,
+            "color": self.color.id,
+        }
+        # Plate uniqueness check, reference lookup, insert.
+        with self.assertNumQueries(3):
+            response = self.client.post(self.url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["brand_name"], "Toyota")
+        self.assertEqual(response.data["model_name"], "Corolla")
+        self.assertEqual(response.data["color_name"], "Black")
+
+    def test_update_vehicle_resolves_references_in_one_query(self):
+        vehicle = Vehicle.objects.create(
+            plate_number="ABC123",
+            brand=self.brand,
+            model=self.model,
+            color=self.color,
+            user=self.user,
+        )
+        camry = Model.objects.create(name="Camry", brand=self.brand, user=self.user)
+        white = Color.objects.create(name="White", rgb_code="#FFFFFF", user=self.user)
+        self.client.force_authenticate(user=self.user)
+        url = reverse("vehicle-detail", args=[vehicle.id])
+        # Vehicle fetch, reference lookup, update.
+        with self.assertNumQueries(3):
+            response = self.client.patch(
+                url, {"model": camry.id, "color": white.id}, format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["model_name"], "Camry")
+        self.assertEqual(response.data["color_name"], "White")
+
+    def test_create_vehicle_rejects_invalid_references(self):
+        other_user = User.objects.create_user(
+            phone_number="+0987654321", password="password"
+        )
+        private_brand = Brand.objects.create(name="Secret", user=other_user)
+        other_brand = Brand.objects.create(name="Honda")
+        civic = Model.objects.create(name="Civic", brand=other_brand)
+        self.client.force_authenticate(user=self.user)
+
+        data = {
+            "plate_number": "XYZ123",
+            "brand": private_brand.id,
+            "model": self.model.id,
+            "color": 0,
+        }
+        response = self.client.post(self.url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {"brand", "color"})
+
+        data.update(brand=self.brand.id, model=civic.id, color=self.color.id)
+        response = self.client.post(self.url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("model", response.data)
+
     def test_list_vehicles(self):
         # Create user-specific vehicle
         Vehicle.objects.create(
@@ -264,3 +341,448 @@ class VehicleTests(APITestCase):
         self.client.force_authenticate(user=self.user)
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class VehicleBatchTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            phone_number="+1234567890", password="password"
+        )
+        self.brand = Brand.objects.create(name="Toyota")
+        self.model = Model.objects.create(name="Corolla", brand=self.brand)
+        self.color = Color.objects.create(name="Black", rgb_code="#000000")
+        self.url = reverse("vehicle-batch")
+        self.client.force_authenticate(user=self.user)
+
+    def vehicles(self, count, start=0):
+        return [
+            {
+                "plate_number": f"01A{index:03d}BC",
+                "brand": self.brand.id,
+                "model": self.model.id,
+                "color": self.color.id,
+            }
+            for index in range(start, start + count)
+        ]
+
+    def test_new_items_refer_to_each_other(self):
+        data = {
+            "brands": [{"ref": "b", "name": "Lada"}],
+            "models": [{"ref": "m", "name": "Niva", "brand": "b"}],
+            "colors": [{"ref": "c", "name": "Sand", "rgb_code": "#C2B280"}],
+            "vehicles": [
+                {
+                    "plate_number": "01 a 001 bc",
+                    "brand": "b",
+                    "model": "m",
+                    "color": "c",
+                }
+            ],
+        }
+        response = self.client.post(self.url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        brand = Brand.objects.get(name="Lada", user=self.user)
+        vehicle = Vehicle.objects.get(user=self.user)
+        self.assertEqual(vehicle.brand, brand)
+        self.assertEqual(vehicle.model.brand, brand)
+        self.assertEqual(vehicle.color.name, "Sand")
+        self.assertEqual(vehicle.normalized_plate_number, "01A001BC")
+        self.assertEqual(response.data["brands"][0]["ref"], "b")
+        self.assertEqual(response.data["brands"][0]["id"], brand.id)
+        self.assertEqual(response.data["vehicles"][0]["model_name"], "Niva")
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        # Reference lookup, plate check, and the insert in a savepoint.
+        with self.assertNumQueries(5):
+            response = self.client.post(
+                self.url, {"vehicles": self.vehicles(2)}, format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        with self.assertNumQueries(5):
+            response = self.client.post(
+                self.url, {"vehicles": self.vehicles(200, start=2)}, format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Vehicle.objects.filter(user=self.user).count(), 202)
+
+    def test_errors_are_reported_per_item_and_nothing_is_saved(self):
+        other_user = User.objects.create_user(
+            phone_number="+0987654321", password="password"
+        )
+        private_color = Color.objects.create(
+            name="Secret", rgb_code="#123456", user=other_user
+        )
+        Vehicle.objects.create(
+            plate_number="01A000BC",
+            brand=self.brand,
+            model=self.model,
+            color=self.color,
+            user=self.user,
+        )
+        vehicles = self.vehicles(5)
+        vehicles[1]["color"] = private_color.id
+        vehicles[2]["model"] = "missing"
+        vehicles[3]["plate_number"] = vehicles[4]["plate_number"]
+        data = {"brands": [{"ref": "b", "name": "Lada"}], "vehicles": vehicles}
+
+        response = self.client.post(self.url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = response.data["vehicles"]
+        self.assertEqual(set(errors[0]), {"plate_number"})
+        self.assertEqual(set(errors[1]), {"color"})
+        self.assertEqual(set(errors[2]), {"model"})
+        self.assertEqual(errors[3], {})
+        self.assertEqual(set(errors[4]), {"plate_number"})
+        self.assertNotIn("brands", response.data)
+        self.assertFalse(Brand.objects.filter(name="Lada").exists())
+        self.assertEqual(Vehicle.objects.count(), 1)
+
+    def test_model_must_belong_to_brand(self):
+        data = {
+            "brands": [{"ref": "b", "name": "Lada"}],
+            "vehicles": [dict(self.vehicles(1)[0], brand="b")],
+        }
+        response = self.client.post(self.url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("model", response.data["vehicles"][0])
+
+    def test_update_own_rows(self):
+        brand = Brand.objects.create(name="Lada", user=self.user)
+        niva = Model.objects.create(name="Niva", brand=brand, user=self.user)
+        vehicle = Vehicle.objects.create(
+            plate_number="01A000BC",
+            brand=self.brand,
+            model=self.model,
+            color=self.color,
+            user=self.user,
+        )
+        data = {
+            "brands": [{"id": brand.id, "name": "VAZ"}],
+            "vehicles": [
+                {
+                    "id": vehicle.id,
+                    "plate_number": "01A999BC",
+                    "brand": brand.id,
+                    "model": niva.id,
+                    "color": self.color.id,
+                }
+            ],
+        }
+        response = self.client.post(self.url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        vehicle.refresh_from_db()
+        self.assertEqual(vehicle.normalized_plate_number, "01A999BC")
+        self.assertEqual(vehicle.model, niva)
+        self.assertEqual(vehicle.brand.name, "VAZ")
+        self.assertEqual(response.data["vehicles"][0]["brand_name"], "VAZ")
+
+    def test_cannot_update_public_or_other_users_rows(self):
+        data = {"brands": [{"id": self.brand.id, "name": "Renamed"}]}
+        response = self.client.post(self.url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("id", response.data["brands"][0])
+        self.brand.refresh_from_db()
+        self.assertEqual(self.brand.name, "Toyota")
+
+    def test_swapped_plates_conflict(self):
+        first, second = [
+            Vehicle.objects.create(
+                plate_number=plate,
+                brand=self.brand,
+                model=self.model,
+                color=self.color,
+                user=self.user,
+            )
+            for plate in ["01A000BC", "01A001BC"]
+        ]
+        vehicles = self.vehicles(2)
+        vehicles[0]["id"], vehicles[1]["id"] = second.id, first.id
+        response = self.client.post(self.url, {"vehicles": vehicles}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data["non_field_errors"],
+            ["Plate numbers conflict with each other."],
+        )
+
+    def test_other_integrity_errors_are_not_plate_conflicts(self):
+        data = {"brands": [{"ref": "b", "name": "Lada"}]}
+        with patch(
+            "vehicles.batch.record_changes", side_effect=IntegrityError("other")
+        ):
+            with self.assertRaises(IntegrityError):
+                self.client.post(self.url, data, format="json")
+
+    def test_batch_size_is_limited(self):
+        response = self.client.post(
+            self.url, {"vehicles": self.vehicles(1001)}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("vehicles", response.data)
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            phone_number="+1234567890", password="password"
+        )
+        self.brand = Brand.objects.create(name="Toyota", user=self.user)
+        self.model = Model.objects.create(name="Corolla", brand=self.brand)
+        self.color = Color.objects.create(name="Black", rgb_code="#000000")
+        self.vehicle = Vehicle.objects.create(
+            plate_number="XYZ123",
+            brand=self.brand,
+            model=self.model,
+            color=self.color,
+            user=self.user,
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_brand_not_modified(self):
+        url = reverse("brand-detail", args=[self.brand.id])
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_vehicle_etag_follows_brand_rename(self):
+        url = reverse("vehicle-detail", args=[self.vehicle.id])
+        etag = self.client.get(url)["ETag"]
+        self.brand.name = "Lexus"
+        self.brand.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["brand_name"], "Lexus")
+
+    def test_conditional_get_other_user_vehicle(self):
+        other_user = User.objects.create_user(
+            phone_number="+9876543210", password="password"
+        )
+        self.client.force_authenticate(user=other_user)
+        url = reverse("vehicle-detail", args=[self.vehicle.id])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class IndexUsageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            phone_number="+1234567890", password="password"
+        )
+        self.public_or_owned = Q(user=self.user) | Q(user__isnull=True)
+
+    def test_brand_list_uses_public_index(self):
+        plan = explain_without_seqscan(Brand.objects.filter(self.public_or_owned))
+        self.assertIn("vehicles_brand_public_idx", plan)
+
+    def test_model_list_uses_brand_user_index(self):
+        brand = Brand.objects.create(name="Toyota")
+        plan = explain_without_seqscan(
+            Model.objects.filter(self.public_or_owned, brand=brand)
+        )
+        self.assertIn("vehicles_model_brand_user_idx", plan)
+
+    def test_color_list_uses_public_index(self):
+        plan = explain_without_seqscan(Color.objects.filter(self.public_or_owned))
+        self.assertIn("vehicles_color_public_idx", plan)
+
+    def test_vehicle_list_uses_user_created_index(self):
+        # The unique plate constraint also leads with user_id; only the
+        # composite index returns a user's vehicles already in date order.
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_sort = off")
+        plan = explain_without_seqscan(
+            Vehicle.objects.filter(user=self.user).order_by("-created_at")
+        )
+        self.assertIn("vehicles_user_created_idx", plan)
+
+
+class PublicOrOwnedQuerySetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            phone_number="+1234567890", password="password"
+        )
+        self.other_user = User.objects.create_user(
+            phone_number="+9876543210", password="password"
+        )
+
+    def test_visible_to_returns_public_and_owned_rows_in_order(self):
+        own = Color.objects.create(name="Green", rgb_code="#00FF00", user=self.user)
+        public = Color.objects.create(name="Blue", rgb_code="#0000FF")
+        Color.objects.create(name="Red", rgb_code="#FF0000", user=self.other_user)
+
+        colors = list(Color.objects.visible_to(self.user))
+        self.assertEqual(colors, [own, public])
+
+    def test_visible_to_keeps_prior_filters(self):
+        brand = Brand.objects.create(name="Toyota")
+        other_brand = Brand.objects.create(name="Ford")
+        public = Model.objects.create(name="Camry", brand=brand)
+        own = Model.objects.create(name="Corolla", brand=brand, user=self.user)
+        Model.objects.create(name="Focus", brand=other_brand, user=self.user)
+
+        models = list(Model.objects.filter(brand=brand).visible_to(self.user))
+        self.assertEqual(models, [public, own])
+
+    def test_visible_to_uses_one_index_per_half(self):
+        plan = explain_without_seqscan(Brand.objects.visible_to(self.user))
+        self.assertIn("vehicles_brand_public_idx", plan)
+        self.assertIn("vehicles_brand_user_id", plan)
+
+
+class PlateNumberTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            phone_number="+1234567890", password="password"
+        )
+        self.staff = User.objects.create_user(
+            phone_number="+1987654321", password="password", role="owner"
+        )
+        self.brand = Brand.objects.create(name="Chevrolet")
+        self.model = Model.objects.create(name="Cobalt", brand=self.brand)
+        self.color = Color.objects.create(name="White", rgb_code="#FFFFFF")
+        self.vehicle = Vehicle.objects.create(
+            plate_number="01 A 123 BC",
+            brand=self.brand,
+            model=self.model,
+            color=self.color,
+            user=self.user,
+        )
+        Vehicle.objects.create(
+            plate_number="40 K 777 XA",
+            brand=self.brand,
+            model=self.model,
+            color=self.color,
+            user=self.user,
+        )
+        self.url = reverse("vehicle-plate-lookup")
+
+    def test_normalize_plate_number(self):
+        self.assertEqual(normalize_plate_number("01 а-123 вс"), "01A123BC")
+        self.assertEqual(self.vehicle.normalized_plate_number, "01A123BC")
+
+    def test_duplicate_plate_for_same_user_rejected(self):
+        self.client.force_authenticate(user=self.user)
+        data = {
+            "plate_number": "01a123-bc",
+            "brand": self.brand.id,
+            "model": self.model.id,
+            "color": self.color.id,
+        }
+        response = self.client.post(reverse("vehicle-list"), data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("plate_number", response.data)
+
+    def test_lookup_noisy_plate(self):
+        self.client.force_authenticate(user=self.staff)
+        # Cyrillic letters, spaces and one misread digit.
+        response = self.client.get(self.url, {"plate": "01 А 128 ВС"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]["id"], self.vehicle.id)
+        self.assertEqual(response.data[0]["owner"]["id"], self.user.id)
+        self.assertNotIn("phone_number", response.data[0]["owner"])
+
+    def test_lookup_shows_phone_number_to_admins(self):
+        admin = User.objects.create_user(
+            phone_number="+1555000111", password="password", role="admin"
+        )
+        self.client.force_authenticate(user=admin)
+        response = self.client.get(self.url, {"plate": "01A123BC"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]["owner"]["phone_number"], "+1234567890")
+
+    def test_lookup_partial_plate(self):
+        self.client.force_authenticate(user=self.staff)
+        response = self.client.get(self.url, {"plate": "123b"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item["id"] for item in response.data], [self.vehicle.id])
+
+    def test_lookup_requires_staff_role(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(self.url, {"plate": "01A123BC"})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_lookup_rejects_short_query(self):
+        self.client.force_authenticate(user=self.staff)
+        response = self.client.get(self.url, {"plate": "1-"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_lookup_uses_trigram_index(self):
+        plan = explain_without_seqscan(
+            Vehicle.objects.filter(normalized_plate_number__trigram_similar="01A128BC")
+        )
+        self.assertIn("vehicles_plate_trgm_idx", plan)
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        token = read_alias.set("replica1")
+        self.addCleanup(read_alias.reset, token)
+
+    def test_reads_go_to_request_replica(self):
+        self.assertEqual(self.router.db_for_read(Vehicle), "replica1")
+
+    def test_writes_go_to_primary(self):
+        self.assertEqual(self.router.db_for_write(Vehicle), "default")
+
+    def test_reads_in_transaction_go_to_primary(self):
+        with patch.object(connections["default"], "in_atomic_block", True):
+            self.assertEqual(self.router.db_for_read(Vehicle), "default")
+
+
+@patch("config.replicas.replica_aliases", return_value=["replica1"])
+@patch("config.replicas.replica_lag", return_value=0.5)
+class ReplicaRoutingTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            phone_number="+1234567890", password="password"
+        )
+        self.brand = Brand.objects.create(name="Toyota")
+        self.model = Model.objects.create(name="Corolla", brand=self.brand)
+        self.color = Color.objects.create(name="Black", rgb_code="#000000")
+        replicas_redis.delete(get_pin_key(self.user.pk))
+        self.addCleanup(replicas_redis.delete, get_pin_key(self.user.pk))
+
+    def get(self, method="get"):
+        token = AccessToken.for_user(self.user)
+        return getattr(APIRequestFactory(), method)(
+            reverse("vehicle-list"), HTTP_AUTHORIZATION=f"Bearer {token}"
+        )
+
+    def test_safe_requests_read_from_replica(self, replica_lag, replica_aliases):
+        self.assertEqual(get_read_alias(self.get()), "replica1")
+        self.assertEqual(get_read_alias(self.get("head")), "replica1")
+
+    def test_writes_read_from_primary(self, replica_lag, replica_aliases):
+        self.assertIsNone(get_read_alias(self.get("post")))
+
+    def test_lagging_replica_skipped(self, replica_lag, replica_aliases):
+        replica_lag.return_value = 5
+        self.assertIsNone(get_read_alias(self.get()))
+
+    def test_write_pins_client_to_primary(self, replica_lag, replica_aliases):
+        self.client.force_authenticate(user=self.user)
+        data = {
+            "plate_number": "XYZ123",
+            "brand": self.brand.id,
+            "model": self.model.id,
+            "color": self.color.id,
+        }
+        response = self.client.post(reverse("vehicle-list"), data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        # Without the cookie, as JWT clients, by the user's Redis key.
+        self.assertIsNone(get_read_alias(self.get()))
+
+    def test_failed_write_does_not_pin(self, replica_lag, replica_aliases):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(reverse("vehicle-list"), {}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(get_read_alias(self.get()), "replica1")
+
+
+class ReplicaLagTests(TestCase):
+    def test_primary_has_no_lag(self):
+        with patch.dict(lags, clear=True):
+            self.assertEqual(replica_lag("default"), 0)
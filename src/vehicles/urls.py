@@ -7,8 +7,10 @@ from .views import (
     ColorListView,
     ModelDetailView,
     ModelListView,
+    VehicleBatchView,
     VehicleDetailView,
     VehicleListView,
+    VehiclePlateLookupView,
 )
 
 urlpatterns = [
@@ -20,4 +22,10 @@ urlpatterns = [
     path("colors/<int:pk>/", ColorDetailView.as_view(), name="color-detail"),
     path("vehicles/", VehicleListView.as_view(), name="vehicle-list"),
     path("vehicles/<int:pk>/", VehicleDetailView.as_view(), name="vehicle-detail"),
+    path("vehicles/batch/", VehicleBatchView.as_view(), name="vehicle-batch"),
+    path(
+        "vehicles/lookup/",
+        VehiclePlateLookupView.as_view(),
+        name="vehicle-plate-lookup",
+    ),
 ]
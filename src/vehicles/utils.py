@@ -0,0 +1,19 @@
+import re
+
+# Cyrillic letters that are indistinguishable from Latin ones on a plate.
+# Customers and OCR cameras mix both alphabets freely.
+CYRILLIC_TO_LATIN = str.maketrans("АВЕКМНОРСТУХ", "ABEKMHOPCTYX")
+
+PLATE_SEPARATORS = re.compile(r"[\W_]+")
+
+
+def normalize_plate_number(value):
+    """
+    Canonical form of a plate number used for lookups and uniqueness checks:
+    upper case, Latin look-alikes, no spaces, dashes or other separators.
+
+    >>> normalize_plate_number("01 а-123 вс")
+    '01A123BC'
+    """
+    value = (value or "").upper().translate(CYRILLIC_TO_LATIN)
+    return PLATE_SEPARATORS.sub("", value)
@@ -1,17 +1,28 @@
+from django.contrib.postgres.search import TrigramSimilarity
 from django.db.models import Q
+from django.db.models.functions import Greatest
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
-from rest_framework import generics
+from rest_framework import generics, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from accounts.permissions import HasOwnerRole, IsAdmin
+from config.mixins import ConditionalRetrieveMixin
 
 from .models import Brand, Color, Model, Vehicle
 from .serializers import (
     BrandSerializer,
     ColorSerializer,
     ModelSerializer,
+    ShopPlateLookupSerializer,
+    VehicleBatchSerializer,
+    VehiclePlateLookupSerializer,
     VehicleSerializer,
 )
+from .utils import normalize_plate_number
 
 
 class BrandListView(generics.ListCreateAPIView):
@@ -32,8 +43,7 @@ class BrandListView(generics.ListCreateAPIView):
         responses={200: BrandSerializer(many=True)},
     )
     def get_queryset(self):
-        user = self.request.user
-        return Brand.objects.filter(Q(user=user) | Q(user__isnull=True))
+        return Brand.objects.visible_to(self.request.user)
 
     @swagger_auto_schema(
         operation_description="Create a new brand.",
@@ -58,7 +68,7 @@ class BrandListView(generics.ListCreateAPIView):
         serializer.save(user=self.request.user)
 
 
-class BrandDetailView(generics.RetrieveUpdateDestroyAPIView):
+class BrandDetailView(ConditionalRetrieveMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     get:
     Retrieve details of a specific brand owned by the user.
@@ -99,11 +109,8 @@ class ModelListView(generics.ListCreateAPIView):
         responses={200: ModelSerializer(many=True)},
     )
     def get_queryset(self):
-        user = self.request.user
         brand_id = self.kwargs.get("pk")
-        return Model.objects.filter(
-            Q(user=user) | Q(user__isnull=True), brand_id=brand_id
-        )
+        return Model.objects.filter(brand_id=brand_id).visible_to(self.request.user)
 
     @swagger_auto_schema(
         operation_description="Create a new model for a brand.",
@@ -131,7 +138,7 @@ class ModelListView(generics.ListCreateAPIView):
         serializer.save(user=self.request.user)
 
 
-class ModelDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ModelDetailView(ConditionalRetrieveMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     get:
     Retrieve details of a specific model owned by the user.
@@ -172,8 +179,7 @@ class ColorListView(generics.ListCreateAPIView):
         responses={200: ColorSerializer(many=True)},
     )
     def get_queryset(self):
-        user = self.request.user
-        return Color.objects.filter(Q(user=user) | Q(user__isnull=True))
+        return Color.objects.visible_to(self.request.user)
 
     @swagger_auto_schema(
         operation_description="Create a new color.",
@@ -198,7 +204,7 @@ class ColorListView(generics.ListCreateAPIView):
         serializer.save(user=self.request.user)
 
 
-class ColorDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ColorDetailView(ConditionalRetrieveMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     get:
     Retrieve details of a specific color owned by the user.
@@ -272,7 +278,37 @@ class VehicleListView(generics.ListCreateAPIView):
         serializer.save(user=self.request.user)
 
 
-class VehicleDetailView(generics.RetrieveUpdateDestroyAPIView):
+class VehicleBatchView(generics.GenericAPIView):
+    """
+    post:
+    Create or update up to 1000 brands, models, colors and vehicles each in
+    one request. New items get a temporary ``ref`` that other items use in
+    place of an id. Nothing is saved unless every item is valid.
+    """
+
+    serializer_class = VehicleBatchSerializer
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Create or update brands, models, colors and "
+        "vehicles in one transaction. Brands, models and colors are referred "
+        "to by id or by the ref of an item of the same batch.",
+        request_body=VehicleBatchSerializer,
+        responses={
+            201: VehicleBatchSerializer,
+            400: "Per-item errors, in payload order",
+        },
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class VehicleDetailView(
+    ConditionalRetrieveMixin, generics.RetrieveUpdateDestroyAPIView
+):
     """
     get:
     Retrieve details of a specific vehicle owned by the user.
@@ -295,3 +331,71 @@ class VehicleDetailView(generics.RetrieveUpdateDestroyAPIView):
         return Vehicle.objects.filter(user=self.request.user).select_related(
             "brand", "model", "color"
         )
+
+    def get_last_modified_expression(self):
+        # The payload embeds brand, model and color names.
+        return Greatest(
+            "updated_at",
+            "brand__updated_at",
+            "model__updated_at",
+            "color__updated_at",
+        )
+
+
+class VehiclePlateLookupView(generics.ListAPIView):
+    """
+    get:
+    Find the vehicles, and their owners, matching a partial or OCR-noisy plate
+    number. Intended for shop staff at drive-through pickup. Any customer's
+    vehicle can match, so only admins see the owner's phone number.
+    """
+
+    serializer_class = VehiclePlateLookupSerializer
+    permission_classes = [IsAuthenticated, HasOwnerRole | IsAdmin]
+    max_results = 10
+    min_query_length = 3
+
+    @swagger_auto_schema(
+        operation_description="Look up vehicles by a partial or noisy plate number, "
+        "best matches first.",
+        manual_parameters=[
+            openapi.Parameter(
+                "plate",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="Full or partial plate number, in any case or alphabet",
+                required=True,
+            ),
+        ],
+        responses={200: VehiclePlateLookupSerializer(many=True)},
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_serializer_class(self):
+        # The schema is generated for an anonymous user.
+        if getattr(self.request.user, "role", None) == "admin":
+            return VehiclePlateLookupSerializer
+        return ShopPlateLookupSerializer
+
+    def get_queryset(self):
+        plate = normalize_plate_number(self.request.query_params.get("plate"))
+        if len(plate) < self.min_query_length:
+            raise ValidationError(
+                {
+                    "plate": f"Provide at least {self.min_query_length} "
+                    "letters or digits."
+                }
+            )
+
+        # Both conditions are answered by the trigram GIN index: similarity
+        # catches misread characters, containment catches partial plates.
+        return (
+            Vehicle.objects.filter(
+                Q(normalized_plate_number__trigram_similar=plate)
+                | Q(normalized_plate_number__contains=plate)
+            )
+            .annotate(similarity=TrigramSimilarity("normalized_plate_number", plate))
+            .select_related("brand", "model", "color", "user")
+            .order_by("-similarity", "id")[: self.max_results]
+        )